@@ -11,6 +11,16 @@ mkdir -p models/deepfake/ela_models
 echo "กำลังดาวน์โหลดโมเดล Face Detection..."
 wget -q -O models/face-detection/scrfd_10g_bnkps.onnx https://github.com/deepinsight/insightface/raw/master/detection/scrfd/onnx/scrfd_10g_bnkps.onnx
 
+# ดาวน์โหลดโมเดลเพศและอายุ (genderage.onnx จากชุด buffalo_l ของ InsightFace) สำหรับ include_attributes ของ face-detection
+echo "กำลังดาวน์โหลดโมเดลเพศและอายุ..."
+wget -q -O tmp-buffalo_l.zip https://github.com/deepinsight/insightface/releases/download/v0.7/buffalo_l.zip
+if unzip -o -j -q tmp-buffalo_l.zip genderage.onnx -d models/face-detection && [ -s models/face-detection/genderage.onnx ]; then
+  echo "ดาวน์โหลดโมเดลเพศและอายุสำเร็จ"
+else
+  echo "ดาวน์โหลดโมเดลเพศและอายุไม่สำเร็จ (face-detection จะรายงาน attributes: unavailable ใน /health)"
+fi
+rm -f tmp-buffalo_l.zip
+
 # ดาวน์โหลดโมเดล Liveness Detection
 echo "กำลังดาวน์โหลดโมเดล Liveness Detection..."
 git clone https://github.com/minivision-ai/Silent-Face-Anti-Spoofing.git tmp-liveness
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+# โมเดลรู้จำใบหน้าที่ต้องการทำเวอร์ชัน INT8 / FP16 (ชื่อเดียวกับ MODELS ใน services/face-recognition/app.py)
+MODEL_DIR = "models/face-recognition"
+MODEL_FILES = {
+    "arcface": "arcface_r100.onnx",
+    "adaface": "adaface_ir101_webface12m.onnx",
+    "elasticface": "elasticface.onnx"
+}
+INPUT_SIZE = (112, 112)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def variant_path(path, precision):
+    """ชื่อไฟล์ของแต่ละ precision เช่น arcface_r100.onnx -> arcface_r100_int8.onnx"""
+    if precision == "fp32":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{precision}{ext}"
+
+
+# เตรียมรูปภาพแบบเดียวกับ preprocess_face ใน face-recognition service
+def preprocess_face(face_img, target_size=INPUT_SIZE):
+    if face_img.shape[0] != target_size[0] or face_img.shape[1] != target_size[1]:
+        face_img = cv2.resize(face_img, target_size)
+    face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
+    face_img = face_img.astype(np.float32) / 255.0
+    face_img = (face_img - 0.5) / 0.5
+    face_img = np.transpose(face_img, (2, 0, 1))
+    return np.expand_dims(face_img, axis=0)
+
+
+def load_face_batch(image_dir, limit):
+    """โหลดรูปใบหน้าจากโฟลเดอร์ ถ้าไม่มีจะใช้ภาพสุ่ม (ใช้วัด latency ได้ แต่ค่า drift ไม่สะท้อนของจริง)"""
+    images = []
+    if image_dir and os.path.isdir(image_dir):
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(image_dir, name))
+                if img is not None:
+                    images.append(preprocess_face(img))
+            if len(images) >= limit:
+                break
+
+    if not images:
+        print("⚠️ ไม่พบรูปใบหน้าสำหรับทดสอบ ใช้ภาพสุ่มแทน")
+        rng = np.random.default_rng(0)
+        images = [preprocess_face((rng.random((*INPUT_SIZE, 3)) * 255).astype(np.uint8)) for _ in range(limit)]
+
+    return np.concatenate(images, axis=0)
+
+
+class FaceCalibrationReader(CalibrationDataReader):
+    """ป้อนรูปใบหน้าทีละภาพให้ quantize_static ใช้หา scale/zero-point"""
+
+    def __init__(self, input_name, batch):
+        self.input_name = input_name
+        self.batch = batch
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= self.batch.shape[0]:
+            return None
+        item = {self.input_name: self.batch[self.index:self.index + 1]}
+        self.index += 1
+        return item
+
+    def rewind(self):
+        self.index = 0
+
+
+def build_int8(model_path, output_path, method, calibration_batch):
+    if method == "static":
+        input_name = onnx.load(model_path, load_external_data=False).graph.input[0].name
+        quantize_static(
+            model_path,
+            output_path,
+            FaceCalibrationReader(input_name, calibration_batch),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8
+        )
+    else:
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+
+
+def build_fp16(model_path, output_path):
+    try:
+        from onnxconverter_common import float16
+    except ImportError:
+        print("⚠️ ไม่พบแพ็กเกจ onnxconverter-common ข้ามการสร้าง FP16")
+        return False
+
+    model = onnx.load(model_path)
+    # คง input/output เป็น float32 เพื่อให้ service ไม่ต้องแก้โค้ด preprocess
+    model_fp16 = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model_fp16, output_path)
+    return True
+
+
+def embed(session, batch):
+    input_name = session.get_inputs()[0].name
+    batch_dim = session.get_inputs()[0].shape[0]
+    if isinstance(batch_dim, int) and batch_dim == 1:
+        outputs = [session.run(None, {input_name: batch[i:i + 1]})[0] for i in range(batch.shape[0])]
+        embedding = np.concatenate(outputs, axis=0)
+    else:
+        embedding = session.run(None, {input_name: batch})[0]
+    return embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+
+
+def measure_latency(session, batch, runs):
+    input_name = session.get_inputs()[0].name
+    sample = batch[:1]
+    session.run(None, {input_name: sample})  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, {input_name: sample})
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def evaluate(model_name, paths, eval_batch, providers, runs):
+    """เทียบ embedding ของแต่ละ precision กับ FP32 และวัด latency ต่อภาพ"""
+    sessions = {}
+    for precision, path in paths.items():
+        try:
+            sessions[precision] = ort.InferenceSession(path, providers=providers)
+        except Exception as e:
+            print(f"❌ ไม่สามารถโหลด {model_name} ({precision}): {str(e)}")
+
+    if "fp32" not in sessions:
+        return {}
+
+    reference = embed(sessions["fp32"], eval_batch)
+    report = {}
+    for precision, session in sessions.items():
+        embedding = embed(session, eval_batch)
+        cosine = np.sum(reference * embedding, axis=1)
+        latency_p50, latency_p95 = measure_latency(session, eval_batch, runs)
+        report[precision] = {
+            "path": paths[precision],
+            "size_mb": os.path.getsize(paths[precision]) / (1024 * 1024),
+            "cosine_drift_mean": float(np.mean(1.0 - cosine)),
+            "cosine_drift_max": float(np.max(1.0 - cosine)),
+            "latency_p50_ms": latency_p50,
+            "latency_p95_ms": latency_p95
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="สร้างโมเดลรู้จำใบหน้าแบบ INT8/FP16 และวัด drift/latency เทียบกับ FP32")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--models", default=",".join(MODEL_FILES), help="รายชื่อโมเดลคั่นด้วย ,")
+    parser.add_argument("--precisions", default="int8,fp16", help="precision ที่ต้องการสร้าง (int8,fp16)")
+    parser.add_argument("--int8-method", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument("--calibration-dir", help="โฟลเดอร์รูปใบหน้าสำหรับ calibration และวัด drift")
+    parser.add_argument("--num-images", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=20, help="จำนวนรอบในการวัด latency")
+    parser.add_argument("--cpu-only", action="store_true", help="วัด latency บน CPU เท่านั้น")
+    parser.add_argument("--skip-build", action="store_true", help="วัดผลจากไฟล์ที่มีอยู่แล้วโดยไม่สร้างใหม่")
+    parser.add_argument("--report", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+
+    precisions = [p.strip() for p in args.precisions.split(",") if p.strip()]
+    providers = ['CPUExecutionProvider'] if args.cpu_only else ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    face_batch = load_face_batch(args.calibration_dir, args.num_images)
+
+    full_report = {}
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        model_path = os.path.join(args.model_dir, MODEL_FILES[model_name])
+        if not os.path.exists(model_path):
+            print(f"⚠️ ไม่พบไฟล์โมเดล {model_name} ที่ {model_path}")
+            continue
+
+        print(f"📂 {model_name}: {model_path}")
+        paths = {"fp32": model_path}
+        for precision in precisions:
+            output_path = variant_path(model_path, precision)
+            if not args.skip_build:
+                try:
+                    if precision == "int8":
+                        build_int8(model_path, output_path, args.int8_method, face_batch)
+                    elif precision == "fp16":
+                        if not build_fp16(model_path, output_path):
+                            continue
+                    else:
+                        print(f"⚠️ ไม่รู้จัก precision {precision}")
+                        continue
+                    print(f"✅ สร้าง {precision} สำเร็จ: {output_path}")
+                except Exception as e:
+                    print(f"❌ สร้าง {precision} ไม่สำเร็จ: {str(e)}")
+                    continue
+            if os.path.exists(output_path):
+                paths[precision] = output_path
+
+        report = evaluate(model_name, paths, face_batch, providers, args.runs)
+        for precision, row in report.items():
+            print(f"📊 {model_name:12s} {precision:5s} size={row['size_mb']:8.1f} MB  "
+                  f"drift(mean/max)={row['cosine_drift_mean']:.5f}/{row['cosine_drift_max']:.5f}  "
+                  f"latency(p50/p95)={row['latency_p50_ms']:.1f}/{row['latency_p95_ms']:.1f} ms")
+        full_report[model_name] = report
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(full_report, f, indent=2)
+        print(f"💾 บันทึกผลที่ {args.report}")
+
+
+if __name__ == "__main__":
+    main()
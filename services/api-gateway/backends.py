@@ -0,0 +1,448 @@
+import asyncio
+import datetime
+import os
+import time
+
+import httpx
+
+from metrics import (
+    BACKEND_CIRCUIT_OPEN, BACKEND_IN_FLIGHT, BACKEND_LATENCY, BACKEND_QUEUE_DEPTH, BACKEND_REJECTIONS, BACKEND_UP,
+    request_id_var
+)
+
+# ค่าเริ่มต้นของแต่ละ backend (ปรับได้ด้วยตัวแปรสภาพแวดล้อมที่ขึ้นต้นด้วยชื่อ backend เช่น DEEPFAKE_MAX_IN_FLIGHT)
+# max_queue คือจำนวนคำขอที่รอ slot ได้สูงสุด เกินจากนี้จะถูกปฏิเสธทันที
+BACKEND_DEFAULTS = {
+    "face-detection": {"url": "http://face-detection:5000", "read_timeout_s": 30.0, "max_in_flight": 32, "max_queue": 64},
+    "face-recognition": {"url": "http://face-recognition:5001", "read_timeout_s": 30.0, "max_in_flight": 32, "max_queue": 64},
+    "liveness": {"url": "http://liveness:5002", "read_timeout_s": 10.0, "max_in_flight": 32, "max_queue": 64},
+    "deepfake": {"url": "http://deepfake:5003", "read_timeout_s": 30.0, "max_in_flight": 8, "max_queue": 16}
+}
+
+
+def _env(name, key, default, cast=float):
+    return cast(os.environ.get(f"{name.upper().replace('-', '_')}_{key}", default))
+
+
+class BackendUnavailable(Exception):
+    """backend ไม่รับคำขอ: ตรวจสุขภาพไม่ผ่าน (down), circuit เปิดอยู่ (circuit_open),
+    คิวเต็ม (queue_full) หรือรอ slot นานเกินไป (queue_timeout)"""
+
+    def __init__(self, backend, reason, retry_after):
+        super().__init__(f"Backend {backend} unavailable: {reason}")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """circuit breaker แบบ closed -> open -> half_open
+
+    เมื่อล้มเหลวติดกันครบ failure_threshold ครั้ง circuit จะเปิดและปฏิเสธคำขอทันทีเป็นเวลา reset_timeout_s วินาที
+    จากนั้นปล่อยคำขอทดลองทีละหนึ่ง ถ้าสำเร็จจึงปิด circuit ถ้าล้มเหลวจะเปิดใหม่
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout_s=10.0):
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout_s = float(reset_timeout_s)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial_in_flight = False
+
+    def retry_after(self):
+        return max(0.0, self.reset_timeout_s - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if self.retry_after() > 0:
+                return False
+            self.state = "half_open"
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        # ความล้มเหลวของคำขอที่ถูกรับไว้ก่อน circuit เปิดไม่ต่อเวลาเปิด (เปลี่ยนสถานะเฉพาะ closed/half_open -> open)
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def abort(self):
+        # คำขอถูกยกเลิกโดยฝั่งผู้เรียก (ไม่ใช่ความผิดของ backend) ให้คำขอถัดไปทดลองแทน
+        self._trial_in_flight = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opens": self.opens,
+            "retry_after_s": self.retry_after() if self.state == "open" else 0.0
+        }
+
+
+class Backend:
+    """HTTP client ของ backend หนึ่งตัว แยก connection pool, timeout และจำนวนคำขอพร้อมกันสูงสุดจาก backend อื่น
+
+    backend ที่ช้าจึงใช้ได้แค่ connection และ slot ของตัวเอง ไม่ทำให้ backend อื่นต้องรอ
+    คำขอที่เกินคิว รอ slot นานเกิน queue_timeout_s หรือมาถึงขณะ circuit เปิด จะได้ BackendUnavailable ทันที
+    """
+
+    def __init__(self, name, url, read_timeout_s=30.0, max_in_flight=32, max_connections=None,
+                 max_keepalive=None, keepalive_expiry_s=30.0, connect_timeout_s=2.0, pool_timeout_s=5.0,
+                 max_queue=64, queue_timeout_s=5.0, failure_threshold=5, reset_timeout_s=10.0, down_after=2):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.max_in_flight = int(max_in_flight)
+        self.max_queue = int(max_queue)
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout_s)
+
+        # ผลตรวจสุขภาพล่าสุดจาก HealthMonitor (None = ยังไม่เคยตรวจ)
+        self.health = None
+        self.failed_probes = 0
+        self.down_after = int(down_after)
+
+        BACKEND_IN_FLIGHT.labels(name).set_function(lambda: self.in_flight)
+        BACKEND_QUEUE_DEPTH.labels(name).set_function(lambda: self.waiting)
+        BACKEND_CIRCUIT_OPEN.labels(name).set_function(lambda: self.breaker.state != "closed")
+        BACKEND_UP.labels(name).set_function(lambda: not self.is_down)
+        self.max_connections = int(max_connections or max_in_flight)
+        self.max_keepalive = int(max_keepalive or self.max_connections)
+        self.timeout = httpx.Timeout(read_timeout_s, connect=connect_timeout_s, pool=pool_timeout_s)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=keepalive_expiry_s
+            ),
+            timeout=self.timeout
+        )
+        # client แยกสำหรับตรวจสุขภาพ ถ้าใช้ pool เดียวกับคำขอจริง probe ต้องรอ connection ตอน backend ยุ่ง
+        # แล้วล้มเหลวด้วย PoolTimeout จน backend ที่ยังทำงานปกติถูกมองว่า down
+        self.probe_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1, keepalive_expiry=keepalive_expiry_s),
+            timeout=httpx.Timeout(read_timeout_s, connect=connect_timeout_s)
+        )
+
+        # สร้าง semaphore เมื่อใช้ครั้งแรกภายใน event loop ที่รันอยู่
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats_counters = {
+            "requests": 0, "errors": 0, "timeouts": 0, "pool_timeouts": 0,
+            "rejected_down": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0, "rejected_circuit_open": 0
+        }
+        self.wait_time_ms_total = 0.0
+        self.max_wait_ms = 0.0
+
+    @classmethod
+    def from_env(cls, name, defaults):
+        return cls(
+            name,
+            os.environ.get(f"{name.upper().replace('-', '_')}_URL", defaults["url"]),
+            read_timeout_s=_env(name, "READ_TIMEOUT_S", defaults["read_timeout_s"]),
+            max_in_flight=_env(name, "MAX_IN_FLIGHT", defaults["max_in_flight"], int),
+            max_connections=_env(name, "MAX_CONNECTIONS", defaults["max_in_flight"], int),
+            max_keepalive=_env(name, "MAX_KEEPALIVE", defaults["max_in_flight"], int),
+            keepalive_expiry_s=_env(name, "KEEPALIVE_EXPIRY_S", 30.0),
+            connect_timeout_s=_env(name, "CONNECT_TIMEOUT_S", 2.0),
+            pool_timeout_s=_env(name, "POOL_TIMEOUT_S", 5.0),
+            max_queue=_env(name, "MAX_QUEUE", defaults["max_queue"], int),
+            queue_timeout_s=_env(name, "QUEUE_TIMEOUT_S", 5.0),
+            failure_threshold=_env(name, "FAILURE_THRESHOLD", 5, int),
+            reset_timeout_s=_env(name, "CIRCUIT_RESET_S", 10.0),
+            down_after=_env(name, "DOWN_AFTER", 2, int)
+        )
+
+    @property
+    def is_down(self):
+        """ตรวจสุขภาพไม่ผ่านติดกันครบ down_after ครั้ง"""
+        return self.failed_probes >= self.down_after
+
+    def _reject(self, reason, retry_after):
+        self.stats_counters[f"rejected_{reason}"] += 1
+        BACKEND_REJECTIONS.labels(self.name, reason).inc()
+        raise BackendUnavailable(self.name, reason, retry_after)
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        # ตรวจคิวก่อน circuit เพื่อไม่ให้คำขอทดลองของ half_open ถูกใช้ไปกับคำขอที่จะถูกปฏิเสธอยู่ดี
+        if self.is_down:
+            self._reject("down", 1.0)
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self._reject("queue_full", 1.0)
+        if not self.breaker.allow():
+            self._reject("circuit_open", self.breaker.retry_after())
+
+        started_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            if self._semaphore.locked():
+                await self._wait_for_slot()
+            else:
+                # มี slot ว่าง: ได้ slot ทันทีโดยไม่ต้องรอ (คำขอที่ตามมาจึงเห็นจำนวน slot ที่ถูกต้อง)
+                await self._semaphore.acquire()
+        except BaseException:
+            self.breaker.abort()
+            raise
+        finally:
+            self.waiting -= 1
+        waited_ms = (time.perf_counter() - started_at) * 1000.0
+        self.wait_time_ms_total += waited_ms
+        self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+        self.in_flight += 1
+
+    async def _wait_for_slot(self):
+        # ไม่ใช้ asyncio.wait_for เพราะถ้าได้ slot พร้อมกับที่หมดเวลา slot นั้นจะหายไปถาวร
+        task = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait({task}, timeout=self.queue_timeout_s)
+        except BaseException:
+            self._abandon(task)
+            raise
+        if not task.done():
+            self._abandon(task)
+            self._reject("queue_timeout", 1.0)
+
+    def _abandon(self, task):
+        if task.done() and not task.cancelled():
+            self._semaphore.release()
+        else:
+            task.cancel()
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _count_error(self, error, started_at):
+        if isinstance(error, asyncio.CancelledError):
+            self.breaker.abort()
+            BACKEND_LATENCY.labels(self.name, "cancelled").observe(time.perf_counter() - started_at)
+            return
+        self.stats_counters["errors"] += 1
+        self.breaker.record_failure()
+        outcome = "error"
+        if isinstance(error, httpx.PoolTimeout):
+            self.stats_counters["pool_timeouts"] += 1
+            outcome = "timeout"
+        elif isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+            self.stats_counters["timeouts"] += 1
+            outcome = "timeout"
+        BACKEND_LATENCY.labels(self.name, outcome).observe(time.perf_counter() - started_at)
+
+    def _record_response(self, response, started_at):
+        BACKEND_LATENCY.labels(self.name, f"{response.status_code // 100}xx").observe(time.perf_counter() - started_at)
+        # 5xx นับเป็นความล้มเหลวของ backend ส่วน 4xx เป็นปัญหาของคำขอ
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _with_request_id(self, kwargs):
+        # ส่ง request ID ของคำขอที่ gateway กำลังทำงานต่อไปยัง backend
+        request_id = request_id_var.get()
+        if request_id:
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"X-Request-ID": request_id})
+        return kwargs
+
+    async def _send(self, call, timeout):
+        # timeout ที่เป็นตัวเลขใช้เป็นเวลารวมสูงสุดของคำขอด้วย ไม่ใช่แค่ต่อการอ่านแต่ละครั้งแบบ httpx
+        if isinstance(timeout, (int, float)):
+            return await asyncio.wait_for(call, timeout)
+        return await call
+
+    async def request(self, method, path, **kwargs):
+        """ส่งคำขอแล้วอ่าน response ทั้งหมด (ถือ slot ไว้จนได้คำตอบ)
+
+        timeout ที่เป็นตัวเลขใช้เป็นเวลารวมสูงสุดของคำขอด้วย ไม่ใช่แค่ต่อการอ่านแต่ละครั้งแบบ httpx
+        """
+        kwargs = self._with_request_id(kwargs)
+        await self.acquire()
+        self.stats_counters["requests"] += 1
+        started_at = time.perf_counter()
+        try:
+            response = await self._send(self.client.request(method, self.url + path, **kwargs), kwargs.get("timeout"))
+        except BaseException as e:
+            self._count_error(e, started_at)
+            raise
+        finally:
+            self.release()
+        self._record_response(response, started_at)
+        return response
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def stream(self, method, path, **kwargs):
+        """ส่งคำขอแบบ stream คืนค่า (response, close) โดย slot จะถูกคืนเมื่อเรียก close (เรียกซ้ำได้)
+
+        timeout ที่เป็นตัวเลขใช้เป็นเวลาสูงสุดจนได้ header ของ response เช่นเดียวกับ request
+        """
+        kwargs = self._with_request_id(kwargs)
+        await self.acquire()
+        self.stats_counters["requests"] += 1
+        started_at = time.perf_counter()
+        try:
+            request = self.client.build_request(method, self.url + path, **kwargs)
+            response = await self._send(self.client.send(request, stream=True), kwargs.get("timeout"))
+        except BaseException as e:
+            self._count_error(e, started_at)
+            self.release()
+            raise
+        self._record_response(response, started_at)
+
+        closed = False
+
+        async def close():
+            nonlocal closed
+            if closed:
+                return
+            closed = True
+            try:
+                await response.aclose()
+            finally:
+                self.release()
+
+        return response, close
+
+    async def probe(self, timeout_s=3.0):
+        """เรียก /health โดยตรง (ไม่ผ่านคิวและ circuit breaker) แล้วเก็บผลไว้ใน self.health
+
+        probe ที่ timeout ขณะมีคำขอกำลังทำงานอยู่ (worker ของ backend อาจยุ่งทั้งหมด) จะได้สถานะ "busy"
+        และไม่นับเป็นการตรวจไม่ผ่าน backend ที่ค้างจริงจะถูกตัดโดย circuit breaker จากคำขอที่ล้มเหลวแทน
+        """
+        started_at = time.perf_counter()
+        try:
+            response = await self.probe_client.get(self.url + "/health", timeout=timeout_s)
+            if response.status_code == 200:
+                try:
+                    service_data = response.json()
+                except ValueError:
+                    service_data = {}
+                health = {
+                    "status": "online",
+                    "models": service_data.get("models", []),
+                    "version": service_data.get("version", "unknown")
+                }
+            else:
+                health = {"status": "error", "message": f"Status code: {response.status_code}"}
+        except httpx.TimeoutException as e:
+            status = "busy" if self.in_flight > 0 else "offline"
+            health = {"status": status, "message": str(e) or type(e).__name__}
+        except Exception as e:
+            health = {"status": "offline", "message": str(e) or type(e).__name__}
+
+        health["latency_ms"] = (time.perf_counter() - started_at) * 1000.0
+        health["checked_at"] = datetime.datetime.now().isoformat()
+        if health["status"] == "online":
+            self.failed_probes = 0
+        elif health["status"] != "busy":
+            self.failed_probes += 1
+        health["available"] = not self.is_down
+        self.health = health
+        return health
+
+    def _pool_stats(self):
+        # httpx ไม่มี API สาธารณะสำหรับสถานะ pool จึงอ่านจาก connection pool ของ transport ถ้ามี
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return {"connections": None, "idle_connections": None}
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle())
+        }
+
+    def stats(self):
+        requests = self.stats_counters["requests"]
+        return dict(
+            self.stats_counters,
+            url=self.url,
+            in_flight=self.in_flight,
+            waiting=self.waiting,
+            max_in_flight=self.max_in_flight,
+            max_queue=self.max_queue,
+            saturation=self.in_flight / self.max_in_flight,
+            max_connections=self.max_connections,
+            max_keepalive=self.max_keepalive,
+            avg_wait_ms=self.wait_time_ms_total / requests if requests else 0.0,
+            max_wait_ms=self.max_wait_ms,
+            circuit=self.breaker.stats(),
+            down=self.is_down,
+            **self._pool_stats()
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+        await self.probe_client.aclose()
+
+
+def create_backends():
+    return {name: Backend.from_env(name, defaults) for name, defaults in BACKEND_DEFAULTS.items()}
+
+
+class HealthMonitor:
+    """ตรวจสุขภาพทุก backend พร้อมกันทุก interval_s วินาทีใน task เบื้องหลัง
+
+    /api/v1/status อ่านผลล่าสุดได้ทันที และ backend ที่ตรวจไม่ผ่านติดกันจะถูกข้ามใน Backend.acquire
+    """
+
+    def __init__(self, backends, interval_s=5.0, timeout_s=3.0):
+        self.backends = backends
+        self.interval_s = float(interval_s)
+        self.timeout_s = float(timeout_s)
+        self.last_checked = None
+        self._task = None
+
+    @classmethod
+    def from_env(cls, backends):
+        return cls(
+            backends,
+            interval_s=float(os.environ.get("HEALTH_CHECK_INTERVAL_S", "5")),
+            timeout_s=float(os.environ.get("HEALTH_CHECK_TIMEOUT_S", "3"))
+        )
+
+    async def probe_all(self):
+        await asyncio.gather(*(backend.probe(self.timeout_s) for backend in self.backends.values()))
+        self.last_checked = datetime.datetime.now().isoformat()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                print(f"Health check failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self):
+        return {name: backend.health for name, backend in self.backends.items()}
@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import time
+
+# ผลลัพธ์ที่เก็บใน cache (body เป็นไบต์ของ JSON ที่จะส่งกลับตามเดิม)
+# cacheable = False สำหรับผลที่มี error เช่น backend timeout ซึ่งไม่ควรถูกเก็บ
+CachedResponse = collections.namedtuple("CachedResponse", "body status_code media_type cacheable")
+
+
+def cache_key(endpoint, images, params=None):
+    """key จาก SHA-256 ของไบต์ภาพทุกภาพ (ตามลำดับ) รวมกับ endpoint และพารามิเตอร์ที่มีผลต่อผลลัพธ์"""
+    digest = hashlib.sha256()
+    digest.update(endpoint.encode())
+    digest.update(json.dumps(params or {}, sort_keys=True).encode())
+    for content in images:
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """cache ผลลัพธ์ของ gateway แบบ content-addressed มี TTL และจำกัดทั้งจำนวนรายการและขนาดรวม (ลบแบบ LRU)
+
+    คำขอที่ key เดียวกันเข้ามาพร้อมกันจะรอผลจากการเรียก backend ครั้งเดียว (request coalescing)
+    """
+
+    def __init__(self, ttl_s=300.0, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.ttl_s = float(ttl_s)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.enabled = self.ttl_s > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self.size_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "evictions": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_s=float(os.environ.get("GATEWAY_CACHE_TTL_S", "300")),
+            max_entries=int(os.environ.get("GATEWAY_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.environ.get("GATEWAY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        )
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, cached = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return cached
+
+    def _remove(self, key):
+        _, cached = self._entries.pop(key)
+        self.size_bytes -= len(cached.body)
+
+    def _store(self, key, cached):
+        if not cached.cacheable or len(cached.body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_s, cached)
+        self.size_bytes += len(cached.body)
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _finish(self, key, task):
+        self._pending.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+    async def get_or_compute(self, key, compute):
+        """คืนค่า (CachedResponse, สถานะ) โดยสถานะเป็น HIT, MISS, COALESCED หรือ BYPASS (cache ปิดอยู่)
+
+        compute คือ coroutine function ที่เรียก backend ซึ่งรันเป็น task แยก
+        คำขอแรกที่ถูกยกเลิกจึงไม่ทำให้คำขออื่นที่รอผลเดียวกันล้มเหลว
+        """
+        if not self.enabled:
+            self.counters["bypassed"] += 1
+            return await compute(), "BYPASS"
+
+        cached = self._lookup(key)
+        if cached is not None:
+            self.counters["hits"] += 1
+            return cached, "HIT"
+
+        task = self._pending.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(task), "COALESCED"
+
+        self.counters["misses"] += 1
+        task = asyncio.ensure_future(compute())
+        self._pending[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), "MISS"
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return dict(
+            self.counters,
+            enabled=self.enabled,
+            entries=len(self._entries),
+            max_entries=self.max_entries,
+            size_bytes=self.size_bytes,
+            max_bytes=self.max_bytes,
+            ttl_s=self.ttl_s,
+            pending=len(self._pending),
+            hit_rate=(self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0
+        )
@@ -1,10 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import httpx
+import asyncio
 import base64
-from typing import Optional
+import os
+import time
+from typing import List, Optional
+from urllib.parse import quote
+from backends import BackendUnavailable, HealthMonitor, create_backends
+from cache import CachedResponse, ResultCache, cache_key
+from metrics import (
+    CACHE_BYTES, CACHE_LOOKUPS, IN_FLIGHT, REQUEST_LATENCY, REQUESTS, SERVICE_NAME, STREAM_FRAMES,
+    endpoint_label, metrics_response, request_id_var
+)
 import json
 import datetime
+import math
+import uuid
 
 app = FastAPI(title="FaceSocial API Gateway")
 
@@ -14,10 +27,150 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "X-Request-ID"],
 )
 
-# สร้าง HTTP client
-client = httpx.AsyncClient()
+@app.middleware("http")
+async def request_metrics(request, call_next):
+    # request ID ของคำขอ (รับจาก client ถ้ามี) ถูกส่งต่อไปยังทุก backend และส่งกลับใน header
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    endpoint = endpoint_label(request)
+    IN_FLIGHT.labels(SERVICE_NAME, endpoint).inc()
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        IN_FLIGHT.labels(SERVICE_NAME, endpoint).dec()
+        REQUESTS.labels(SERVICE_NAME, endpoint, request.method, str(status)).inc()
+        REQUEST_LATENCY.labels(SERVICE_NAME, endpoint).observe(time.perf_counter() - started_at)
+        request_id_var.reset(token)
+    
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# HTTP client แยกตาม backend (connection pool, timeout และจำนวนคำขอพร้อมกันของแต่ละ service)
+backends = create_backends()
+
+# ตรวจสุขภาพ backend เป็นระยะในเบื้องหลัง (/api/v1/status อ่านผลล่าสุด)
+health_monitor = HealthMonitor.from_env(backends)
+
+# cache ผลลัพธ์ตาม hash ของภาพ + endpoint + พารามิเตอร์ (สถานะส่งกลับใน header X-Cache)
+result_cache = ResultCache.from_env()
+CACHE_BYTES.set_function(lambda: result_cache.size_bytes)
+
+# คิวเต็มหรือรอ slot นานเกินเป็นการตัดโหลด (429) ส่วน backend down หรือ circuit เปิดเป็นบริการไม่พร้อม (503)
+LOAD_SHEDDING_REASONS = ("queue_full", "queue_timeout")
+
+@app.exception_handler(BackendUnavailable)
+async def backend_unavailable_handler(request, e):
+    # ปฏิเสธทันทีเมื่อ backend รับงานไม่ไหวหรือ circuit เปิดอยู่ แทนการรอจน timeout
+    return JSONResponse(
+        status_code=429 if e.reason in LOAD_SHEDDING_REASONS else 503,
+        content={"error": str(e), "backend": e.backend, "reason": e.reason},
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
+# ส่งภาพไปยัง backend แบบ binary แทน base64 ใน JSON
+def binary_payload(content, params=None):
+    """ภาพเดียว: ส่งไบต์ของภาพเป็น body และพารามิเตอร์เป็น JSON ใน header X-Params"""
+    return {
+        "content": content,
+        "headers": {"Content-Type": "application/octet-stream", "X-Params": json.dumps(params or {})}
+    }
+
+def multipart_payload(files, params=None):
+    """หลายภาพ: ส่งเป็น multipart โดย files คือรายการ (ชื่อ field, ไบต์ของภาพ) และพารามิเตอร์อยู่ใน field "params" """
+    return {
+        "files": [(field, (f"{field}_{index}", content, "application/octet-stream")) for index, (field, content) in enumerate(files)],
+        "data": {"params": json.dumps(params or {})}
+    }
+
+async def proxy_backend(backend_name, path, payload, timeout=None, method="POST"):
+    """ส่งคำขอไปยัง backend แล้วส่ง response JSON กลับแบบ stream โดยไม่ parse และ serialize ซ้ำ"""
+    if timeout is not None:
+        payload = dict(payload, timeout=timeout)
+    try:
+        response, close = await backends[backend_name].stream(method, path, **payload)
+    except BackendUnavailable:
+        raise
+    except Exception as e:
+        return {"error": f"Request failed: {str(e)}"}
+    
+    content_type = response.headers.get("content-type", "")
+    if not content_type.startswith("application/json"):
+        body = await response.aread()
+        await close()
+        return {"error": f"Non-JSON response: {content_type}", "raw_content": body[:100].decode("utf-8", errors="replace")}
+    
+    return StreamingResponse(
+        stream_body(response, close),
+        status_code=response.status_code,
+        media_type=content_type
+    )
+
+async def stream_body(response, close):
+    """ส่งต่อ body ของ backend แล้วคืน slot และ connection เสมอ แม้ backend ล้มเหลวกลางคันหรือ client ตัดการเชื่อมต่อ
+    (StreamingResponse ไม่เรียก background task เมื่อการส่ง body ล้มเหลว)"""
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await close()
+
+def json_result(result, cacheable=True):
+    return CachedResponse(json.dumps(result).encode(), 200, "application/json", cacheable)
+
+async def fetch_backend(backend_name, path, payload, timeout=None):
+    """ส่งคำขอไปยัง backend แล้วอ่าน response ทั้งหมดเป็น CachedResponse (เก็บใน cache ได้เฉพาะ status 200)"""
+    if timeout is not None:
+        payload = dict(payload, timeout=timeout)
+    try:
+        response = await backends[backend_name].post(path, **payload)
+    except BackendUnavailable:
+        raise
+    except Exception as e:
+        return json_result({"error": f"Request failed: {str(e)}"}, cacheable=False)
+    
+    content_type = response.headers.get("content-type", "")
+    if not content_type.startswith("application/json"):
+        return json_result({"error": f"Non-JSON response: {content_type}", "raw_content": response.text[:100]}, cacheable=False)
+    return CachedResponse(response.content, response.status_code, content_type, response.status_code == 200)
+
+# ฟิลด์เวลาที่ backend/gateway ใช้ในผลลัพธ์ (ค่าเหล่านี้ของผลใน cache เป็นของคำขอที่คำนวณครั้งแรก)
+TIMING_FIELDS = ("timings_ms", "processing_time")
+
+def restamp_cached_body(body, elapsed_s):
+    """ผลที่มาจาก cache: ย้ายเวลาเดิมไปไว้ใต้ "cached_timings" แล้วใส่เวลาที่คำขอนี้ใช้จริงแทน"""
+    result = json.loads(body)
+    if not isinstance(result, dict) or not any(field in result for field in TIMING_FIELDS):
+        return body
+    
+    result["cached_timings"] = {field: result[field] for field in TIMING_FIELDS if field in result}
+    if "timings_ms" in result:
+        result["timings_ms"] = {"total": elapsed_s * 1000.0}
+    if "processing_time" in result:
+        result["processing_time"] = elapsed_s
+    return json.dumps(result).encode()
+
+async def cached_response(endpoint, images, params, compute):
+    """คืนผลจาก cache ถ้ามี ไม่เช่นนั้นเรียก compute (คำขอที่เหมือนกันพร้อมกันใช้ผลจากการเรียกครั้งเดียว)"""
+    started_at = time.perf_counter()
+    cached, cache_status = await result_cache.get_or_compute(cache_key(endpoint, images, params), compute)
+    CACHE_LOOKUPS.labels(endpoint, cache_status).inc()
+    
+    body = cached.body
+    if cache_status == "HIT" and cached.media_type.startswith("application/json"):
+        body = restamp_cached_body(body, time.perf_counter() - started_at)
+    
+    return Response(
+        content=body,
+        status_code=cached.status_code,
+        media_type=cached.media_type,
+        headers={"X-Cache": cache_status}
+    )
 
 @app.get("/")
 async def read_root():
@@ -25,28 +178,38 @@ async def read_root():
 
 @app.post("/api/v1/face-detection")
 async def detect_face(image: UploadFile = File(...)):
-    # อ่านไฟล์ภาพและแปลงเป็น base64
+    # อ่านไฟล์ภาพแล้วส่งไปยังบริการตรวจจับใบหน้าแบบ binary (ภาพเดิมที่ส่งซ้ำได้ผลจาก cache)
     content = await image.read()
-    base64_img = base64.b64encode(content).decode("utf-8")
-    
-    # ส่งคำขอไปยังบริการตรวจจับใบหน้า
-    try:
-        response = await client.post(
-            "http://face-detection:5000/detect",
-            json={"image": base64_img}
-        )
-        
-        # Check Content-Type and handle JSON parsing
-        if response.headers.get("content-type", "").startswith("application/json"):
-            try:
-                return response.json()
-            except Exception as e:
-                return {"error": f"JSON parsing error: {str(e)}", "raw_content": response.text[:100]}
-        else:
-            return {"error": f"Non-JSON response: {response.headers.get('content-type')}", "raw_content": response.text[:100]}
-            
-    except Exception as e:
-        return {"error": f"Request failed: {str(e)}"}
+    return await cached_response(
+        "face-detection", [content], None,
+        lambda: fetch_backend("face-detection", "/detect", binary_payload(content))
+    )
+
+@app.post("/api/v1/face-detection/batch")
+async def detect_faces_batch(
+    images: List[UploadFile] = File(...),
+    include_attributes: bool = Form(False)
+):
+    # ส่งทุกภาพในคำขอเดียวแบบ multipart (ผลลัพธ์เรียงตามลำดับไฟล์ที่ส่งมา)
+    files = [("images", await image.read()) for image in images]
+    return await proxy_backend(
+        "face-detection", "/detect/batch",
+        multipart_payload(files, {"include_attributes": include_attributes}),
+        timeout=60.0
+    )
+
+@app.post("/api/v1/face-detection/stream")
+async def detect_face_stream(
+    image: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    include_attributes: bool = Form(False)
+):
+    # ส่งเฟรมพร้อม session_id เดิม (บริการจะรัน detector เต็มเฉพาะ keyframe)
+    content = await image.read()
+    return await proxy_backend(
+        "face-detection", "/detect/stream",
+        binary_payload(content, {"session_id": session_id, "include_attributes": include_attributes})
+    )
 
 @app.post("/api/v1/face-recognition/compare")
 async def compare_faces(
@@ -54,125 +217,113 @@ async def compare_faces(
     image2: UploadFile = File(...),
     model_weights: Optional[str] = Form(None)
 ):
-    # อ่านไฟล์ภาพและแปลงเป็น base64
-    content1 = await image1.read()
-    content2 = await image2.read()
-    base64_img1 = base64.b64encode(content1).decode("utf-8")
-    base64_img2 = base64.b64encode(content2).decode("utf-8")
+    # แปลง model_weights เป็น JSON ถ้ามี
+    weights = {}
+    if model_weights:
+        weights = json.loads(model_weights)
     
+    # ส่งทั้งสองภาพไปยังบริการรู้จำใบหน้าแบบ multipart
+    files = [("image1", await image1.read()), ("image2", await image2.read())]
+    return await cached_response(
+        "face-recognition/compare", [content for _, content in files], {"model_weights": weights},
+        lambda: fetch_backend("face-recognition", "/compare", multipart_payload(files, {"model_weights": weights}))
+    )
+
+@app.post("/api/v1/face-recognition/compare/batch")
+async def compare_faces_batch(
+    probes: List[UploadFile] = File(...),
+    candidates: List[UploadFile] = File(...),
+    model_weights: Optional[str] = Form(None)
+):
     # แปลง model_weights เป็น JSON ถ้ามี
     weights = {}
     if model_weights:
         weights = json.loads(model_weights)
     
-    # ส่งคำขอไปยังบริการรู้จำใบหน้า
-    try:
-        response = await client.post(
-            "http://face-recognition:5001/compare",
-            json={
-                "image1": base64_img1,
-                "image2": base64_img2,
-                "model_weights": weights
-            }
-        )
-        
-        # Check Content-Type and handle JSON parsing
-        if response.headers.get("content-type", "").startswith("application/json"):
-            try:
-                return response.json()
-            except Exception as e:
-                return {"error": f"JSON parsing error: {str(e)}", "raw_content": response.text[:100]}
-        else:
-            return {"error": f"Non-JSON response: {response.headers.get('content-type')}", "raw_content": response.text[:100]}
-            
-    except Exception as e:
-        return {"error": f"Request failed: {str(e)}"}
+    # ส่งคำขอเดียวไปยังบริการรู้จำใบหน้า (probe แต่ละภาพถูกคำนวณ embedding ครั้งเดียว)
+    files = [("probes", await probe.read()) for probe in probes]
+    files += [("candidates", await candidate.read()) for candidate in candidates]
+    return await proxy_backend(
+        "face-recognition", "/compare/batch",
+        multipart_payload(files, {"model_weights": weights})
+    )
 
-@app.post("/api/v1/security/check")
-async def security_check(
+@app.post("/api/v1/face-recognition/enroll")
+async def enroll_face(
     image: UploadFile = File(...),
-    checks: Optional[str] = Form("liveness,deepfake,spoofing")
+    person_id: str = Form(...)
 ):
-    # อ่านไฟล์ภาพและแปลงเป็น base64
+    # ส่งภาพไปยังบริการรู้จำใบหน้าเพื่อเพิ่มเข้าแกลเลอรี
     content = await image.read()
-    base64_img = base64.b64encode(content).decode("utf-8")
-    
-    # แยกตัวเลือกการตรวจสอบ
-    check_options = checks.split(",") if checks else ["liveness", "deepfake", "spoofing"]
-    
-    result = {"is_real_face": True}
-    
-    # ตรวจสอบความมีชีวิต (liveness)
-    if "liveness" in check_options:
-        try:
-            liveness_response = await client.post(
-                "http://liveness:5002/check",
-                json={"image": base64_img}
-            )
-            
-            # Check Content-Type and handle JSON parsing
-            if liveness_response.headers.get("content-type", "").startswith("application/json"):
-                try:
-                    liveness_result = liveness_response.json()
-                except Exception as e:
-                    liveness_result = {"error": f"JSON parsing error: {str(e)}", "raw_content": liveness_response.text[:100]}
-            else:
-                liveness_result = {"error": f"Non-JSON response: {liveness_response.headers.get('content-type')}", "raw_content": liveness_response.text[:100]}
-                
-        except Exception as e:
-            liveness_result = {"error": f"Request failed: {str(e)}"}
-        
-        result["liveness"] = liveness_result
-        if not liveness_result.get("is_live", True):
-            result["is_real_face"] = False
-    
-    # ตรวจสอบ Deepfake
-    if "deepfake" in check_options:
-        try:
-            deepfake_response = await client.post(
-                "http://deepfake:5003/detect",
-                json={"image": base64_img}
-            )
-            
-            # Check Content-Type and handle JSON parsing
-            if deepfake_response.headers.get("content-type", "").startswith("application/json"):
-                try:
-                    deepfake_result = deepfake_response.json()
-                except Exception as e:
-                    deepfake_result = {"error": f"JSON parsing error: {str(e)}", "raw_content": deepfake_response.text[:100]}
-            else:
-                deepfake_result = {"error": f"Non-JSON response: {deepfake_response.headers.get('content-type')}", "raw_content": deepfake_response.text[:100]}
-                
-        except Exception as e:
-            deepfake_result = {"error": f"Request failed: {str(e)}"}
-        
-        result["deepfake"] = deepfake_result
-        if deepfake_result.get("is_fake", False):
-            result["is_real_face"] = False
-    
-    # ตรวจสอบการปลอมแปลง (spoofing) - อาจเป็นส่วนหนึ่งของ liveness
-    if "spoofing" in check_options and "liveness" not in check_options:
+    return await proxy_backend(
+        "face-recognition", "/enroll",
+        binary_payload(content, {"person_id": person_id})
+    )
+
+@app.delete("/api/v1/face-recognition/enroll/{person_id:path}")
+async def unenroll_face(person_id: str):
+    # ลบใบหน้าออกจากแกลเลอรีของบริการรู้จำใบหน้า
+    return await proxy_backend(
+        "face-recognition", f"/enroll/{quote(person_id, safe='')}", {},
+        method="DELETE"
+    )
+
+@app.post("/api/v1/face-recognition/identify")
+async def identify_face(
+    image: UploadFile = File(...),
+    top_k: int = Form(5)
+):
+    # ส่งภาพไปยังบริการรู้จำใบหน้าเพื่อค้นหาในแกลเลอรี (1:N)
+    content = await image.read()
+    return await proxy_backend(
+        "face-recognition", "/identify",
+        binary_payload(content, {"top_k": top_k})
+    )
+
+# timeout (วินาที) ของแต่ละการตรวจใน security check ซึ่งเรียกพร้อมกันทั้งหมด
+SECURITY_CHECK_TIMEOUTS = {
+    "liveness": float(os.environ.get("LIVENESS_TIMEOUT_S", "5")),
+    "deepfake": float(os.environ.get("DEEPFAKE_TIMEOUT_S", "15")),
+    "spoofing": float(os.environ.get("SPOOFING_TIMEOUT_S", "5"))
+}
+SECURITY_CHECK_ROUTES = {
+    "liveness": ("liveness", "/check"),
+    "deepfake": ("deepfake", "/detect"),
+    "spoofing": ("liveness", "/check-spoofing")
+}
+
+def parse_backend_response(response):
+    # Check Content-Type and handle JSON parsing
+    if response.headers.get("content-type", "").startswith("application/json"):
         try:
-            spoofing_response = await client.post(
-                "http://liveness:5002/check-spoofing",
-                json={"image": base64_img}
-            )
-            
-            # Check Content-Type and handle JSON parsing
-            if spoofing_response.headers.get("content-type", "").startswith("application/json"):
-                try:
-                    spoofing_result = spoofing_response.json()
-                except Exception as e:
-                    spoofing_result = {"error": f"JSON parsing error: {str(e)}", "raw_content": spoofing_response.text[:100]}
-            else:
-                spoofing_result = {"error": f"Non-JSON response: {spoofing_response.headers.get('content-type')}", "raw_content": spoofing_response.text[:100]}
-                
+            return response.json()
         except Exception as e:
-            spoofing_result = {"error": f"Request failed: {str(e)}"}
-        
-        result["spoofing"] = spoofing_result
-        if spoofing_result.get("is_attack", False):
-            result["is_real_face"] = False
+            return {"error": f"JSON parsing error: {str(e)}", "raw_content": response.text[:100]}
+    else:
+        return {"error": f"Non-JSON response: {response.headers.get('content-type')}", "raw_content": response.text[:100]}
+
+async def timed_post(backend_name, path, payload, timeout):
+    """POST ไปยัง backend แล้วคืนค่า (ผลลัพธ์, เวลาที่ใช้เป็นมิลลิวินาที) โดยไม่ throw"""
+    started_at = time.perf_counter()
+    try:
+        response = await backends[backend_name].post(path, timeout=timeout, **payload)
+        result = parse_backend_response(response)
+    except BackendUnavailable as e:
+        result = {"error": str(e), "reason": e.reason, "retry_after": e.retry_after}
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        result = {"error": f"Request timed out after {timeout:.1f}s"}
+    except Exception as e:
+        result = {"error": f"Request failed: {str(e)}"}
+    return result, (time.perf_counter() - started_at) * 1000.0
+
+def apply_security_verdict(result):
+    """ตั้งค่า is_real_face และ primary_reason จากผลของแต่ละการตรวจใน result"""
+    if "liveness" in result and not result["liveness"].get("is_live", True):
+        result["is_real_face"] = False
+    if "deepfake" in result and result["deepfake"].get("is_fake", False):
+        result["is_real_face"] = False
+    if "spoofing" in result and result["spoofing"].get("is_attack", False):
+        result["is_real_face"] = False
 
     # ถ้ามีผลการตรวจ Liveness
     if "liveness" in result:
@@ -192,46 +343,323 @@ async def security_check(
 
     return result
 
-@app.get("/api/v1/status")
-async def check_services_status():
-    services = {
-        "face-detection": "http://face-detection:5000/health",
-        "face-recognition": "http://face-recognition:5001/health",
-        "liveness": "http://liveness:5002/health",
-        "deepfake": "http://deepfake:5003/health",
+async def gather_with_cancel(coroutines):
+    """รัน coroutine ทั้งหมดพร้อมกัน ถ้าคำขอถูกยกเลิก task ที่ยังค้างอยู่จะถูกยกเลิกด้วย"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def select_security_checks(checks):
+    # แยกตัวเลือกการตรวจสอบ
+    check_options = checks.split(",") if checks else ["liveness", "deepfake", "spoofing"]
+    
+    # spoofing เป็นส่วนหนึ่งของ liveness จึงเรียกแยกเฉพาะเมื่อไม่ได้ตรวจ liveness
+    selected = [name for name in ("liveness", "deepfake", "spoofing") if name in check_options]
+    if "spoofing" in selected and "liveness" in selected:
+        selected.remove("spoofing")
+    return selected
+
+@app.post("/api/v1/security/check")
+async def security_check(
+    image: UploadFile = File(...),
+    checks: Optional[str] = Form("liveness,deepfake,spoofing")
+):
+    # อ่านไฟล์ภาพ (ส่งต่อแบบ binary)
+    content = await image.read()
+    selected = select_security_checks(checks)
+    
+    async def compute():
+        result = await run_security_check(content, selected)
+        # ไม่เก็บผลที่มีการตรวจใดล้มเหลว (เช่น timeout) ไว้ใน cache
+        return json_result(result, cacheable=not any("error" in result[name] for name in selected))
+    
+    return await cached_response("security/check", [content], {"checks": selected}, compute)
+
+async def run_security_check(content, selected):
+    # เรียกทุก backend พร้อมกัน (แต่ละตัวมี timeout ของตัวเอง)
+    started_at = time.perf_counter()
+    outcomes = dict(zip(selected, await gather_with_cancel(
+        timed_post(*SECURITY_CHECK_ROUTES[name], binary_payload(content), SECURITY_CHECK_TIMEOUTS[name])
+        for name in selected
+    )))
+    
+    result = {"is_real_face": True}
+    timings = {}
+    for name in selected:
+        check_result, elapsed_ms = outcomes[name]
+        result[name] = check_result
+        timings[name] = elapsed_ms
+    
+    apply_security_verdict(result)
+
+    # เวลาที่ใช้ของแต่ละการตรวจ (มิลลิวินาที) และเวลารวม ซึ่งใกล้เคียงกับ backend ที่ช้าที่สุด
+    timings["total"] = (time.perf_counter() - started_at) * 1000.0
+    result["timings_ms"] = timings
+
+    return result
+
+# ตั้งค่า /api/v1/analyze: ภาพใบหน้าที่ face-detection ตัดให้แต่ละ service
+# (liveness ใช้บริบทรอบใบหน้าและย่อเหลือ 80x80, deepfake ใช้ PNG เพื่อไม่ให้ JPEG ซ้ำรบกวน ELA)
+ANALYZE_CROPS = {
+    "liveness": {"scale": 2.7, "size": 160, "format": "jpg"},
+    "deepfake": {"scale": 1.3, "size": 380, "format": "png"},
+    "recognition": {"scale": 1.0, "size": 224, "format": "jpg"}
+}
+ANALYZE_ROUTES = {
+    "liveness": ("liveness", "/check"),
+    "deepfake": ("deepfake", "/detect"),
+    "recognition": ("face-recognition", "/identify")
+}
+ANALYZE_TIMEOUTS = {
+    "detection": float(os.environ.get("DETECTION_TIMEOUT_S", "15")),
+    "liveness": SECURITY_CHECK_TIMEOUTS["liveness"],
+    "deepfake": SECURITY_CHECK_TIMEOUTS["deepfake"],
+    "recognition": float(os.environ.get("RECOGNITION_TIMEOUT_S", "10"))
+}
+ANALYZE_MAX_FACES = int(os.environ.get("ANALYZE_MAX_FACES", "10"))
+
+@app.post("/api/v1/analyze")
+async def analyze_image(
+    image: UploadFile = File(...),
+    checks: Optional[str] = Form("liveness,deepfake"),
+    recognize: bool = Form(False),
+    include_attributes: bool = Form(True),
+    top_k: int = Form(1)
+):
+    # อัปโหลดภาพครั้งเดียว: ตรวจจับใบหน้าก่อน แล้วส่งเฉพาะภาพใบหน้าไปตรวจต่อพร้อมกัน
+    content = await image.read()
+    started_at = time.perf_counter()
+    
+    check_options = checks.split(",") if checks else ["liveness", "deepfake"]
+    targets = [name for name in ("liveness", "deepfake") if name in check_options]
+    if recognize:
+        targets.append("recognition")
+    
+    detection, detection_ms = await timed_post(
+        "face-detection", "/detect",
+        binary_payload(content, {
+            "include_attributes": include_attributes,
+            "crops": {name: ANALYZE_CROPS[name] for name in targets}
+        }),
+        ANALYZE_TIMEOUTS["detection"]
+    )
+    if "error" in detection:
+        return {"error": f"Face detection failed: {detection['error']}", "timings_ms": {"detection": detection_ms}}
+    
+    faces = detection.get("faces", [])[:ANALYZE_MAX_FACES]
+    # ใบหน้าที่ไม่มีภาพตัด (เช่นกรอบชิดขอบภาพ หรือ face-detection รุ่นเก่า) ข้ามการตรวจนั้นและรายงานเป็น error ของใบหน้านั้น
+    jobs = []
+    for face in faces:
+        crops = face.pop("crops", None) or {}
+        face["is_real_face"] = True
+        for name in targets:
+            if crops.get(name):
+                jobs.append((face, name, crops[name]))
+            else:
+                face[name] = {"error": "No face crop returned by face detection", "skipped": True}
+    params = {"recognition": {"top_k": top_k}}
+    outcomes = await gather_with_cancel(
+        timed_post(
+            *ANALYZE_ROUTES[name],
+            binary_payload(base64.b64decode(crop), params.get(name)),
+            ANALYZE_TIMEOUTS[name]
+        )
+        for face, name, crop in jobs
+    )
+    
+    timings = {"detection": detection_ms}
+    for (face, name, _), (check_result, elapsed_ms) in zip(jobs, outcomes):
+        face[name] = check_result
+        timings[name] = max(timings.get(name, 0.0), elapsed_ms)
+    for face in faces:
+        apply_security_verdict(face)
+    
+    timings["total"] = (time.perf_counter() - started_at) * 1000.0
+    return {
+        "faces": faces,
+        "count": len(faces),
+        "total_faces": detection.get("count", len(faces)),
+        "is_real_face": all(face["is_real_face"] for face in faces) if faces else None,
+        "image_size": detection.get("image_size"),
+        "timings_ms": timings
     }
+
+# ตั้งค่า WebSocket /api/v1/stream
+STREAM_DETECTION_TIMEOUT = float(os.environ.get("STREAM_DETECTION_TIMEOUT_S", "5"))
+STREAM_MAX_FRAME_BYTES = int(os.environ.get("STREAM_MAX_FRAME_BYTES", str(4 * 1024 * 1024)))
+
+def parse_stream_options(update):
+    """ตรวจข้อความตัวเลือกของ /api/v1/stream คืนค่าเฉพาะตัวเลือกที่รู้จัก (คีย์อื่นถูกข้าม)
+    หรือ raise ValueError ถ้าชนิดข้อมูลไม่ถูกต้อง (checks รับได้ทั้งสตริงคั่นด้วยจุลภาคและรายการสตริง)"""
+    if not isinstance(update, dict):
+        raise ValueError("Options must be a JSON object")
+    
+    options = {}
+    if "include_attributes" in update:
+        if not isinstance(update["include_attributes"], bool):
+            raise ValueError("include_attributes must be a boolean")
+        options["include_attributes"] = update["include_attributes"]
+    if "checks" in update:
+        checks = update["checks"]
+        if isinstance(checks, list) and all(isinstance(name, str) for name in checks):
+            checks = ",".join(checks)
+        if not isinstance(checks, str):
+            raise ValueError("checks must be a string or a list of strings")
+        options["checks"] = checks
+    return options
+
+@app.websocket("/api/v1/stream")
+async def analysis_stream(websocket: WebSocket):
+    """วิเคราะห์วิดีโอแบบเรียลไทม์ผ่าน WebSocket
     
-    results = {}
+    client ส่งเฟรม (JPEG) เป็นข้อความ binary และส่งตัวเลือกเป็นข้อความ JSON ได้ทุกเมื่อ
+    ({"include_attributes": bool, "checks": "liveness,deepfake,spoofing"})
+    ระหว่างที่ประมวลผลเฟรมหนึ่งอยู่ จะเก็บไว้เฉพาะเฟรมล่าสุด เฟรมที่เก่ากว่าถูกทิ้ง (latest-frame-wins)
     
-    for service_name, url in services.items():
+    server ส่งผลกลับเป็น JSON:
+      {"type": "detection", "frame": n, ...}  ผลตรวจจับ/ติดตามใบหน้าของเฟรม n
+      {"type": "security", "frame": n, ...}   ผลตรวจความปลอดภัยของ keyframe n (ทำเบื้องหลัง ไม่หน่วงเฟรมถัดไป)
+      {"type": "error", "frame": n, "error": ...}
+    """
+    await websocket.accept()
+    connection_id = uuid.uuid4().hex[:12]
+    options = {"include_attributes": True, "checks": "liveness,deepfake,spoofing"}
+    state = {"frame": None, "received": 0, "dropped": 0, "session_id": None, "security_task": None}
+    frame_ready = asyncio.Event()
+    
+    async def push_security(frame_index, content):
+        result = await run_security_check(content, select_security_checks(options["checks"]))
+        await websocket.send_json(dict(result, type="security", frame=frame_index))
+    
+    async def send_error(frame_index, error):
         try:
-            response = await client.get(url, timeout=3.0)
+            await websocket.send_json({"type": "error", "frame": frame_index, "error": error})
+        except Exception:
+            pass
+    
+    def security_done(frame_index, task):
+        # การตรวจที่ล้มเหลวต้องแจ้ง client แทนที่จะหายไปเงียบ ๆ
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        print(f"Stream {connection_id} security check for frame {frame_index} failed: {error!r}")
+        asyncio.ensure_future(send_error(frame_index, f"Security check failed: {error}"))
+    
+    async def process_frames():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame_index, received_at, content = state["frame"]
+            state["frame"] = None
+            STREAM_FRAMES.labels("processed").inc()
+            # request ID ต่อเฟรม (การตรวจความปลอดภัยของ keyframe ใช้ ID เดียวกับเฟรมนั้น)
+            request_id_var.set(f"{connection_id}-{frame_index}")
             
-            # Check Content-Type and handle JSON parsing
-            if response.headers.get("content-type", "").startswith("application/json"):
-                try:
-                    service_data = response.json()
-                except Exception as e:
-                    service_data = {"error": f"JSON parsing error: {str(e)}", "raw_content": response.text[:100]}
-            else:
-                service_data = {"error": f"Non-JSON response: {response.headers.get('content-type')}", "raw_content": response.text[:100]}
+            detection, detection_ms = await timed_post(
+                "face-detection", "/detect/stream",
+                binary_payload(content, {"session_id": state["session_id"], "include_attributes": options["include_attributes"]}),
+                STREAM_DETECTION_TIMEOUT
+            )
+            if "error" in detection:
+                await websocket.send_json({"type": "error", "frame": frame_index, "error": detection["error"]})
+                continue
             
-            if response.status_code == 200:
-                results[service_name] = {
-                    "status": "online",
-                    "models": service_data.get("models", []),
-                    "version": service_data.get("version", "unknown")
-                }
-            else:
-                results[service_name] = {"status": "error", "message": f"Status code: {response.status_code}"}
-        except Exception as e:
-            results[service_name] = {"status": "offline", "message": str(e)}
+            state["session_id"] = detection.get("session_id", state["session_id"])
+            await websocket.send_json(dict(
+                detection,
+                type="detection",
+                frame=frame_index,
+                dropped=state["dropped"],
+                detection_ms=detection_ms,
+                latency_ms=(time.perf_counter() - received_at) * 1000.0
+            ))
+            
+            # ตรวจความปลอดภัยเฉพาะ keyframe ที่มีใบหน้า และไม่ซ้อนกับการตรวจที่ยังไม่เสร็จ
+            security_task = state["security_task"]
+            if detection.get("keyframe") and detection.get("faces") and (security_task is None or security_task.done()):
+                state["security_task"] = asyncio.ensure_future(push_security(frame_index, content))
+                state["security_task"].add_done_callback(lambda task, frame_index=frame_index: security_done(frame_index, task))
     
+    worker = asyncio.ensure_future(process_frames())
+    try:
+        while not worker.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                if len(message["bytes"]) > STREAM_MAX_FRAME_BYTES:
+                    await websocket.send_json({"type": "error", "frame": None, "error": "Frame too large"})
+                    continue
+                # เฟรมที่ยังไม่ได้ประมวลผลถูกแทนที่ด้วยเฟรมใหม่
+                if state["frame"] is not None:
+                    state["dropped"] += 1
+                    STREAM_FRAMES.labels("dropped").inc()
+                STREAM_FRAMES.labels("received").inc()
+                state["received"] += 1
+                state["frame"] = (state["received"], time.perf_counter(), message["bytes"])
+                frame_ready.set()
+            elif message.get("text"):
+                try:
+                    options.update(parse_stream_options(json.loads(message["text"])))
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "frame": None, "error": f"Invalid options message: {e}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        tasks = [task for task in (worker, state["security_task"]) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # ปิด session ติดตามใบหน้าของสตรีมนี้ในบริการตรวจจับ
+        if state["session_id"]:
+            try:
+                await backends["face-detection"].request("DELETE", f"/detect/stream/{state['session_id']}", timeout=2.0)
+            except Exception:
+                pass
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return metrics_response()
+
+@app.get("/api/v1/status")
+async def check_services_status():
+    # ผลล่าสุดจาก health monitor (ตรวจเองเฉพาะเมื่อยังไม่เคยมีผล)
+    if health_monitor.last_checked is None:
+        await health_monitor.probe_all()
+    
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "checked_at": health_monitor.last_checked,
+        "services": health_monitor.snapshot()
+    }
+
+@app.get("/api/v1/backends")
+async def backend_pool_stats():
+    # สถานะ connection pool และจำนวนคำขอที่กำลังทำงาน/รอ slot ของแต่ละ backend
     return {
         "timestamp": datetime.datetime.now().isoformat(),
-        "services": results
+        "backends": {name: backend.stats() for name, backend in backends.items()}
     }
 
+@app.get("/api/v1/cache")
+async def cache_stats():
+    # สถิติของ cache ผลลัพธ์ (hit, miss, coalesced, ขนาดและจำนวนรายการ)
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "cache": result_cache.stats()
+    }
+
+@app.on_event("startup")
+async def startup_event():
+    health_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    await client.aclose()
+    await health_monitor.stop()
+    for backend in backends.values():
+        await backend.aclose()
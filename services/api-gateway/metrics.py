@@ -0,0 +1,59 @@
+import contextvars
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+# Prometheus metrics ของ gateway (ชื่อ metric ของคำขอตรงกับของ Flask services แยกด้วย label service)
+SERVICE_NAME = "api-gateway"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# request ID ของคำขอที่กำลังทำงาน (ส่งต่อไปยัง backend ใน header X-Request-ID)
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+REQUESTS = Counter(
+    "facesocial_requests_total", "HTTP requests handled",
+    ["service", "endpoint", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "facesocial_request_duration_seconds", "HTTP request latency (until response headers)",
+    ["service", "endpoint"], buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "facesocial_requests_in_flight", "HTTP requests being handled",
+    ["service", "endpoint"]
+)
+BACKEND_LATENCY = Histogram(
+    "facesocial_backend_request_duration_seconds", "Gateway to backend call latency (until response headers)",
+    ["backend", "outcome"], buckets=LATENCY_BUCKETS
+)
+BACKEND_IN_FLIGHT = Gauge("facesocial_backend_in_flight", "Backend calls holding an in-flight slot", ["backend"])
+BACKEND_QUEUE_DEPTH = Gauge("facesocial_backend_queue_depth", "Backend calls waiting for an in-flight slot", ["backend"])
+BACKEND_CIRCUIT_OPEN = Gauge("facesocial_backend_circuit_open", "1 when the backend circuit breaker is not closed", ["backend"])
+BACKEND_UP = Gauge("facesocial_backend_up", "1 when the latest health probes consider the backend available", ["backend"])
+BACKEND_REJECTIONS = Counter(
+    "facesocial_backend_rejections_total", "Backend calls rejected by admission control",
+    ["backend", "reason"]
+)
+CACHE_LOOKUPS = Counter(
+    "facesocial_gateway_cache_lookups_total", "Result cache lookups",
+    ["endpoint", "status"]
+)
+CACHE_BYTES = Gauge("facesocial_gateway_cache_bytes", "Bytes held in the result cache")
+STREAM_FRAMES = Counter(
+    "facesocial_stream_frames_total", "WebSocket stream frames received, processed or dropped",
+    ["outcome"]
+)
+
+
+def endpoint_label(request):
+    """path template ของ route ที่ตรงกับคำขอ (ไม่ใช้ path จริงเพื่อไม่ให้ label มีค่าไม่จำกัด)"""
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
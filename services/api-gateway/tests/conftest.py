@@ -0,0 +1,5 @@
+import os
+import sys
+
+# ให้ import โมดูลของ gateway (main, backends, cache, ...) ได้เมื่อรัน pytest จากที่ใดก็ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
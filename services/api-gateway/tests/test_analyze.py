@@ -0,0 +1,44 @@
+import asyncio
+import base64
+
+import httpx
+
+import main
+
+CROP = base64.b64encode(b"crop").decode()
+
+
+def test_face_without_crops_is_reported_per_check(monkeypatch):
+    async def respond(request):
+        if request.url.host == "face-detection":
+            return httpx.Response(200, json={
+                "faces": [
+                    {"bbox": [0, 0, 10, 10], "crops": {"liveness": CROP, "deepfake": CROP}},
+                    {"bbox": [90, 90, 10, 10], "crops": {"liveness": CROP}},
+                    {"bbox": [50, 50, 10, 10]}
+                ],
+                "count": 3
+            })
+        if request.url.host == "deepfake":
+            return httpx.Response(200, json={"is_fake": False, "score": 0.1})
+        return httpx.Response(200, json={"is_live": True, "score": 0.9})
+
+    for backend in main.backends.values():
+        monkeypatch.setattr(backend, "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await client.post("/api/v1/analyze", files={"image": ("a.jpg", b"image")})
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 200
+    full, partial, missing = response.json()["faces"]
+    assert full["liveness"] == {"is_live": True, "score": 0.9}
+    assert full["deepfake"] == {"is_fake": False, "score": 0.1}
+    assert partial["liveness"] == {"is_live": True, "score": 0.9}
+    assert partial["deepfake"]["skipped"] is True
+    assert missing["liveness"]["skipped"] is True and missing["deepfake"]["skipped"] is True
+    assert all("crops" not in face for face in (full, partial, missing))
+    assert response.json()["is_real_face"] is True
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from backends import Backend
+
+
+class FailingStream(httpx.AsyncByteStream):
+    """body ที่ส่งได้บางส่วนแล้ว backend ตัดการเชื่อมต่อ"""
+
+    async def __aiter__(self):
+        yield b'{"matches": ['
+        raise httpx.ReadError("connection reset")
+
+
+def test_failed_stream_releases_slot(monkeypatch):
+    async def respond(request):
+        return httpx.Response(200, headers={"Content-Type": "application/json"}, stream=FailingStream())
+
+    backend = main.backends["face-recognition"]
+    monkeypatch.setattr(backend, "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            for _ in range(3):
+                try:
+                    await client.post("/api/v1/face-recognition/identify", files={"image": ("a.jpg", b"image")})
+                except httpx.HTTPError:
+                    pass
+
+    asyncio.run(run())
+    assert backend.in_flight == 0
+    assert backend._semaphore._value == backend.max_in_flight
+
+
+def test_stream_header_timeout_counts_against_breaker():
+    async def respond(request):
+        await asyncio.sleep(1.0)
+        return httpx.Response(200, json={})
+
+    backend = Backend("test", "http://test", failure_threshold=1)
+    backend.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.stream("POST", "/slow", timeout=0.1)
+
+    asyncio.run(run())
+    assert backend.in_flight == 0
+    assert backend.stats_counters["timeouts"] == 1
+    assert backend.breaker.state == "open"
+
+
+def test_stream_close_is_idempotent():
+    async def respond(request):
+        return httpx.Response(200, json={"ok": True})
+
+    backend = Backend("test", "http://test")
+    backend.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+
+    async def run():
+        response, close = await backend.stream("POST", "/")
+        await close()
+        await close()
+
+    asyncio.run(run())
+    assert backend.in_flight == 0
+    assert backend._semaphore._value == backend.max_in_flight
@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    async def respond(request):
+        await asyncio.sleep(0.05)
+        if request.url.host == "face-detection":
+            return httpx.Response(200, json={"faces": [], "count": 0, "processing_time": 0.05})
+        return httpx.Response(200, json={"is_live": True, "score": 0.9})
+
+    for backend in main.backends.values():
+        monkeypatch.setattr(backend, "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    monkeypatch.setattr(main, "result_cache", main.ResultCache(ttl_s=60))
+
+    def post_twice(url, **data):
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                return [await client.post(url, files={"image": ("a.jpg", b"same image")}, data=data) for _ in range(2)]
+        return asyncio.run(run())
+
+    return post_twice
+
+
+def test_cache_hit_replaces_backend_processing_time(gateway):
+    first, second = gateway("/api/v1/face-detection")
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.json()["processing_time"] == 0.05
+    assert "cached_timings" not in first.json()
+
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["cached_timings"] == {"processing_time": 0.05}
+    assert second.json()["processing_time"] < 0.05
+
+
+def test_cache_hit_replaces_security_check_timings(gateway):
+    first, second = gateway("/api/v1/security/check", checks="liveness")
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.json()["timings_ms"]["liveness"] >= 50
+
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["cached_timings"]["timings_ms"] == first.json()["timings_ms"]
+    assert list(second.json()["timings_ms"]) == ["total"]
+    assert second.json()["timings_ms"]["total"] < 50
+    assert second.json()["liveness"] == first.json()["liveness"]
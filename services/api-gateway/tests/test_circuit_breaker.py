@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import main
+from backends import Backend, BackendUnavailable, CircuitBreaker
+
+
+def test_breaker_opens_then_half_opens_then_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_s=0.05)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # ปล่อยคำขอทดลองได้ครั้งละหนึ่ง
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    assert breaker.opens == 1
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+    assert not breaker.allow()
+
+
+def test_late_failures_do_not_extend_open_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=0.1)
+    breaker.record_failure()
+    opened_at = breaker.opened_at
+
+    # คำขอที่ถูกรับไว้ก่อน circuit เปิดล้มเหลวตามมาทีหลัง
+    time.sleep(0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.opened_at == opened_at
+    assert breaker.opens == 1
+
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_queue_full_is_rejected_immediately():
+    async def respond(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={})
+
+    backend = Backend("test", "http://test", max_in_flight=1, max_queue=1, queue_timeout_s=5.0)
+    backend.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+
+    async def run():
+        running = asyncio.ensure_future(backend.post("/"))
+        queued = asyncio.ensure_future(backend.post("/"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(BackendUnavailable) as rejected:
+            await backend.post("/")
+        await asyncio.gather(running, queued)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "queue_full"
+    assert backend.stats_counters["rejected_queue_full"] == 1
+    assert backend.in_flight == 0
+
+
+@pytest.mark.parametrize("reason, status", [("queue_full", 429), ("queue_timeout", 429), ("circuit_open", 503), ("down", 503)])
+def test_rejection_status_codes(reason, status):
+    response = asyncio.run(main.backend_unavailable_handler(None, BackendUnavailable("liveness", reason, 2.5)))
+
+    assert response.status_code == status
+    assert response.headers["Retry-After"] == "3"
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+import pytest
+
+from backends import Backend
+
+SLOW_REQUEST_S = 1.5
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(SLOW_REQUEST_S)
+        body = json.dumps({"status": "online", "models": ["test"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server_class):
+    server = server_class(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def threaded_server():
+    server = serve(ThreadingHTTPServer)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def single_threaded_server():
+    server = serve(HTTPServer)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+async def probe_while_busy(backend, probes=2, timeout_s=0.5):
+    """ใช้ connection ของ backend จนเต็มด้วยคำขอที่ช้า แล้วตรวจสุขภาพระหว่างนั้น"""
+    slow = [asyncio.ensure_future(backend.get("/slow")) for _ in range(backend.max_in_flight)]
+    await asyncio.sleep(0.2)
+    results = []
+    for _ in range(probes):
+        results.append(await backend.probe(timeout_s))
+    await asyncio.gather(*slow)
+    await backend.aclose()
+    return results
+
+
+def test_probe_does_not_wait_for_busy_connection_pool(threaded_server):
+    backend = Backend("test", threaded_server, max_in_flight=2, pool_timeout_s=0.5, down_after=2)
+
+    results = asyncio.run(probe_while_busy(backend))
+
+    assert [health["status"] for health in results] == ["online", "online"]
+    assert not backend.is_down
+
+
+def test_probe_timeout_under_load_does_not_mark_backend_down(single_threaded_server):
+    backend = Backend("test", single_threaded_server, max_in_flight=1, down_after=2)
+
+    results = asyncio.run(probe_while_busy(backend))
+
+    assert [health["status"] for health in results] == ["busy", "busy"]
+    assert not backend.is_down
+
+
+def test_unreachable_backend_goes_down():
+    backend = Backend("test", "http://127.0.0.1:9", down_after=2)
+
+    async def run():
+        for _ in range(2):
+            await backend.probe(0.5)
+        await backend.aclose()
+
+    asyncio.run(run())
+    assert backend.health["status"] == "offline"
+    assert backend.is_down
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from cache import CachedResponse, ResultCache, cache_key
+
+
+def response(body, cacheable=True):
+    return CachedResponse(body, 200, "application/json", cacheable)
+
+
+def counting_compute(body=b"{}", delay_s=0.05, cacheable=True):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay_s)
+        return response(body, cacheable)
+
+    return compute, calls
+
+
+def test_concurrent_requests_share_one_compute():
+    cache = ResultCache(ttl_s=60)
+    compute, calls = counting_compute(b'{"a": 1}')
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [status for _, status in results] == ["MISS", "COALESCED", "COALESCED"]
+    assert all(cached.body == b'{"a": 1}' for cached, _ in results)
+
+    cached, status = asyncio.run(cache.get_or_compute("k", compute))
+    assert status == "HIT"
+    assert len(calls) == 1
+
+
+def test_cancelling_first_caller_does_not_fail_waiters():
+    cache = ResultCache(ttl_s=60)
+    compute, calls = counting_compute(b'{"a": 1}', delay_s=0.1)
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        return first, result
+
+    first, (cached, status) = asyncio.run(run())
+    assert first.cancelled()
+    assert status == "COALESCED"
+    assert cached.body == b'{"a": 1}'
+    assert len(calls) == 1
+    # ผลยังถูกเก็บใน cache แม้ผู้เรียกคนแรกยกเลิกไปแล้ว
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["pending"] == 0
+
+
+def test_uncacheable_result_is_not_stored():
+    cache = ResultCache(ttl_s=60)
+    compute, calls = counting_compute(cacheable=False)
+
+    asyncio.run(cache.get_or_compute("k", compute))
+    _, status = asyncio.run(cache.get_or_compute("k", compute))
+
+    assert status == "MISS"
+    assert len(calls) == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = ResultCache(ttl_s=0.05)
+    compute, calls = counting_compute(delay_s=0)
+
+    asyncio.run(cache.get_or_compute("k", compute))
+    time.sleep(0.06)
+    _, status = asyncio.run(cache.get_or_compute("k", compute))
+
+    assert status == "MISS"
+    assert cache.counters["expired"] == 1
+    assert len(calls) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(ttl_s=60, max_entries=2)
+
+    async def run():
+        for key in ("a", "b"):
+            await cache.get_or_compute(key, counting_compute(delay_s=0)[0])
+        # ใช้ "a" ล่าสุด "b" จึงถูกลบเมื่อเพิ่ม "c"
+        await cache.get_or_compute("a", counting_compute(delay_s=0)[0])
+        await cache.get_or_compute("c", counting_compute(delay_s=0)[0])
+        return [(await cache.get_or_compute(key, counting_compute(delay_s=0)[0]))[1] for key in ("a", "c", "b")]
+
+    assert asyncio.run(run()) == ["HIT", "HIT", "MISS"]
+    assert cache.counters["evictions"] >= 1
+
+
+def test_size_limit_evicts_oldest_entries():
+    cache = ResultCache(ttl_s=60, max_bytes=10)
+
+    async def run():
+        await cache.get_or_compute("a", counting_compute(b"123456", delay_s=0)[0])
+        await cache.get_or_compute("b", counting_compute(b"123456", delay_s=0)[0])
+
+    asyncio.run(run())
+    assert cache.stats()["entries"] == 1
+    assert cache.size_bytes == 6
+
+
+def test_cache_key_depends_on_images_order_and_params():
+    assert cache_key("e", [b"1", b"2"]) == cache_key("e", [b"1", b"2"], {})
+    assert cache_key("e", [b"1", b"2"]) != cache_key("e", [b"2", b"1"])
+    assert cache_key("e", [b"1"], {"checks": ["liveness"]}) != cache_key("e", [b"1"], {"checks": ["deepfake"]})
+    assert cache_key("e", [b"1"]) != cache_key("f", [b"1"])
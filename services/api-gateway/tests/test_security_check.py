@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+import main
+
+
+def test_one_slow_check_times_out_without_delaying_the_others(monkeypatch):
+    async def respond(request):
+        if request.url.host == "deepfake":
+            await asyncio.sleep(1.0)
+            return httpx.Response(200, json={"is_fake": True, "score": 0.99})
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={"is_live": True, "score": 0.9})
+
+    for backend in main.backends.values():
+        monkeypatch.setattr(backend, "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    monkeypatch.setitem(main.SECURITY_CHECK_TIMEOUTS, "liveness", 0.5)
+    monkeypatch.setitem(main.SECURITY_CHECK_TIMEOUTS, "deepfake", 0.2)
+
+    result = asyncio.run(main.run_security_check(b"image", ["liveness", "deepfake"]))
+
+    assert result["liveness"] == {"is_live": True, "score": 0.9}
+    assert "timed out" in result["deepfake"]["error"]
+    # deepfake ที่ timeout ไม่ถูกนับเป็นผลว่าภาพปลอม
+    assert result["is_real_face"] is True
+    # ทั้งสองการตรวจรันพร้อมกัน เวลารวมจึงใกล้เคียงกับ timeout ที่ยาวที่สุด ไม่ใช่ผลรวม
+    assert result["timings_ms"]["liveness"] >= 100
+    assert 200 <= result["timings_ms"]["deepfake"] < 500
+    assert result["timings_ms"]["total"] < 500
+    assert main.backends["deepfake"].in_flight == 0
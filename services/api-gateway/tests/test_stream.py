@@ -0,0 +1,66 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.mark.parametrize("update, expected", [
+    ({"include_attributes": False}, {"include_attributes": False}),
+    ({"checks": "liveness"}, {"checks": "liveness"}),
+    ({"checks": ["liveness", "deepfake"]}, {"checks": "liveness,deepfake"}),
+    ({"unknown": 1}, {})
+])
+def test_parse_stream_options(update, expected):
+    assert main.parse_stream_options(update) == expected
+
+
+@pytest.mark.parametrize("update", [[], {"checks": 5}, {"checks": ["liveness", 1]}, {"include_attributes": "yes"}])
+def test_parse_stream_options_rejects_bad_types(update):
+    with pytest.raises(ValueError):
+        main.parse_stream_options(update)
+
+
+@pytest.fixture
+def stream_gateway(monkeypatch):
+    async def respond(request):
+        if request.method == "DELETE":
+            return httpx.Response(200, json={})
+        return httpx.Response(200, json={"session_id": "s1", "keyframe": True, "faces": [{"bbox": [0, 0, 10, 10]}]})
+
+    monkeypatch.setattr(main.backends["face-detection"], "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    return TestClient(main.app)
+
+
+def test_invalid_options_keep_socket_open(stream_gateway, monkeypatch):
+    async def security(content, selected):
+        return {"is_real_face": True, "checks": selected}
+
+    monkeypatch.setattr(main, "run_security_check", security)
+
+    with stream_gateway.websocket_connect("/api/v1/stream") as websocket:
+        websocket.send_text('{"checks": 5}')
+        error = websocket.receive_json()
+        assert error["type"] == "error"
+        assert "checks" in error["error"]
+
+        websocket.send_text('{"checks": ["deepfake"]}')
+        websocket.send_bytes(b"frame")
+        messages = [websocket.receive_json(), websocket.receive_json()]
+
+    assert [message["type"] for message in messages] == ["detection", "security"]
+    assert messages[1]["checks"] == ["deepfake"]
+
+
+def test_failed_security_check_is_reported(stream_gateway, monkeypatch):
+    async def security(content, selected):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(main, "run_security_check", security)
+
+    with stream_gateway.websocket_connect("/api/v1/stream") as websocket:
+        websocket.send_bytes(b"frame")
+        messages = [websocket.receive_json(), websocket.receive_json()]
+
+    assert messages[0]["type"] == "detection"
+    assert messages[1] == {"type": "error", "frame": 1, "error": "Security check failed: boom"}
@@ -0,0 +1,27 @@
+import asyncio
+
+import httpx
+
+import main
+
+
+def test_unenroll_forwards_delete_with_quoted_person_id(monkeypatch):
+    seen = []
+
+    async def respond(request):
+        seen.append((request.method, request.url.raw_path.decode()))
+        return httpx.Response(200, json={"person_id": "a/b c", "removed": True, "gallery_size": 0})
+
+    backend = main.backends["face-recognition"]
+    monkeypatch.setattr(backend, "client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await client.delete("/api/v1/face-recognition/enroll/a%2Fb%20c")
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert response.json()["removed"] is True
+    assert seen == [("DELETE", "/enroll/a%2Fb%20c")]
@@ -0,0 +1 @@
+# โมดูลที่ใช้ร่วมกันของ Flask services (ติดตั้งที่ /opt/facesocial/common ในทุก image ดู Dockerfile ของแต่ละ service)
@@ -0,0 +1,100 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, jsonify, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Prometheus metrics ของ Flask services ทุกตัว ใช้ชื่อและ label ชุดเดียวกันโดยแยกด้วย label service
+# เมื่อรันด้วย gunicorn หลาย worker ค่าจะถูกรวมผ่าน PROMETHEUS_MULTIPROC_DIR ที่ตั้งใน services/gunicorn.conf.py
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+REQUESTS = Counter(
+    "facesocial_requests_total", "HTTP requests handled",
+    ["service", "endpoint", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "facesocial_request_duration_seconds", "HTTP request latency",
+    ["service", "endpoint"], buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "facesocial_requests_in_flight", "HTTP requests being handled",
+    ["service", "endpoint"], multiprocess_mode="livesum"
+)
+STAGE_LATENCY = Histogram(
+    "facesocial_stage_duration_seconds", "Latency of a processing stage (decode, preprocess, inference, serialization)",
+    ["service", "model", "stage"], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "facesocial_batch_size", "Number of items per model inference call",
+    ["service", "model"], buckets=BATCH_BUCKETS
+)
+
+SERVICE_NAME = "unknown"
+
+
+@contextmanager
+def stage_timer(model, stage):
+    """จับเวลาขั้นตอนหนึ่งของการประมวลผล (model ว่างได้สำหรับขั้นที่ไม่ผูกกับโมเดล เช่น decode)"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(SERVICE_NAME, model, stage).observe(time.perf_counter() - started_at)
+
+
+def json_response(result):
+    """jsonify โดยจับเวลาเป็นขั้น serialization"""
+    with stage_timer("", "serialization"):
+        return jsonify(result)
+
+
+def observe_batch(model, size):
+    BATCH_SIZE.labels(SERVICE_NAME, model).observe(size)
+
+
+def request_id():
+    """request ID ของคำขอปัจจุบัน (มาจาก header X-Request-ID ของ API gateway หรือสร้างใหม่)"""
+    return getattr(g, "request_id", None)
+
+
+def metrics_response():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, service_name):
+    """ติดตั้ง hook นับคำขอ/เวลา/คำขอที่กำลังทำงาน ส่งต่อ X-Request-ID และเพิ่ม route /metrics"""
+    global SERVICE_NAME
+    SERVICE_NAME = service_name
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.request_started_at = time.perf_counter()
+        g.metrics_endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        IN_FLIGHT.labels(SERVICE_NAME, g.metrics_endpoint).inc()
+
+    @app.after_request
+    def add_request_id(response):
+        response.headers["X-Request-ID"] = g.request_id
+        g.response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(error=None):
+        if not hasattr(g, "request_started_at"):
+            return
+        IN_FLIGHT.labels(SERVICE_NAME, g.metrics_endpoint).dec()
+        REQUESTS.labels(SERVICE_NAME, g.metrics_endpoint, request.method, str(getattr(g, "response_status", 500))).inc()
+        REQUEST_LATENCY.labels(SERVICE_NAME, g.metrics_endpoint).observe(time.perf_counter() - g.request_started_at)
+
+    app.add_url_rule("/metrics", "metrics", metrics_response)
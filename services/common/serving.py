@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+from flask import request
+
+from common.metrics import stage_timer
+
+
+def decode_image_bytes(img_data):
+    """decode ไบต์ของภาพ ข้อมูลที่ว่างหรือ decode ไม่ได้จะได้ ValueError (ให้ handler ตอบ 400)"""
+    if not img_data:
+        raise ValueError("Empty image data")
+    try:
+        img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error as e:
+        raise ValueError(f"Invalid image data: {e}") from e
+    if img is None:
+        raise ValueError("Invalid image data")
+    return img
+
+
+# แปลงรูปภาพ base64 เป็น cv2 image
+def decode_base64_image(base64_str):
+    """แปลงรูปภาพ base64 เป็น cv2 image"""
+    try:
+        img_data = base64.b64decode(base64_str)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 data: {e}") from e
+    return decode_image_bytes(img_data)
+
+
+def decode_image(value):
+    """แปลงภาพที่เป็น bytes (binary) หรือ base64 string เป็น cv2 image"""
+    with stage_timer("", "decode"):
+        if isinstance(value, str):
+            return decode_base64_image(value)
+        return decode_image_bytes(value)
+
+
+# อ่านข้อมูลคำขอได้ทั้งแบบ JSON (ภาพเป็น base64) และแบบ binary จาก API gateway
+def request_data(list_fields=()):
+    """คืนค่า dict ของพารามิเตอร์ โดยภาพที่ส่งมาแบบ binary จะเป็น bytes
+
+    - application/json: {"image": "<base64>", ...}
+    - application/octet-stream หรือ image/*: ไบต์ของภาพใน body พารามิเตอร์อื่นเป็น JSON ใน header X-Params
+    - multipart/form-data: ไฟล์ภาพในแต่ละ field (field ใน list_fields รับได้หลายไฟล์) พารามิเตอร์อื่นเป็น JSON ใน field "params"
+    """
+    if request.mimetype == 'multipart/form-data':
+        data = json.loads(request.form.get('params') or '{}')
+        for field in request.files:
+            contents = [file.read() for file in request.files.getlist(field)]
+            data[field] = contents if field in list_fields else contents[0]
+        return data
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        data = json.loads(request.headers.get('X-Params') or '{}')
+        data['image'] = request.get_data()
+        return data
+    return request.get_json(force=True)
+
+
+# ข้อมูลของ worker process ที่ตอบคำขอนี้ (เมื่อรันด้วย gunicorn ตาม services/gunicorn.conf.py)
+def worker_status():
+    started_at = os.environ.get("GUNICORN_WORKER_STARTED_AT")
+    return {
+        "pid": os.getpid(),
+        "worker_id": os.environ.get("GUNICORN_WORKER_ID"),
+        "workers": int(os.environ.get("GUNICORN_WORKERS", "1")),
+        "uptime_s": time.time() - float(started_at) if started_at else None
+    }
@@ -1,8 +1,7 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
 import cv2
 import numpy as np
-import base64
 import os
 import torch
 import torch.nn as nn
@@ -10,9 +9,12 @@ import torch.nn.functional as F
 import timm
 from PIL import Image
 import io
+from common.metrics import init_metrics, json_response, observe_batch, stage_timer
+from common.serving import decode_image, request_data, worker_status
 
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "deepfake")
 
 # ตรวจสอบว่าใช้ GPU ได้หรือไม่
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -169,37 +171,40 @@ def preprocess_image(img, target_size=(380, 380)):
 # ฟังก์ชันสร้างภาพ ELA (Error Level Analysis)
 def generate_ela_image(img, quality=90):
     """สร้างภาพ Error Level Analysis (ELA)"""
-    # บันทึกเป็นไฟล์ JPEG ชั่วคราว
-    temp_filename = 'temp_image.jpg'
-    cv2.imwrite(temp_filename, img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    # บีบอัดเป็น JPEG ในหน่วยความจำ (ไม่ใช้ไฟล์ชั่วคราวร่วมกัน เพราะหลาย worker/thread ทำงานพร้อมกัน)
+    _, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
     
     # อ่านกลับมาเป็น array
-    compressed_img = cv2.imread(temp_filename)
+    compressed_img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
     
     # คำนวณความแตกต่าง (ELA)
     ela = cv2.absdiff(img, compressed_img) * 10
     
-    # ลบไฟล์ชั่วคราว
-    os.remove(temp_filename)
-    
     return ela
 
-def decode_base64_image(base64_str):
-    img_data = base64.b64decode(base64_str)
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return img
-
 # โหลดโมเดล ELA
 ela_model = load_ela_models()
 
+@app.route('/health', methods=['GET'])
+def health_check():
+    """ตรวจสอบสถานะของ service"""
+    status = {
+        "status": "online" if ela_model is not None else "limited",
+        "version": "1.0.0",
+        "models": [type(ela_model).__name__] if ela_model is not None else [],
+        "device": str(device),
+        "worker": worker_status()
+    }
+    
+    return jsonify(status)
+
 @app.route('/detect', methods=['POST'])
 def detect_deepfake():
-    data = request.json
+    data = request_data()
     
     # แปลงรูปภาพจาก base64
     try:
-        img = decode_base64_image(data['image'])
+        img = decode_image(data['image'])
     except Exception as e:
         return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
     
@@ -243,14 +248,16 @@ def detect_deepfake():
     
     # ประมวลผลด้วยโมเดล ELA
     try:
-        # สร้างภาพ ELA
-        ela_img = generate_ela_image(img)
-        
-        # เตรียมรูปภาพ
-        input_tensor = preprocess_image(ela_img)
+        with stage_timer("ela", "preprocess"):
+            # สร้างภาพ ELA
+            ela_img = generate_ela_image(img)
+            
+            # เตรียมรูปภาพ
+            input_tensor = preprocess_image(ela_img)
         
         # ทำนาย
-        with torch.no_grad():
+        observe_batch("ela", input_tensor.shape[0])
+        with stage_timer("ela", "inference"), torch.no_grad():
             if isinstance(ela_model, StackingEnsemble):
                 prediction = ela_model(input_tensor)
                 ela_prediction = torch.sigmoid(prediction).item()
@@ -270,7 +277,7 @@ def detect_deepfake():
             "ela_score": float(ela_prediction)
         }
         
-        return jsonify(result)
+        return json_response(result)
     except Exception as e:
         return jsonify({'error': f'Deepfake detection failed: {str(e)}'}), 500
 
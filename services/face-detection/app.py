@@ -1,14 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 import json  # เพิ่มการ import json module มาตรฐาน
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from scrfd import SCRFD
+from attributes import GenderAgeModel
+from tracking import TrackingSessions
+from common.metrics import init_metrics, json_response, stage_timer
+from common.serving import decode_image, request_data, worker_status
 
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "face-detection")
 
 # Custom JSON Encoder สำหรับแปลงค่า NumPy types
 class NumpyEncoder(json.JSONEncoder):
@@ -39,26 +47,84 @@ def convert_numpy_types(obj):
     else:
         return obj
 
+# เลือก backend ของตัวตรวจจับใบหน้าตอนเริ่มต้น: "haar" (ค่าเริ่มต้น), "scrfd" หรือ "auto" (ลอง SCRFD ก่อน ถ้าไม่ได้ใช้ Haar)
+# SCRFD ให้กล่องและจำนวนใบหน้าต่างจาก Haar จึงต้องเลือกใช้เอง ไม่เปลี่ยนตามการมีไฟล์โมเดล
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "haar")
+SCRFD_MODEL_PATH = os.environ.get("SCRFD_MODEL_PATH", os.path.join('models', 'scrfd_10g_bnkps.onnx'))
+SCRFD_INPUT_SIZE = int(os.environ.get("SCRFD_INPUT_SIZE", "640"))
+providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+class ThreadLocalCascade:
+    """CascadeClassifier แยกตาม thread
+    
+    CascadeClassifier ใช้ร่วมกันข้าม thread ไม่ได้ (detectMultiScale พร้อมกันทำให้ cv2.error หรือได้กล่องผิด)
+    แต่ /detect/batch และ gunicorn gthread เรียก detector จากหลาย thread จึงให้แต่ละ thread โหลดของตัวเอง
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # โหลดครั้งแรกใน thread ที่สร้างเพื่อตรวจว่าไฟล์ใช้ได้
+        self._classifier()
+    
+    def _classifier(self):
+        classifier = getattr(self._local, "classifier", None)
+        if classifier is None:
+            classifier = cv2.CascadeClassifier(self.path)
+            if classifier.empty():
+                raise ValueError(f"Failed to load Haar cascade from {self.path}")
+            self._local.classifier = classifier
+        return classifier
+    
+    def detectMultiScale(self, *args, **kwargs):
+        return self._classifier().detectMultiScale(*args, **kwargs)
+
 # โหลดโมเดล Haar Cascade สำหรับตรวจจับใบหน้า (มาพร้อมกับ OpenCV)
-def load_face_detector():
+def load_haar_detector():
     """โหลดโมเดล Face Detector ใช้ Haar Cascade"""
     try:
         print("โหลด Haar Cascade สำหรับตรวจจับใบหน้า...")
-        model = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        model = ThreadLocalCascade(HAAR_CASCADE_PATH)
         return {"type": "haar", "model": model}
     except Exception as e:
         print(f"⚠️ เกิดข้อผิดพลาดในการโหลดโมเดล Haar Cascade: {str(e)}")
         return None
 
+# โหลดโมเดล SCRFD (ONNX) ให้คะแนนจริงและ landmark 5 จุด
+def load_scrfd_detector(model_path=SCRFD_MODEL_PATH, detector_providers=None):
+    """โหลดโมเดล Face Detector ใช้ SCRFD บน ONNX Runtime"""
+    if not os.path.exists(model_path) or os.path.getsize(model_path) == 0:
+        print(f"⚠️ ไม่พบไฟล์โมเดล SCRFD ที่ {model_path}")
+        return None
+    try:
+        print(f"โหลด SCRFD จาก {model_path}...")
+        model = SCRFD(model_path, providers=detector_providers or providers,
+                      input_size=(SCRFD_INPUT_SIZE, SCRFD_INPUT_SIZE))
+        return {"type": "scrfd", "model": model}
+    except Exception as e:
+        print(f"⚠️ เกิดข้อผิดพลาดในการโหลดโมเดล SCRFD: {str(e)}")
+        return None
+
+def load_face_detector():
+    """โหลดโมเดล Face Detector ตาม DETECTOR_BACKEND"""
+    if DETECTOR_BACKEND in ("scrfd", "auto"):
+        detector = load_scrfd_detector()
+        if detector is not None or DETECTOR_BACKEND == "scrfd":
+            return detector
+        print("ใช้ Haar Cascade แทน SCRFD")
+    return load_haar_detector()
+
 # ตรวจจับใบหน้าด้วย Haar Cascade
-def detect_faces_haar(img, model, confidence_threshold=0.5):
+def detect_faces_haar(img, model, confidence_threshold=0.5, min_size=(30, 30), max_size=None):
     """ตรวจจับใบหน้าด้วย Haar Cascade"""
     # แปลงเป็นภาพขาวดำ
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
     # ตรวจจับใบหน้า
     faces_rect = model.detectMultiScale(
-        gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
+        gray, scaleFactor=1.1, minNeighbors=5, minSize=min_size, maxSize=max_size or (0, 0)
     )
     
     # แปลงผลลัพธ์
@@ -73,30 +139,233 @@ def detect_faces_haar(img, model, confidence_threshold=0.5):
     
     return faces
 
-# ฟังก์ชันวิเคราะห์เพศและอายุ (สร้างข้อมูลจำลอง)
-def analyze_face_attributes(img, face):
-    """วิเคราะห์เพศและอายุ (สร้างข้อมูลจำลอง)"""
-    import random
+# ตรวจจับใบหน้าด้วย backend ที่โหลดไว้
+def run_face_detector(img, detector):
+    """ตรวจจับใบหน้าด้วย detector ที่เลือกไว้ตอนเริ่มต้น"""
+    if detector["type"] == "scrfd":
+        return detector["model"].detect(img)
+    with stage_timer("haar", "inference"):
+        return detect_faces_haar(img, detector["model"])
+
+# ตั้งค่า coarse-to-fine (เลือกใช้): ตรวจจับบนภาพย่อที่ด้านยาวไม่เกิน max_side ของคำขอ หรือ DETECT_MAX_SIDE
+# (ค่าเริ่มต้น 0 = ตรวจจับที่ความละเอียดเต็มเหมือนเดิม) แล้ว refine เฉพาะใน ROI รอบใบหน้าแต่ละหน้า
+# โดยย่อ ROI ให้ด้านยาวไม่เกิน REFINE_ROI_SIDE
+DETECT_MAX_SIDE = int(os.environ.get("DETECT_MAX_SIDE", "0"))
+REFINE_ROI_SIDE = int(os.environ.get("REFINE_ROI_SIDE", "320"))
+REFINE_MARGIN = float(os.environ.get("REFINE_MARGIN", "0.4"))
+
+def parse_flag(value, default=False):
+    """แปลงพารามิเตอร์แบบเปิด/ปิดจากคำขอ (JSON boolean หรือ string เช่น "false", "0") เป็น bool"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError(f"Invalid boolean value: {value!r}")
+
+def bbox_iou(box_a, box_b):
+    """IoU ของกล่องสองกล่องในรูปแบบ [x, y, w, h]"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+def scale_face(face, scale, offset=(0, 0)):
+    """แปลงพิกัดของใบหน้ากลับสู่ภาพต้นฉบับ (หารด้วย scale แล้วบวก offset)"""
+    x, y, w, h = face["bbox"]
+    ox, oy = offset
+    face["bbox"] = [int(round(x / scale + ox)), int(round(y / scale + oy)),
+                    int(round(w / scale)), int(round(h / scale))]
+    if face.get("landmarks"):
+        face["landmarks"] = [[round(px / scale + ox, 1), round(py / scale + oy, 1)] for px, py in face["landmarks"]]
+    return face
+
+def crop_face(img, bbox, margin=0.0):
+    """ตัดส่วนใบหน้า (ขยายขอบตาม margin) โดยไม่เกินขอบภาพ คืนค่า (ภาพที่ตัด, (x0, y0))"""
+    x, y, w, h = bbox
+    img_h, img_w = img.shape[:2]
+    x0 = max(0, int(x - w * margin))
+    y0 = max(0, int(y - h * margin))
+    x1 = min(img_w, int(x + w * (1 + margin)))
+    y1 = min(img_h, int(y + h * (1 + margin)))
+    return img[y0:y1, x0:x1], (x0, y0)
+
+def refine_face(img, face, detector):
+    """ตรวจจับซ้ำเฉพาะใน ROI รอบใบหน้าที่ความละเอียดเต็ม (ย่อ ROI ให้ไม่เกิน REFINE_ROI_SIDE)"""
+    roi, offset = crop_face(img, face["bbox"], REFINE_MARGIN)
+    if roi.size == 0:
+        return face
     
-    # สร้างข้อมูลจำลอง
-    gender = "male" if random.random() > 0.5 else "female"
-    age = int(random.uniform(18, 60))
+    roi_scale = min(1.0, REFINE_ROI_SIDE / max(roi.shape[:2]))
+    if roi_scale < 1.0:
+        roi = cv2.resize(roi, (int(roi.shape[1] * roi_scale), int(roi.shape[0] * roi_scale)), interpolation=cv2.INTER_AREA)
     
-    return {
-        "gender": gender,
-        "age": age
-    }
+    if detector["type"] == "haar":
+        # จำกัดช่วงขนาดที่ค้นหาให้ใกล้กับขนาดใบหน้าที่คาดไว้ เพื่อให้ใช้เวลาน้อย
+        expected = int(max(face["bbox"][2], face["bbox"][3]) * roi_scale)
+        candidates = detect_faces_haar(
+            roi, detector["model"],
+            min_size=(max(20, int(expected * 0.6)),) * 2,
+            max_size=(int(expected * 1.6),) * 2
+        )
+    else:
+        candidates = run_face_detector(roi, detector)
+    
+    if not candidates:
+        return face
+    
+    # เลือกกล่องที่ทับกับตำแหน่งเดิมมากที่สุด
+    candidates = [scale_face(candidate, roi_scale, offset) for candidate in candidates]
+    best = max(candidates, key=lambda candidate: bbox_iou(candidate["bbox"], face["bbox"]))
+    if bbox_iou(best["bbox"], face["bbox"]) < 0.3:
+        return face
+    if detector["type"] == "haar":
+        best["confidence"] = face["confidence"]
+    return best
 
-# แปลงรูปภาพ base64 เป็น cv2 image
-def decode_base64_image(base64_str):
-    """แปลงรูปภาพ base64 เป็น cv2 image"""
-    img_data = base64.b64decode(base64_str)
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return img
+def detect_faces_coarse_to_fine(img, detector, max_side=DETECT_MAX_SIDE, refine=True):
+    """ตรวจจับบนภาพย่อ แล้วแปลงกล่องกลับเป็นความละเอียดเต็มและ refine ใน ROI เล็ก ๆ
+    
+    คืนค่า (faces, scale) โดย scale คืออัตราส่วนภาพย่อต่อภาพต้นฉบับ (1.0 = ไม่ได้ย่อ)
+    """
+    small, scale = downscale_image(img, max_side)
+    return finish_coarse_detection(img, run_face_detector(small, detector), scale, detector, refine), scale
+
+def downscale_image(img, max_side=DETECT_MAX_SIDE):
+    """ย่อภาพให้ด้านยาวไม่เกิน max_side คืนค่า (ภาพ, scale)"""
+    img_h, img_w = img.shape[:2]
+    if not max_side or max(img_h, img_w) <= max_side:
+        return img, 1.0
+    
+    scale = max_side / max(img_h, img_w)
+    # ภาพที่ยาวมากเมื่อย่อด้วย max_side เล็ก ๆ ด้านสั้นอาจปัดเหลือ 0 จึงให้เหลืออย่างน้อย 1 พิกเซล
+    size = (max(1, int(img_w * scale)), max(1, int(img_h * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), scale
+
+def finish_coarse_detection(img, faces, scale, detector, refine=True):
+    """แปลงผลที่ตรวจจับบนภาพย่อกลับเป็นพิกัดภาพเต็ม แล้ว refine ถ้าต้องการ"""
+    if scale == 1.0:
+        return faces
+    
+    faces = [scale_face(face, scale) for face in faces]
+    if refine:
+        faces = [refine_face(img, face, detector) for face in faces]
+    return faces
+
+# โมเดลวิเคราะห์เพศและอายุ (ONNX) ใบหน้าทั้งหมดในภาพรันใน inference ครั้งเดียว
+ATTRIBUTE_MODEL_PATH = os.environ.get("ATTRIBUTE_MODEL_PATH", os.path.join('models', 'genderage.onnx'))
+ATTRIBUTE_BATCH_SIZE = int(os.environ.get("ATTRIBUTE_BATCH_SIZE", "64"))
+
+def load_attribute_model(model_path=ATTRIBUTE_MODEL_PATH):
+    """โหลดโมเดลเพศและอายุ ถ้าไม่มีไฟล์จะไม่แนบ attribute ให้ใบหน้า"""
+    if not os.path.exists(model_path):
+        print(f"⚠️ ไม่พบไฟล์โมเดลเพศและอายุที่ {model_path} (ดาวน์โหลดด้วย download_models.sh) จะไม่มี gender/age ในผลลัพธ์")
+        return None
+    try:
+        print(f"โหลดโมเดลเพศและอายุจาก {model_path}...")
+        return GenderAgeModel(model_path, providers=providers, max_batch_size=ATTRIBUTE_BATCH_SIZE)
+    except Exception as e:
+        print(f"⚠️ เกิดข้อผิดพลาดในการโหลดโมเดลเพศและอายุ: {str(e)}")
+        return None
+
+def add_face_attributes(img, faces):
+    """เพิ่มข้อมูลเพศและอายุให้ทุกใบหน้าจาก inference ครั้งเดียว (แนบลงใน dict ของใบหน้าเดิม)"""
+    if attribute_model is None or not faces:
+        return faces
+    
+    for face, attributes in zip(faces, attribute_model.predict(img, [face["bbox"] for face in faces])):
+        face.update(attributes)
+    return faces
+
+# รูปแบบไฟล์ของภาพใบหน้าที่ส่งกลับ (jpg เล็กกว่า, png ไม่สูญเสียรายละเอียดซึ่งจำเป็นสำหรับ ELA)
+CROP_FORMATS = {"jpg": ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 95]), "png": ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 1])}
+
+def encode_face_crops(img, faces, crop_specs):
+    """ตัดภาพใบหน้าตาม spec แต่ละชุด แล้วแนบเป็น base64 ใน face["crops"][ชื่อ spec]
+    
+    spec: {"scale": ขยายจากขนาดกล่องกี่เท่า, "size": ด้านยาวสูงสุด (px), "format": "jpg" หรือ "png"}
+    ภาพถูกตัดเป็นสี่เหลี่ยมจัตุรัสรอบจุดกึ่งกลางของกล่อง ส่วนที่เกินขอบภาพเติมสีดำ
+    """
+    for face in faces:
+        x, y, w, h = face["bbox"]
+        center_x, center_y = x + w / 2.0, y + h / 2.0
+        face["crops"] = {}
+        for name, spec in crop_specs.items():
+            side = max(w, h) * float(spec.get("scale", 1.0))
+            out_size = int(max(1, min(int(spec.get("size", 224)), round(side))))
+            scale = out_size / side
+            matrix = np.array([
+                [scale, 0.0, out_size / 2.0 - center_x * scale],
+                [0.0, scale, out_size / 2.0 - center_y * scale]
+            ], dtype=np.float32)
+            crop = cv2.warpAffine(img, matrix, (out_size, out_size))
+            ext, params = CROP_FORMATS.get(spec.get("format", "jpg"), CROP_FORMATS["jpg"])
+            face["crops"][name] = base64.b64encode(cv2.imencode(ext, crop, params)[1]).decode("utf-8")
+    return faces
+
+# ตั้งค่า /detect/batch
+MAX_BATCH_DETECT_IMAGES = int(os.environ.get("MAX_BATCH_DETECT_IMAGES", "64"))
+DETECT_WORKERS = int(os.environ.get("DETECT_WORKERS", str(min(8, os.cpu_count() or 1))))
+# จำนวนภาพต่อการรัน SCRFD หนึ่งครั้ง (ใช้เมื่อโมเดลถูก export แบบรองรับ batch)
+DETECT_BATCH_SIZE = int(os.environ.get("DETECT_BATCH_SIZE", "16"))
+
+# OpenCV และ ONNX Runtime ปล่อย GIL ระหว่างคำนวณ จึงใช้ thread pool ได้
+detect_executor = ThreadPoolExecutor(max_workers=DETECT_WORKERS, thread_name_prefix="detect")
+
+def try_decode_image(value):
+    """decode ภาพโดยคืนค่า (ภาพ, None) หรือ (None, ข้อความผิดพลาด) เพื่อไม่ให้ภาพเสียภาพเดียวทำให้ทั้ง batch ล้ม"""
+    try:
+        return decode_image(value), None
+    except Exception as e:
+        return None, f'Failed to decode image: {str(e)}'
+
+def detect_image_batch(imgs, max_side=DETECT_MAX_SIDE, refine=True):
+    """ตรวจจับใบหน้าของภาพหลายภาพ คืนค่ารายการ (faces, scale) ตามลำดับเดิม
+    
+    ถ้าเป็น SCRFD ที่รองรับ batch จะรวมภาพย่อเป็น batch เดียวต่อการรันหนึ่งครั้ง
+    นอกนั้นแยกรันแต่ละภาพใน thread pool
+    """
+    detector = face_detector
+    if detector["type"] != "scrfd" or not detector["model"].batched:
+        return list(detect_executor.map(lambda img: detect_faces_coarse_to_fine(img, detector, max_side, refine), imgs))
+    
+    downscaled = list(detect_executor.map(lambda img: downscale_image(img, max_side), imgs))
+    coarse_faces = []
+    for start in range(0, len(downscaled), DETECT_BATCH_SIZE):
+        chunk = downscaled[start:start + DETECT_BATCH_SIZE]
+        coarse_faces.extend(detector["model"].detect_batch([small for small, _ in chunk]))
+    
+    return list(detect_executor.map(
+        lambda args: (finish_coarse_detection(args[0], args[1], args[2][1], detector, refine), args[2][1]),
+        zip(imgs, coarse_faces, downscaled)
+    ))
 
 # โหลดโมเดลเมื่อเริ่มต้น
 face_detector = load_face_detector()
+print(f"ตัวตรวจจับใบหน้า: {face_detector['type'] if face_detector else 'ไม่มี'} (DETECTOR_BACKEND={DETECTOR_BACKEND})")
+attribute_model = load_attribute_model()
+
+# ตั้งค่าโหมดสตรีม: รัน detector เต็มทุก STREAM_KEYFRAME_INTERVAL เฟรม
+# หรือเมื่อคะแนน template matching ของ track ใดต่ำกว่า STREAM_MIN_TRACK_SCORE
+STREAM_KEYFRAME_INTERVAL = int(os.environ.get("STREAM_KEYFRAME_INTERVAL", "5"))
+STREAM_MIN_TRACK_SCORE = float(os.environ.get("STREAM_MIN_TRACK_SCORE", "0.6"))
+stream_sessions = TrackingSessions(
+    ttl=float(os.environ.get("STREAM_SESSION_TTL_S", "60")),
+    max_sessions=int(os.environ.get("STREAM_MAX_SESSIONS", "256"))
+)
+
+# session ของสตรีมอยู่ในหน่วยความจำของแต่ละ process จึงรันด้วย 1 worker หลาย thread (WEB_CONCURRENCY=1 ใน docker-compose.yml)
+if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    print("⚠️ WEB_CONCURRENCY > 1: แต่ละ worker มี session ของสตรีมแยกกัน เฟรมของสตรีมเดียวกันที่ไปถึง worker อื่นจะเริ่ม session ใหม่")
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -104,18 +373,28 @@ def health_check():
     status = {
         "status": "online" if face_detector else "limited",
         "version": "1.0.0",
-        "models": []
+        "models": [],
+        "detector": face_detector["type"] if face_detector else None,
+        "detector_backend": DETECTOR_BACKEND
     }
     
     if face_detector:
         status["models"].append(face_detector["type"])
     
+    if attribute_model:
+        status["models"].append("genderage")
+    # ไม่มีโมเดลเพศและอายุ: include_attributes จะไม่แนบ gender/age ให้ใบหน้า (ดู download_models.sh)
+    status["attributes"] = "available" if attribute_model else "unavailable"
+    
+    status["stream"] = stream_sessions.stats()
+    status["worker"] = worker_status()
+    
     return jsonify(status)
 
 @app.route('/detect', methods=['POST'])
 def detect_faces():
     """API สำหรับตรวจจับใบหน้า"""
-    data = request.json
+    data = request_data()
     
     # ตรวจสอบว่ามีไฟล์รูปภาพหรือไม่
     if 'image' not in data:
@@ -127,29 +406,35 @@ def detect_faces():
     
     # แปลงรูปภาพจาก base64
     try:
-        img = decode_base64_image(data['image'])
+        img = decode_image(data['image'])
     except Exception as e:
         return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
     
+    # พารามิเตอร์ coarse-to-fine
+    try:
+        max_side = int(data.get('max_side', DETECT_MAX_SIDE))
+        refine = parse_flag(data.get('refine'), default=True)
+        include_attributes = parse_flag(data.get('include_attributes'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    if max_side < 0:
+        return jsonify({'error': 'Invalid parameter: max_side must not be negative'}), 400
+    
     # ตรวจจับใบหน้า
     try:
         start_time = time.time()
         
-        # ใช้ Haar Cascade
-        faces = detect_faces_haar(img, face_detector["model"])
+        # ใช้ SCRFD หรือ Haar Cascade ตามที่โหลดไว้ (ถ้ากำหนด max_side ภาพใหญ่จะตรวจจับบนภาพย่อก่อน)
+        faces, scale = detect_faces_coarse_to_fine(img, face_detector, max_side, refine)
         
         # เพิ่มข้อมูลเพศและอายุถ้าต้องการ
-        include_attributes = data.get('include_attributes', False)
         if include_attributes:
-            for face in faces:
-                # ตัดเฉพาะส่วนใบหน้า
-                x, y, w, h = face["bbox"]
-                face_img = img[y:y+h, x:x+w]
-                
-                # วิเคราะห์เพศและอายุ
-                if face_img.size > 0:  # ตรวจสอบว่ารูปไม่ว่างเปล่า
-                    attributes = analyze_face_attributes(face_img, face)
-                    face.update(attributes)
+            add_face_attributes(img, faces)
+        
+        # ภาพใบหน้าสำหรับส่งต่อให้ service อื่น (เช่น /api/v1/analyze ของ gateway)
+        if data.get('crops'):
+            with stage_timer("", "crop_encode"):
+                encode_face_crops(img, faces, data['crops'])
         
         processing_time = time.time() - start_time
         
@@ -160,12 +445,172 @@ def detect_faces():
         result = {
             "faces": faces,
             "count": len(faces),
-            "processing_time": processing_time
+            "processing_time": processing_time,
+            "scale": scale,
+            "image_size": [int(img.shape[1]), int(img.shape[0])]
         }
         
-        return jsonify(result)
+        return json_response(result)
+    except Exception as e:
+        return jsonify({'error': f'Face detection failed: {str(e)}'}), 500
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_faces_batch():
+    """API สำหรับตรวจจับใบหน้าหลายภาพในคำขอเดียว
+    
+    รับ "images" เป็นรายการ base64 (หรือไฟล์หลายไฟล์แบบ multipart) คืนผลของแต่ละภาพตามลำดับเดิม
+    ภาพที่ decode หรือตรวจจับไม่สำเร็จจะมี "error" เฉพาะรายการนั้น
+    """
+    data = request_data(list_fields=('images',))
+    
+    images = data.get('images')
+    if not images:
+        return jsonify({'error': 'No images provided'}), 400
+    if len(images) > MAX_BATCH_DETECT_IMAGES:
+        return jsonify({'error': f'Too many images (max {MAX_BATCH_DETECT_IMAGES})'}), 400
+    
+    # ตรวจสอบว่าโหลดโมเดลสำเร็จหรือไม่
+    if face_detector is None:
+        return jsonify({'error': 'Face detection model not loaded'}), 500
+    
+    try:
+        max_side = int(data.get('max_side', DETECT_MAX_SIDE))
+        refine = parse_flag(data.get('refine'), default=True)
+        include_attributes = parse_flag(data.get('include_attributes'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    if max_side < 0:
+        return jsonify({'error': 'Invalid parameter: max_side must not be negative'}), 400
+    
+    start_time = time.time()
+    
+    # decode ทุกภาพพร้อมกัน
+    decoded = list(detect_executor.map(try_decode_image, images))
+    results = [{"index": i, "error": error} for i, (_, error) in enumerate(decoded)]
+    valid = [i for i, (img, _) in enumerate(decoded) if img is not None]
+    
+    try:
+        detections = detect_image_batch([decoded[i][0] for i in valid], max_side, refine)
+    except Exception:
+        # ถ้ารวม batch ไม่สำเร็จ ให้ลองทีละภาพเพื่อแยกภาพที่มีปัญหา
+        detections = None
+    
+    for position, i in enumerate(valid):
+        img = decoded[i][0]
+        try:
+            if detections is not None:
+                faces, scale = detections[position]
+            else:
+                faces, scale = detect_faces_coarse_to_fine(img, face_detector, max_side, refine)
+            if include_attributes:
+                add_face_attributes(img, faces)
+            results[i] = {
+                "index": i,
+                "faces": convert_numpy_types(faces),
+                "count": len(faces),
+                "scale": scale,
+                "image_size": [int(img.shape[1]), int(img.shape[0])]
+            }
+        except Exception as e:
+            results[i] = {"index": i, "error": f'Face detection failed: {str(e)}'}
+    
+    failed = sum(1 for result in results if "error" in result)
+    return json_response({
+        "results": results,
+        "count": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "processing_time": time.time() - start_time
+    })
+
+@app.route('/detect/stream', methods=['POST'])
+def detect_faces_stream():
+    """API สำหรับตรวจจับใบหน้าจากวิดีโอ/สตรีมทีละเฟรม
+    
+    ส่ง "session_id" เดิมมาทุกเฟรม (ถ้าไม่ส่งจะสร้างใหม่และคืนค่าให้)
+    detector เต็มจะรันเฉพาะ keyframe ส่วนเฟรมอื่นใช้การติดตาม track_id ของใบหน้าจึงคงที่ข้ามเฟรม
+    และ attribute ของแต่ละ track คำนวณเพียงครั้งเดียว
+    """
+    data = request_data()
+    
+    # ตรวจสอบว่ามีไฟล์รูปภาพหรือไม่
+    if 'image' not in data:
+        return jsonify({'error': 'No image provided'}), 400
+    
+    # ตรวจสอบว่าโหลดโมเดลสำเร็จหรือไม่
+    if face_detector is None:
+        return jsonify({'error': 'Face detection model not loaded'}), 500
+    
+    # แปลงรูปภาพจาก base64
+    try:
+        img = decode_image(data['image'])
+    except Exception as e:
+        return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
+    
+    # พารามิเตอร์ของสตรีม
+    try:
+        keyframe_interval = int(data.get('keyframe_interval', STREAM_KEYFRAME_INTERVAL))
+        force_keyframe = parse_flag(data.get('force_keyframe'))
+        include_attributes = parse_flag(data.get('include_attributes'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    if keyframe_interval < 1:
+        return jsonify({'error': 'Invalid parameter: keyframe_interval must be at least 1'}), 400
+    
+    try:
+        start_time = time.time()
+        session_id, tracker = stream_sessions.get(data.get('session_id'))
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        
+        # เฟรมของ session เดียวกันต้องประมวลผลตามลำดับ
+        with tracker.lock:
+            keyframe = force_keyframe or tracker.needs_keyframe(keyframe_interval, STREAM_MIN_TRACK_SCORE)
+            if keyframe:
+                faces, _ = detect_faces_coarse_to_fine(img, face_detector)
+                with stage_timer("tracker", "update"):
+                    tracks = tracker.update(faces, gray)
+            else:
+                with stage_timer("tracker", "propagate"):
+                    tracks = tracker.propagate(gray)
+            
+            # คำนวณ attribute เฉพาะ track ใหม่ทั้งหมดใน inference ครั้งเดียว
+            new_tracks = [track for track in tracks if track["attributes"] is None]
+            if include_attributes and new_tracks and attribute_model is not None:
+                predictions = attribute_model.predict(img, [track["bbox"] for track in new_tracks])
+                for track, attributes in zip(new_tracks, predictions):
+                    track["attributes"] = attributes
+            
+            faces = []
+            for track in tracks:
+                face = {
+                    "track_id": track["track_id"],
+                    "bbox": track["bbox"],
+                    "confidence": track["confidence"],
+                    "landmarks": track["landmarks"],
+                    "track_score": track["track_score"]
+                }
+                if include_attributes and track["attributes"]:
+                    face.update(track["attributes"])
+                faces.append(face)
+            
+            frame_index = tracker.frame_index
+            tracker.frame_index += 1
+        
+        return json_response({
+            "session_id": session_id,
+            "frame_index": frame_index,
+            "keyframe": keyframe,
+            "faces": convert_numpy_types(faces),
+            "count": len(faces),
+            "processing_time": time.time() - start_time
+        })
     except Exception as e:
         return jsonify({'error': f'Face detection failed: {str(e)}'}), 500
 
+@app.route('/detect/stream/<session_id>', methods=['DELETE'])
+def close_detect_stream(session_id):
+    """ปิด session ของสตรีม"""
+    return jsonify({"session_id": session_id, "closed": stream_sessions.close(session_id)})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from common.metrics import observe_batch, stage_timer
+
+
+class GenderAgeModel:
+    """โมเดลทำนายเพศและอายุ (รูปแบบ genderage.onnx ของ InsightFace) บน ONNX Runtime
+
+    ใบหน้าทั้งหมดในภาพถูกตัดและย่อเป็น tensor เดียว (N, 3, H, W) แล้วรัน inference ครั้งเดียว
+    output ต่อใบหน้าคือ [คะแนนหญิง, คะแนนชาย, อายุ / 100]
+    """
+
+    def __init__(self, model_path, providers=None, session_options=None, max_batch_size=64, crop_scale=1.5):
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options,
+            providers=providers or ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2], model_input.shape[3]
+        self.input_size = (width, height) if isinstance(height, int) and isinstance(width, int) else (96, 96)
+        # บางโมเดลถูก export มาแบบ batch คงที่ = 1
+        self.fixed_batch = isinstance(model_input.shape[0], int) and model_input.shape[0] == 1
+        self.max_batch_size = max_batch_size
+        self.crop_scale = crop_scale
+
+    def _crop(self, img, bbox):
+        """ตัดใบหน้าเป็นสี่เหลี่ยมจัตุรัสรอบจุดกึ่งกลางกล่อง (ขยาย crop_scale เท่า) ด้วย affine เดียว"""
+        x, y, w, h = bbox
+        input_w, input_h = self.input_size
+        scale = input_w / (max(w, h) * self.crop_scale)
+        center_x, center_y = x + w / 2.0, y + h / 2.0
+        matrix = np.array([
+            [scale, 0.0, input_w / 2.0 - center_x * scale],
+            [0.0, scale, input_h / 2.0 - center_y * scale]
+        ], dtype=np.float32)
+        return cv2.warpAffine(img, matrix, (input_w, input_h), borderValue=0.0)
+
+    def _run(self, blob):
+        if self.fixed_batch and blob.shape[0] > 1:
+            return np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(blob.shape[0])], axis=0)
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def predict(self, img, bboxes):
+        """คืนค่ารายการ dict (gender, age, gender_confidence) ตามลำดับของ bboxes"""
+        if not bboxes:
+            return []
+
+        with stage_timer("genderage", "preprocess"):
+            crops = [self._crop(img, bbox) for bbox in bboxes]
+            blobs = [
+                cv2.dnn.blobFromImages(crops[start:start + self.max_batch_size], 1.0, self.input_size, (0.0, 0.0, 0.0), swapRB=True)
+                for start in range(0, len(crops), self.max_batch_size)
+            ]
+
+        with stage_timer("genderage", "inference"):
+            outputs = []
+            for blob in blobs:
+                observe_batch("genderage", blob.shape[0])
+                outputs.append(self._run(blob))
+            outputs = np.concatenate(outputs, axis=0)
+
+        # softmax ของคะแนนเพศ
+        gender_scores = outputs[:, :2] - outputs[:, :2].max(axis=1, keepdims=True)
+        gender_probs = np.exp(gender_scores) / np.exp(gender_scores).sum(axis=1, keepdims=True)
+        is_male = np.argmax(outputs[:, :2], axis=1) == 1
+        ages = np.clip(np.round(outputs[:, 2] * 100), 0, 100).astype(int)
+
+        return [
+            {
+                "gender": "male" if is_male[i] else "female",
+                "age": int(ages[i]),
+                "gender_confidence": float(gender_probs[i].max())
+            }
+            for i in range(len(bboxes))
+        ]
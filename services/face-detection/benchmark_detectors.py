@@ -0,0 +1,87 @@
+import argparse
+import os
+import time
+
+# วัดผลบน CPU เท่านั้น และไม่ให้ app โหลด SCRFD บน GPU ตอน import
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ.setdefault("DETECTOR_BACKEND", "haar")
+
+import cv2
+import numpy as np
+
+import app as detection_app
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+SYNTHETIC_SIZES = [(640, 480), (1280, 720), (1920, 1080), (4000, 3000)]
+
+
+def load_images(image_dir):
+    """โหลดภาพจากโฟลเดอร์ ถ้าไม่มีจะสร้างภาพสุ่มหลายความละเอียด (วัด latency ได้ แต่ไม่มีใบหน้าจริง)"""
+    images = []
+    if image_dir and os.path.isdir(image_dir):
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(image_dir, name))
+                if img is not None:
+                    images.append((name, img))
+
+    if not images:
+        print("⚠️ ไม่พบภาพทดสอบ ใช้ภาพสุ่มแทน")
+        rng = np.random.default_rng(0)
+        for width, height in SYNTHETIC_SIZES:
+            images.append((f"synthetic_{width}x{height}", (rng.random((height, width, 3)) * 255).astype(np.uint8)))
+
+    return images
+
+
+def benchmark(detector, images, runs, max_side=0):
+    rows = []
+    for name, img in images:
+        detection_app.detect_faces_coarse_to_fine(img, detector, max_side)  # warm-up
+        timings = []
+        faces = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            faces, _ = detection_app.detect_faces_coarse_to_fine(img, detector, max_side)
+            timings.append((time.perf_counter() - start) * 1000.0)
+        rows.append({
+            "image": name,
+            "size": f"{img.shape[1]}x{img.shape[0]}",
+            "faces": len(faces),
+            "p50_ms": float(np.median(timings)),
+            "p95_ms": float(np.percentile(timings, 95))
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="เปรียบเทียบ latency ของ SCRFD กับ Haar Cascade บน CPU")
+    parser.add_argument("--images", help="โฟลเดอร์ภาพทดสอบ")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-side", type=int, default=detection_app.DETECT_MAX_SIDE or 1280,
+                        help="ด้านยาวสูงสุดของภาพที่ใช้ตรวจจับแบบ coarse-to-fine (0 = วัดเฉพาะความละเอียดเต็ม)")
+    parser.add_argument("--threads", type=int, default=0, help="จำนวน thread ของ OpenCV (0 = ค่าเริ่มต้น)")
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+
+    images = load_images(args.images)
+    detectors = {
+        "haar": detection_app.load_haar_detector(),
+        "scrfd": detection_app.load_scrfd_detector(detector_providers=['CPUExecutionProvider'])
+    }
+
+    for backend, detector in detectors.items():
+        if detector is None:
+            print(f"⚠️ ข้าม {backend} เพราะโหลดโมเดลไม่ได้")
+            continue
+        modes = [("full", 0)] + ([(f"c2f{args.max_side}", args.max_side)] if args.max_side else [])
+        for mode, max_side in modes:
+            for row in benchmark(detector, images, args.runs, max_side):
+                print(f"📊 {backend:6s} {mode:8s} {row['image']:32s} {row['size']:>10s} faces={row['faces']:3d}  "
+                      f"p50={row['p50_ms']:8.1f} ms  p95={row['p95_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from common.metrics import observe_batch, stage_timer
+
+
+def distance2bbox(points, distance):
+    """แปลงระยะจากจุด anchor (left, top, right, bottom) เป็นกล่อง x1, y1, x2, y2"""
+    return np.concatenate([points - distance[:, 0:2], points + distance[:, 2:4]], axis=1)
+
+
+def distance2kps(points, distance):
+    """แปลงระยะจากจุด anchor เป็นพิกัด landmark (N, K, 2)"""
+    offsets = distance.reshape(distance.shape[0], -1, 2)
+    return points[:, None, :] + offsets
+
+
+def nms(boxes, scores, iou_threshold):
+    """Non-maximum suppression แบบ greedy ที่คำนวณ IoU ทีละกลุ่มด้วย NumPy"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = np.argsort(-scores)
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.maximum(0.0, xx2 - xx1 + 1) * np.maximum(0.0, yy2 - yy1 + 1)
+        iou = inter / (areas[i] + areas[rest] - inter)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+class SCRFD:
+    """ตัวตรวจจับใบหน้า SCRFD (InsightFace) บน ONNX Runtime
+
+    ถอดรหัส anchor, กรองคะแนน และ NMS ทั้งหมดทำแบบ vectorized ด้วย NumPy
+    คืนค่ากล่อง คะแนนจริง และ landmark 5 จุดของแต่ละใบหน้า
+    """
+
+    def __init__(self, model_path, providers=None, input_size=(640, 640), session_options=None):
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options,
+            providers=providers or ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+        # ถ้าโมเดลกำหนดขนาด input ตายตัว ให้ใช้ขนาดนั้น
+        height, width = model_input.shape[2], model_input.shape[3]
+        if isinstance(height, int) and isinstance(width, int):
+            input_size = (width, height)
+        self.input_size = input_size
+        # โมเดลที่ export แบบรองรับ batch จะมี output 3 มิติ (B, N, C)
+        self.batched = len(self.session.get_outputs()[0].shape) == 3
+
+        # จำนวน output บอกโครงสร้างของโมเดล (มี/ไม่มี keypoints และจำนวน stride)
+        num_outputs = len(self.output_names)
+        self.use_kps = num_outputs in (9, 15)
+        if num_outputs in (6, 9):
+            self.fmc, self.strides, self.num_anchors = 3, [8, 16, 32], 2
+        elif num_outputs in (10, 15):
+            self.fmc, self.strides, self.num_anchors = 5, [8, 16, 32, 64, 128], 1
+        else:
+            raise ValueError(f"Unsupported SCRFD model with {num_outputs} outputs")
+
+        self._center_cache = {}
+
+    def _anchor_centers(self, height, width, stride):
+        key = (height, width, stride)
+        centers = self._center_cache.get(key)
+        if centers is None:
+            grid = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+            centers = (grid * stride).reshape(-1, 2)
+            if self.num_anchors > 1:
+                centers = np.repeat(centers, self.num_anchors, axis=0)
+            self._center_cache[key] = centers
+        return centers
+
+    def _letterbox(self, img):
+        """ย่อภาพโดยคงอัตราส่วน แล้ววางไว้มุมซ้ายบนของภาพขนาด input_size"""
+        input_w, input_h = self.input_size
+        img_h, img_w = img.shape[:2]
+        scale = min(input_w / img_w, input_h / img_h)
+        new_w, new_h = int(img_w * scale), int(img_h * scale)
+
+        canvas = np.zeros((input_h, input_w, 3), dtype=np.uint8)
+        canvas[:new_h, :new_w] = cv2.resize(img, (new_w, new_h))
+        return canvas, scale
+
+    def _blob(self, canvases):
+        return cv2.dnn.blobFromImages(canvases, 1.0 / 128, self.input_size, (127.5, 127.5, 127.5), swapRB=True)
+
+    def _decode(self, outputs, index, score_threshold):
+        input_w, input_h = self.input_size
+        scores, boxes, kps = [], [], []
+
+        for level, stride in enumerate(self.strides):
+            level_scores = outputs[level]
+            level_boxes = outputs[level + self.fmc]
+            # output แบบมีมิติ batch (B, N, C) หรือแบบแบน (N, C)
+            if level_scores.ndim == 3:
+                level_scores = level_scores[index]
+                level_boxes = level_boxes[index]
+            level_scores = level_scores.reshape(-1)
+
+            mask = level_scores >= score_threshold
+            if not mask.any():
+                continue
+
+            centers = self._anchor_centers(input_h // stride, input_w // stride, stride)[mask]
+            scores.append(level_scores[mask])
+            boxes.append(distance2bbox(centers, level_boxes[mask] * stride))
+            if self.use_kps:
+                level_kps = outputs[level + self.fmc * 2]
+                if level_kps.ndim == 3:
+                    level_kps = level_kps[index]
+                kps.append(distance2kps(centers, level_kps[mask] * stride))
+
+        if not scores:
+            return np.empty(0, np.float32), np.empty((0, 4), np.float32), np.empty((0, 5, 2), np.float32)
+
+        return (
+            np.concatenate(scores),
+            np.concatenate(boxes),
+            np.concatenate(kps) if kps else np.empty((0, 5, 2), np.float32)
+        )
+
+    def _postprocess(self, outputs, index, scale, score_threshold, iou_threshold, max_faces):
+        scores, boxes, kps = self._decode(outputs, index, score_threshold)
+        if scores.size == 0:
+            return []
+
+        # แปลงพิกัดกลับเป็นพิกัดของภาพต้นฉบับ
+        boxes = boxes / scale
+        kps = kps / scale
+
+        keep = nms(boxes, scores, iou_threshold)
+        if max_faces:
+            keep = keep[:max_faces]
+
+        faces = []
+        for i in keep:
+            x1, y1, x2, y2 = boxes[i]
+            faces.append({
+                "bbox": [int(round(x1)), int(round(y1)), int(round(x2 - x1)), int(round(y2 - y1))],
+                "confidence": float(scores[i]),
+                "landmarks": kps[i].round(1).tolist() if self.use_kps else []
+            })
+        return faces
+
+    def detect(self, img, score_threshold=0.5, iou_threshold=0.4, max_faces=0):
+        """ตรวจจับใบหน้าในภาพ BGR คืนค่ารายการ dict ที่มี bbox [x, y, w, h], confidence และ landmarks"""
+        return self.detect_batch([img], score_threshold, iou_threshold, max_faces)[0]
+
+    def detect_batch(self, imgs, score_threshold=0.5, iou_threshold=0.4, max_faces=0):
+        """ตรวจจับใบหน้าหลายภาพ ถ้าโมเดลรองรับ batch จะรัน inference ครั้งเดียว"""
+        batched = self.batched and len(imgs) > 1
+        with stage_timer("scrfd", "preprocess"):
+            letterboxed = [self._letterbox(img) for img in imgs]
+            canvases = [canvas for canvas, _ in letterboxed]
+            blobs = [self._blob(canvases)] if batched else [self._blob([canvas]) for canvas in canvases]
+
+        with stage_timer("scrfd", "inference"):
+            outputs = []
+            for blob in blobs:
+                observe_batch("scrfd", blob.shape[0])
+                outputs.append(self.session.run(self.output_names, {self.input_name: blob}))
+
+        if batched:
+            per_image = [(outputs[0], i) for i in range(len(imgs))]
+        else:
+            per_image = [(image_outputs, 0) for image_outputs in outputs]
+
+        with stage_timer("scrfd", "postprocess"):
+            return [
+                self._postprocess(image_outputs, index, scale, score_threshold, iou_threshold, max_faces)
+                for (image_outputs, index), (_, scale) in zip(per_image, letterboxed)
+            ]
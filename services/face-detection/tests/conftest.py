@@ -0,0 +1,8 @@
+import os
+import sys
+
+# ให้ import โมดูลของ service (app, scrfd, tracking, ...) ได้เมื่อรัน pytest จากที่ใดก็ได้
+# และโมดูลที่ใช้ร่วมกันใน services/common (ใน image ติดตั้งที่ /opt/facesocial ผ่าน PYTHONPATH)
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(SERVICE_DIR))
+sys.path.insert(0, SERVICE_DIR)
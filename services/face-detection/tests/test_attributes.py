@@ -0,0 +1,74 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+from attributes import GenderAgeModel
+
+
+class FakeSession:
+    """session ที่คืน [คะแนนหญิง, คะแนนชาย, อายุ / 100] ตามค่าเฉลี่ยของแต่ละภาพที่ตัดมา"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def run(self, outputs, feeds):
+        blob = next(iter(feeds.values()))
+        self.batch_sizes.append(blob.shape[0])
+        brightness = blob.reshape(blob.shape[0], -1).mean(axis=1) / 255.0
+        return [np.stack([1.0 - brightness, brightness, brightness * 0.5], axis=1)]
+
+
+def fake_model(max_batch_size=64):
+    model = GenderAgeModel.__new__(GenderAgeModel)
+    model.session = FakeSession()
+    model.input_name = "data"
+    model.input_size = (96, 96)
+    model.fixed_batch = False
+    model.max_batch_size = max_batch_size
+    model.crop_scale = 1.0
+    return model
+
+
+def test_predict_keeps_face_order_and_batches_crops():
+    img = np.zeros((100, 200, 3), np.uint8)
+    img[:, 100:] = 255
+    model = fake_model(max_batch_size=2)
+
+    results = model.predict(img, [[120, 20, 60, 60], [20, 20, 60, 60], [130, 30, 40, 40]])
+
+    assert [result["gender"] for result in results] == ["male", "female", "male"]
+    assert [result["age"] for result in results] == [50, 0, 50]
+    assert all(0.5 <= result["gender_confidence"] <= 1.0 for result in results)
+    assert model.session.batch_sizes == [2, 1]
+    assert model.predict(img, []) == []
+
+
+@pytest.mark.parametrize("model, expected", [(None, "unavailable"), (object(), "available")])
+def test_health_reports_attribute_model(monkeypatch, model, expected):
+    monkeypatch.setattr(service, "attribute_model", model)
+
+    health = service.app.test_client().get("/health").get_json()
+
+    assert health["attributes"] == expected
+    assert ("genderage" in health["models"]) is (model is not None)
+
+
+@pytest.mark.parametrize("route, field", [("/detect", "image"), ("/detect/batch", "images")])
+def test_include_attributes_parses_string_flags(monkeypatch, route, field):
+    calls = []
+    monkeypatch.setattr(service, "add_face_attributes", lambda img, faces: calls.append(faces))
+    client = service.app.test_client()
+    image = base64.b64encode(cv2.imencode(".png", np.zeros((64, 64, 3), np.uint8))[1]).decode()
+
+    def post(flag):
+        return client.post(route, json={field: image if field == "image" else [image], "include_attributes": flag})
+
+    # multipart หรือ X-Params ส่งทุกค่าเป็น string: "false" ต้องปิดการแนบ gender/age
+    assert post("false").status_code == 200
+    assert calls == []
+    assert post("true").status_code == 200
+    assert len(calls) == 1
+    assert post("maybe").status_code == 400
@@ -0,0 +1,84 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+
+
+def encode(img):
+    return base64.b64encode(cv2.imencode(".jpg", img)[1]).decode()
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, True), (True, True), (False, False), (0, False), (1, True),
+    ("false", False), ("False", False), ("0", False), ("no", False), ("off", False),
+    ("true", True), ("1", True), ("yes", True)
+])
+def test_parse_flag(value, expected):
+    assert service.parse_flag(value, default=True) is expected
+
+
+def test_parse_flag_rejects_unknown_value():
+    with pytest.raises(ValueError):
+        service.parse_flag("maybe")
+
+
+def test_detect_uses_full_resolution_by_default(client):
+    response = client.post("/detect", json={"image": encode(np.zeros((1600, 2400, 3), np.uint8))})
+    assert response.status_code == 200
+    assert response.get_json()["scale"] == 1.0
+
+
+def test_detect_downscales_when_max_side_is_given(client):
+    response = client.post("/detect", json={"image": encode(np.zeros((1600, 2400, 3), np.uint8)), "max_side": 1200})
+    assert response.status_code == 200
+    assert response.get_json()["scale"] == 0.5
+
+
+def test_detect_string_refine_false_disables_refine(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(service, "refine_face", lambda img, face, detector: calls.append(face) or face)
+    monkeypatch.setattr(service, "run_face_detector",
+                        lambda img, detector: [{"bbox": [10, 10, 40, 40], "confidence": 0.9, "landmarks": []}])
+    image = encode(np.zeros((1600, 2400, 3), np.uint8))
+
+    response = client.post("/detect", json={"image": image, "max_side": 1200, "refine": "false"})
+    assert response.status_code == 200
+    assert calls == []
+
+    response = client.post("/detect", json={"image": image, "max_side": 1200, "refine": "true"})
+    assert response.status_code == 200
+    assert len(calls) == 1
+
+
+def test_detect_rejects_invalid_refine(client):
+    response = client.post("/detect", json={"image": encode(np.zeros((64, 64, 3), np.uint8)), "refine": "maybe"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("route, field", [("/detect", "image"), ("/detect/batch", "images")])
+def test_detect_rejects_negative_max_side(client, route, field):
+    image = encode(np.zeros((64, 64, 3), np.uint8))
+    response = client.post(route, json={field: image if field == "image" else [image], "max_side": -1})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid parameter")
+
+
+def test_downscale_keeps_at_least_one_pixel():
+    small, scale = service.downscale_image(np.zeros((40, 400, 3), np.uint8), 1)
+
+    assert small.shape[:2] == (1, 1)
+    assert scale == pytest.approx(1 / 400)
+
+
+def test_detect_with_tiny_max_side_succeeds(client):
+    response = client.post("/detect", json={"image": encode(np.zeros((64, 640, 3), np.uint8)), "max_side": 1})
+    assert response.status_code == 200
@@ -0,0 +1,48 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+
+
+def make_images(count=32, seed=0):
+    """ภาพหลายขนาด (ขนาดต่างกันทำให้ Haar ที่ใช้ร่วมกันข้าม thread ชนกันได้ง่าย)"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        h, w = rng.integers(300, 900, 2)
+        noise = (rng.random((h, w, 3)) * 255).astype(np.uint8)
+        images.append(cv2.GaussianBlur(noise, (0, 0), 3))
+    return images
+
+
+@pytest.fixture
+def haar(monkeypatch):
+    detector = service.load_haar_detector()
+    monkeypatch.setattr(service, "face_detector", detector)
+    # ใช้หลาย thread เสมอ (DETECT_WORKERS ตามจำนวน core อาจเป็น 1 บนเครื่องทดสอบ)
+    executor = ThreadPoolExecutor(max_workers=8)
+    monkeypatch.setattr(service, "detect_executor", executor)
+    yield detector
+    executor.shutdown()
+
+
+def test_haar_batch_matches_sequential(haar):
+    images = make_images()
+    sequential = [service.detect_faces_coarse_to_fine(img, haar, 0) for img in images]
+    for _ in range(3):
+        assert service.detect_image_batch(images, max_side=0) == sequential
+
+
+def test_haar_batch_endpoint_matches_single_detect(haar):
+    images = [base64.b64encode(cv2.imencode(".png", img)[1]).decode() for img in make_images(16, seed=1)]
+    client = service.app.test_client()
+
+    single = [client.post("/detect", json={"image": image}).get_json()["faces"] for image in images]
+    batch = client.post("/detect/batch", json={"images": images}).get_json()
+
+    assert batch["failed"] == 0
+    assert [result["faces"] for result in batch["results"]] == single
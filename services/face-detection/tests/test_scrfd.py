@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import app as service
+from scrfd import SCRFD, distance2bbox, distance2kps, nms
+
+INPUT_SIZE = 64
+STRIDES = [8, 16, 32]
+
+
+def synthetic_detector():
+    """SCRFD แบบ 3 stride, 2 anchor ต่อจุด และมี keypoints (9 output) โดยไม่ต้องมีไฟล์โมเดล"""
+    detector = SCRFD.__new__(SCRFD)
+    detector.input_size = (INPUT_SIZE, INPUT_SIZE)
+    detector.fmc, detector.strides, detector.num_anchors = 3, STRIDES, 2
+    detector.use_kps = True
+    detector.batched = False
+    detector._center_cache = {}
+    return detector
+
+
+def empty_outputs():
+    counts = [(INPUT_SIZE // stride) ** 2 * 2 for stride in STRIDES]
+    scores = [np.zeros((count, 1), np.float32) for count in counts]
+    boxes = [np.zeros((count, 4), np.float32) for count in counts]
+    kps = [np.zeros((count, 10), np.float32) for count in counts]
+    return scores + boxes + kps
+
+
+def anchor_index(stride, row, col, anchor=0):
+    return (row * (INPUT_SIZE // stride) + col) * 2 + anchor
+
+
+def test_distance_decoding():
+    points = np.array([[10.0, 20.0]], np.float32)
+    np.testing.assert_array_equal(distance2bbox(points, np.array([[1, 2, 3, 4]], np.float32)), [[9, 18, 13, 24]])
+    np.testing.assert_array_equal(distance2kps(points, np.array([[1, -1, 0, 2]], np.float32)), [[[11, 19], [10, 22]]])
+
+
+def test_nms_keeps_highest_score_per_overlapping_group():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60], [0, 0, 10, 10]], np.float32)
+    scores = np.array([0.8, 0.9, 0.7, 0.6], np.float32)
+
+    np.testing.assert_array_equal(nms(boxes, scores, 0.4), [1, 2])
+    np.testing.assert_array_equal(nms(boxes, scores, 0.99), [1, 0, 2])
+
+
+def test_anchor_centers_follow_grid_and_anchor_count():
+    detector = synthetic_detector()
+    centers = detector._anchor_centers(2, 3, 8)
+
+    np.testing.assert_array_equal(centers[:6], [[0, 0], [0, 0], [8, 0], [8, 0], [16, 0], [16, 0]])
+    # แถว 1 คอลัมน์ 2 ของกริดกว้าง 3 ช่อง
+    np.testing.assert_array_equal(centers[(1 * 3 + 2) * 2], [16, 8])
+    assert detector._anchor_centers(2, 3, 8) is centers
+
+
+def test_decode_and_nms_on_synthetic_output():
+    detector = synthetic_detector()
+    outputs = empty_outputs()
+    level8, level16 = 0, 1
+
+    # ใบหน้าแรก: anchor ที่ stride 8 แถว 2 คอลัมน์ 3 (จุดกึ่งกลาง (24, 16)) กล่อง 16x16
+    first = anchor_index(8, 2, 3)
+    outputs[level8][first] = 0.9
+    outputs[level8 + 3][first] = [1, 1, 1, 1]
+    outputs[level8 + 6][first] = [0, 0, 1, 0, -1, 0, 0, 1, 0, -1]
+    # anchor ที่สองของจุดเดียวกันให้กล่องเกือบเหมือนกันแต่คะแนนต่ำกว่า จึงถูกตัดด้วย NMS
+    duplicate = anchor_index(8, 2, 3, anchor=1)
+    outputs[level8][duplicate] = 0.8
+    outputs[level8 + 3][duplicate] = [1, 1, 1.1, 1]
+    # ใบหน้าที่สอง: stride 16 แถว 2 คอลัมน์ 2 (จุดกึ่งกลาง (32, 32)) กล่อง 32x32
+    second = anchor_index(16, 2, 2)
+    outputs[level16][second] = 0.7
+    outputs[level16 + 3][second] = [1, 1, 1, 1]
+    # ต่ำกว่า score_threshold
+    outputs[level8][anchor_index(8, 6, 6)] = 0.3
+
+    faces = detector._postprocess(outputs, 0, scale=0.5, score_threshold=0.5, iou_threshold=0.4, max_faces=0)
+
+    # พิกัดถูกแปลงกลับเป็นภาพต้นฉบับ (scale 0.5 = ภาพต้นฉบับใหญ่กว่า input สองเท่า)
+    assert [face["bbox"] for face in faces] == [[32, 16, 32, 32], [32, 32, 64, 64]]
+    assert [face["confidence"] for face in faces] == pytest.approx([0.9, 0.7])
+    assert faces[0]["landmarks"][:3] == [[48.0, 32.0], [64.0, 32.0], [32.0, 32.0]]
+
+
+def test_decode_respects_max_faces_and_empty_output():
+    detector = synthetic_detector()
+    assert detector._postprocess(empty_outputs(), 0, 1.0, 0.5, 0.4, 0) == []
+
+    outputs = empty_outputs()
+    for col, score in ((0, 0.6), (4, 0.9), (7, 0.8)):
+        index = anchor_index(8, 0, col)
+        outputs[0][index] = score
+        outputs[3][index] = [1, 1, 1, 1]
+
+    faces = detector._postprocess(outputs, 0, 1.0, 0.5, 0.4, max_faces=2)
+    assert [face["confidence"] for face in faces] == pytest.approx([0.9, 0.8])
+
+
+def test_scrfd_is_opt_in_and_reported_in_health(monkeypatch):
+    monkeypatch.setattr(service, "DETECTOR_BACKEND", "haar")
+    monkeypatch.setattr(service, "load_scrfd_detector", lambda: pytest.fail("SCRFD must be opt-in"))
+
+    assert service.load_face_detector()["type"] == "haar"
+    health = service.app.test_client().get("/health").get_json()
+    assert health["detector"] == service.face_detector["type"]
+    assert health["detector_backend"] == "haar"
@@ -0,0 +1,141 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+from tracking import FaceTracker, TrackingSessions, iou_matrix
+
+# ลายสุ่มที่เบลอแล้ว (ย่อขนาดเป็น template ได้โดยไม่เสียรายละเอียดมาก)
+PATCH = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, (60, 60), dtype=np.uint8), (9, 9), 2)
+
+
+def frame(*positions):
+    """ภาพขาวดำ 320x240 ที่มี patch ลายสุ่ม (แทนใบหน้า) ที่ตำแหน่ง (x, y)"""
+    gray = np.full((240, 320), 128, np.uint8)
+    for x, y in positions:
+        gray[y:y + 60, x:x + 60] = PATCH
+    return gray
+
+
+def face(x, y):
+    return {"bbox": [x, y, 60, 60], "confidence": 0.9, "landmarks": [[x + 20.0, y + 25.0]]}
+
+
+def test_iou_matrix():
+    overlaps = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    np.testing.assert_allclose(overlaps, [[1.0, 50 / 150, 0.0]], rtol=1e-6)
+
+
+def test_keyframe_keeps_track_id_for_overlapping_face():
+    tracker = FaceTracker()
+    first = tracker.update([face(50, 50), face(200, 100)], frame((50, 50), (200, 100)))
+    ids = [track["track_id"] for track in first]
+    first[0]["attributes"] = {"gender": "female"}
+
+    # ใบหน้าขยับเล็กน้อยและสลับลำดับจาก detector ต้องได้ id เดิม ส่วนใบหน้าใหม่ได้ id ใหม่
+    second = tracker.update([face(205, 104), face(54, 48), face(120, 170)], frame((205, 104), (54, 48)))
+
+    assert [track["track_id"] for track in second] == [ids[1], ids[0], max(ids) + 1]
+    assert second[1]["attributes"] == {"gender": "female"}
+    assert second[2]["attributes"] is None
+
+
+def test_face_that_disappears_loses_its_track():
+    tracker = FaceTracker()
+    tracker.update([face(50, 50)], frame((50, 50)))
+    tracker.update([], frame())
+    tracks = tracker.update([face(50, 50)], frame((50, 50)))
+
+    assert tracks[0]["track_id"] == 2
+
+
+def test_propagate_follows_moving_face():
+    tracker = FaceTracker()
+    track_id = tracker.update([face(100, 80)], frame((100, 80)))[0]["track_id"]
+
+    tracks = tracker.propagate(frame((108, 74)))
+
+    assert tracks[0]["track_id"] == track_id
+    # template ถูกย่อก่อน matching ตำแหน่งจึงคลาดได้ไม่เกินหนึ่งพิกเซล
+    assert tracks[0]["bbox"][:2] == pytest.approx([108, 74], abs=1)
+    assert tracks[0]["landmarks"][0] == pytest.approx([128.0, 99.0], abs=1)
+    assert tracks[0]["track_score"] > 0.9
+
+
+def test_keyframe_interval_and_low_score_trigger_detection():
+    tracker = FaceTracker()
+    assert tracker.needs_keyframe(3, 0.6)
+
+    tracker.update([face(100, 80)], frame((100, 80)))
+    needed = []
+    for _ in range(3):
+        tracker.frame_index += 1
+        needed.append(tracker.needs_keyframe(3, 0.6))
+        tracker.propagate(frame((100, 80)))
+    assert needed == [False, False, True]
+
+    # ใบหน้าหายไปจากเฟรม: template matching ได้คะแนนต่ำจึงต้องรัน detector ก่อนครบรอบ
+    tracker.update([face(100, 80)], frame((100, 80)))
+    tracker.frame_index += 1
+    tracker.propagate(frame())
+    assert tracker.tracks[0]["track_score"] < 0.6
+    assert tracker.needs_keyframe(100, 0.6)
+
+
+def test_sessions_evict_least_recently_used():
+    sessions = TrackingSessions(ttl=60, max_sessions=2)
+    first, tracker = sessions.get()
+    assert sessions.get(first) == (first, tracker)
+
+    sessions.get("b")
+    sessions.get("c")
+    assert sessions.stats()["sessions"] == 2
+    assert not sessions.close(first)
+    assert sessions.close("c")
+
+
+def test_sessions_expire_after_ttl():
+    sessions = TrackingSessions(ttl=0)
+    session_id, tracker = sessions.get()
+    tracker.last_seen -= 1.0
+
+    assert sessions.get(session_id)[1] is not tracker
+
+
+@pytest.fixture
+def stream_client(monkeypatch):
+    monkeypatch.setattr(service, "run_face_detector", lambda img, detector: [face(100, 80)])
+    client = service.app.test_client()
+    image = base64.b64encode(cv2.imencode(".png", cv2.cvtColor(frame((100, 80)), cv2.COLOR_GRAY2BGR))[1]).decode()
+
+    def post(**params):
+        return client.post("/detect/stream", json=dict({"image": image, "session_id": "test-session"}, **params))
+
+    yield post
+    service.stream_sessions.close("test-session")
+
+
+def test_stream_force_keyframe_parses_string_flags(stream_client):
+    assert stream_client().get_json()["keyframe"] is True
+
+    response = stream_client(force_keyframe="false")
+    assert response.status_code == 200
+    assert response.get_json()["keyframe"] is False
+
+    assert stream_client(force_keyframe="true").get_json()["keyframe"] is True
+    assert stream_client(force_keyframe="maybe").status_code == 400
+
+
+@pytest.mark.parametrize("interval", ["abc", None, 0, -2])
+def test_stream_rejects_bad_keyframe_interval(stream_client, interval):
+    response = stream_client(keyframe_interval=interval)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid parameter")
+
+
+def test_stream_track_id_is_stable_across_frames(stream_client):
+    ids = {stream_client(keyframe_interval=2).get_json()["faces"][0]["track_id"] for _ in range(4)}
+    assert len(ids) == 1
@@ -0,0 +1,174 @@
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU ระหว่างกล่องทุกคู่ในรูปแบบ [x, y, w, h] คืนเมทริกซ์ (len(a), len(b))"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 0:1] + a[:, 2:3], a[:, 1:2] + a[:, 3:4]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class FaceTracker:
+    """ติดตามใบหน้าระหว่าง keyframe ของสตรีมหนึ่ง session
+
+    - keyframe: รับผลจาก detector แล้วจับคู่กับ track เดิมด้วย IoU (track เดิมคง id และ attribute ไว้)
+    - เฟรมระหว่างนั้น: เลื่อนกล่องด้วย template matching ในบริเวณรอบตำแหน่งเดิม (ภาพขาวดำย่อขนาด)
+    """
+
+    def __init__(self, iou_threshold=0.3, template_size=48, search_scale=2.0):
+        self.iou_threshold = iou_threshold
+        self.template_size = template_size
+        self.search_scale = search_scale
+
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.next_id = 1
+        self.frame_index = 0
+        self.last_keyframe = None
+        self.last_seen = time.monotonic()
+
+    def needs_keyframe(self, keyframe_interval, min_track_score):
+        """ต้องรัน detector เต็มเมื่อครบทุก N เฟรม หรือเมื่อมี track ที่ความมั่นใจต่ำกว่าเกณฑ์"""
+        if self.last_keyframe is None or self.frame_index - self.last_keyframe >= keyframe_interval:
+            return True
+        return any(track["track_score"] < min_track_score for track in self.tracks)
+
+    def _template(self, gray, bbox):
+        x, y, w, h = bbox
+        img_h, img_w = gray.shape[:2]
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(img_w, int(x + w)), min(img_h, int(y + h))
+        if x1 - x0 < 4 or y1 - y0 < 4:
+            return None, 1.0
+        scale = min(1.0, self.template_size / max(x1 - x0, y1 - y0))
+        patch = gray[y0:y1, x0:x1]
+        if scale < 1.0:
+            patch = cv2.resize(patch, (max(4, int(patch.shape[1] * scale)), max(4, int(patch.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+        return patch, scale
+
+    def update(self, faces, gray):
+        """keyframe: จับคู่ผลจาก detector กับ track เดิม คืนรายการ track ปัจจุบัน"""
+        self.last_keyframe = self.frame_index
+        previous = self.tracks
+        matched = {}
+
+        if previous and faces:
+            overlaps = iou_matrix([face["bbox"] for face in faces], [track["bbox"] for track in previous])
+            # จับคู่แบบ greedy จากคู่ที่ทับกันมากที่สุดก่อน
+            for flat in np.argsort(-overlaps, axis=None):
+                face_index, track_index = np.unravel_index(flat, overlaps.shape)
+                if overlaps[face_index, track_index] < self.iou_threshold:
+                    break
+                if face_index in matched or track_index in matched.values():
+                    continue
+                matched[int(face_index)] = int(track_index)
+
+        tracks = []
+        for face_index, face in enumerate(faces):
+            if face_index in matched:
+                track = previous[matched[face_index]]
+            else:
+                track = {"track_id": self.next_id, "attributes": None, "first_frame": self.frame_index}
+                self.next_id += 1
+            template, template_scale = self._template(gray, face["bbox"])
+            track.update({
+                "bbox": list(face["bbox"]),
+                "confidence": face["confidence"],
+                "landmarks": face.get("landmarks", []),
+                "track_score": 1.0,
+                "template": template,
+                "template_scale": template_scale
+            })
+            tracks.append(track)
+
+        self.tracks = tracks
+        return self.tracks
+
+    def propagate(self, gray):
+        """เฟรมระหว่าง keyframe: เลื่อนกล่องของแต่ละ track ตามตำแหน่งที่ template ตรงที่สุด"""
+        img_h, img_w = gray.shape[:2]
+        for track in self.tracks:
+            template = track["template"]
+            if template is None:
+                track["track_score"] = 0.0
+                continue
+
+            x, y, w, h = track["bbox"]
+            scale = track["template_scale"]
+            pad_x, pad_y = w * (self.search_scale - 1) / 2, h * (self.search_scale - 1) / 2
+            x0, y0 = max(0, int(x - pad_x)), max(0, int(y - pad_y))
+            x1, y1 = min(img_w, int(x + w + pad_x)), min(img_h, int(y + h + pad_y))
+
+            window = gray[y0:y1, x0:x1]
+            if scale < 1.0 and window.size > 0:
+                window = cv2.resize(window, (max(1, int(window.shape[1] * scale)), max(1, int(window.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+            if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+                track["track_score"] = 0.0
+                continue
+
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, best_score, _, (best_x, best_y) = cv2.minMaxLoc(scores)
+
+            new_x, new_y = x0 + best_x / scale, y0 + best_y / scale
+            dx, dy = new_x - x, new_y - y
+            track["bbox"] = [int(round(new_x)), int(round(new_y)), w, h]
+            track["landmarks"] = [[round(px + dx, 1), round(py + dy, 1)] for px, py in track["landmarks"]]
+            track["track_score"] = float(max(0.0, best_score))
+        return self.tracks
+
+
+class TrackingSessions:
+    """เก็บ FaceTracker ของแต่ละ session และลบ session ที่ไม่ได้ใช้นานเกิน ttl วินาที"""
+
+    def __init__(self, ttl=60.0, max_sessions=256):
+        self.ttl = float(ttl)
+        self.max_sessions = int(max_sessions)
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, session_id=None):
+        """คืนค่า (session_id, tracker) สร้าง session ใหม่ถ้าไม่มี"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            tracker = self._sessions.get(session_id) if session_id else None
+            if tracker is None:
+                session_id = session_id or uuid.uuid4().hex
+                if len(self._sessions) >= self.max_sessions:
+                    # ลบ session ที่ใช้ล่าสุดนานที่สุด
+                    oldest = min(self._sessions, key=lambda key: self._sessions[key].last_seen)
+                    del self._sessions[oldest]
+                tracker = FaceTracker()
+                self._sessions[session_id] = tracker
+            tracker.last_seen = now
+            return session_id, tracker
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self, now):
+        expired = [key for key, tracker in self._sessions.items() if now - tracker.last_seen > self.ttl]
+        for key in expired:
+            del self._sessions[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_s": self.ttl,
+                "tracks": sum(len(tracker.tracks) for tracker in self._sessions.values())
+            }
@@ -1,32 +1,42 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
 import onnxruntime as ort
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from scipy.spatial.distance import cosine
 import json
+from gallery import FaceGallery
+from batching import MicroBatcher
+from embedding_cache import EmbeddingCache, image_digest
+from embedding_store import EmbeddingStore, META_FILE
+from model_manager import ModelManager
+from common.metrics import init_metrics, json_response, observe_batch, stage_timer
+from common.serving import decode_image, request_data, worker_status
 
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "face-recognition")
 
 # โหลดโมเดล
 MODELS = {
     "arcface": {
         "path": os.path.join('models', 'arcface_r100.onnx'),
-        "session": None,
-        "default_weight": 0.33  # เพิ่มน้ำหนักจาก 0.25 เป็น 0.33
+        "default_weight": 0.33,  # เพิ่มน้ำหนักจาก 0.25 เป็น 0.33
+        "session_options": {}
     },
     "adaface": {
         "path": os.path.join('models', 'adaface_ir101_webface12m.onnx'),
-        "session": None,
-        "default_weight": 0.33  # เพิ่มน้ำหนักจาก 0.25 เป็น 0.33
+        "default_weight": 0.33,  # เพิ่มน้ำหนักจาก 0.25 เป็น 0.33
+        "session_options": {}
     },
     "elasticface": {
         "path": os.path.join('models', 'elasticface.onnx'),
-        "session": None,
-        "default_weight": 0.34  # เพิ่มน้ำหนักจาก 0.20 เป็น 0.34
+        "default_weight": 0.34,  # เพิ่มน้ำหนักจาก 0.20 เป็น 0.34
+        "session_options": {}
     }
     # FaceNet ถูกลบออกเนื่องจากไม่มีโมเดล
 }
@@ -34,18 +44,161 @@ MODELS = {
 # โหลดโมเดลที่มีอยู่
 providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
 
+# precision ของโมเดลที่จะโหลด (fp32, fp16, int8) สร้างไฟล์ได้ด้วย quantize_face_recognition_models.py
+# แต่ละโมเดลกำหนดเองได้ด้วย MODELS[name]["precision"] ถ้าไม่พบไฟล์จะถอยกลับไปใช้ fp32
+MODEL_PRECISION = os.environ.get("MODEL_PRECISION", "fp32")
+
+def resolve_model_path(model_info):
+    precision = model_info.get("precision", MODEL_PRECISION)
+    if precision == "fp32":
+        return model_info["path"], "fp32"
+    root, ext = os.path.splitext(model_info["path"])
+    variant = f"{root}_{precision}{ext}"
+    if os.path.exists(variant):
+        return variant, precision
+    print(f"ไม่พบไฟล์โมเดล {precision} ที่ {variant} ใช้ fp32 แทน")
+    return model_info["path"], "fp32"
+
+# รันโมเดลใน ensemble พร้อมกันบน thread pool ขนาดจำกัด
+ENSEMBLE_PARALLEL = os.environ.get("ENSEMBLE_PARALLEL", "1") == "1"
+ENSEMBLE_WORKERS = int(os.environ.get("ENSEMBLE_WORKERS", str(len(MODELS))))
+
+# ค่าเริ่มต้นของ SessionOptions (แต่ละโมเดลเขียนทับได้ใน MODELS[name]["session_options"])
+# เมื่อรันแบบขนาน ให้แบ่งคอร์ให้แต่ละโมเดลเท่า ๆ กัน เพื่อไม่ให้ thread แย่งกันเกินจำนวนคอร์
+DEFAULT_SESSION_OPTIONS = {
+    "intra_op_num_threads": int(os.environ.get(
+        "ORT_INTRA_OP_THREADS",
+        str(max(1, (os.cpu_count() or 1) // len(MODELS)) if ENSEMBLE_PARALLEL else 0)
+    )),
+    "inter_op_num_threads": int(os.environ.get("ORT_INTER_OP_THREADS", "1")),
+    "graph_optimization_level": os.environ.get("ORT_GRAPH_OPTIMIZATION_LEVEL", "all"),
+    "execution_mode": os.environ.get("ORT_EXECUTION_MODE", "sequential")
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL
+}
+
+def build_session_options(model_name):
+    config = dict(DEFAULT_SESSION_OPTIONS)
+    config.update(MODELS[model_name].get("session_options", {}))
+    
+    options = ort.SessionOptions()
+    # 0 หมายถึงให้ ONNX Runtime เลือกจำนวน thread เอง
+    if config["intra_op_num_threads"]:
+        options.intra_op_num_threads = int(config["intra_op_num_threads"])
+    if config["inter_op_num_threads"]:
+        options.inter_op_num_threads = int(config["inter_op_num_threads"])
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[config["graph_optimization_level"]]
+    options.execution_mode = EXECUTION_MODES[config["execution_mode"]]
+    
+    return options, config
+
+def create_session(name, model_path, precision):
+    model_info = MODELS[name]
+    options, config = build_session_options(name)
+    session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+    # โหลดใหม่จากไฟล์ variant อื่น: embedding ใน cache ที่คำนวณระหว่างนั้นอาจมาจากไฟล์เดิม
+    previous = model_info.get("loaded_path")
+    if previous is not None and previous != model_path:
+        embedding_cache.clear()
+    model_info["effective_session_options"] = config
+    model_info["loaded_path"] = model_path
+    model_info["loaded_precision"] = precision
+    print(f"โหลดโมเดล {name} ({precision}) สำเร็จ")
+    return session
+
+# โหลดโมเดลเมื่อถูกใช้ครั้งแรก และปล่อยโมเดลที่ไม่ได้ใช้นานเกิน MODEL_IDLE_TTL_S วินาที (0 = ไม่ปล่อย)
+# MODEL_MEMORY_BUDGET_MB จำกัดขนาดรวมของโมเดลที่โหลดไว้ (0 = ไม่จำกัด)
+# เมื่อ gunicorn preload app ใน master (GUNICORN_PRELOAD=1 จาก services/gunicorn.conf.py) ค่าเริ่มต้นคือโหลดทันทีและไม่ปล่อย
+# เพื่อให้ worker แชร์น้ำหนักโมเดลแบบ copy-on-write (โมเดลที่ worker ปล่อยแล้วโหลดใหม่จะเป็นสำเนาของ worker นั้นเอง)
+GUNICORN_PRELOAD = os.environ.get("GUNICORN_PRELOAD") == "1"
+LAZY_MODEL_LOADING = os.environ.get("LAZY_MODEL_LOADING", "0" if GUNICORN_PRELOAD else "1") == "1"
+MODEL_IDLE_TTL_S = float(os.environ.get("MODEL_IDLE_TTL_S", "0" if GUNICORN_PRELOAD else "900"))
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0"))
+
+model_manager = ModelManager(
+    MODELS,
+    create_session,
+    resolve_fn=lambda name: resolve_model_path(MODELS[name]),
+    idle_ttl=MODEL_IDLE_TTL_S,
+    memory_budget=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024)
+)
+
 def load_available_models():
-    for name, model_info in MODELS.items():
-        if os.path.exists(model_info["path"]):
-            try:
-                model_info["session"] = ort.InferenceSession(model_info["path"], providers=providers)
-                print(f"โหลดโมเดล {name} สำเร็จ")
-            except Exception as e:
-                print(f"ไม่สามารถโหลดโมเดล {name}: {str(e)}")
+    for name in MODELS:
+        if model_manager.available(name):
+            model_manager.get_session(name)
         else:
-            print(f"ไม่พบไฟล์โมเดล {name} ที่ {model_info['path']}")
+            print(f"ไม่พบไฟล์โมเดล {name} ที่ {model_manager.model_path(name)}")
+
+if not LAZY_MODEL_LOADING:
+    load_available_models()
+elif GUNICORN_PRELOAD:
+    print("⚠️ LAZY_MODEL_LOADING=1 ร่วมกับ preload: แต่ละ worker จะโหลดโมเดลของตัวเองเมื่อถูกใช้ครั้งแรก (ไม่แชร์หน่วยความจำ)")
+
+# ค่า threshold เริ่มต้นของ cosine similarity ที่ถือว่าเป็นคนเดียวกัน
+DEFAULT_THRESHOLD = 0.20
+
+# แกลเลอรีสำหรับการค้นหาแบบ 1:N (ใช้ ensemble embedding แบบเดียวกับ /compare)
+gallery = FaceGallery()
 
-load_available_models()
+# แกลเลอรีอยู่ในหน่วยความจำของแต่ละ process จึงรันด้วย 1 worker หลาย thread (WEB_CONCURRENCY=1 ใน docker-compose.yml)
+if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    print("⚠️ WEB_CONCURRENCY > 1: แต่ละ worker มีแกลเลอรีของตัวเอง ใบหน้าที่ enroll ผ่าน worker หนึ่งจะค้นไม่เจอจาก worker อื่น")
+
+# แกลเลอรีขนาดใหญ่บนดิสก์ (เปิดด้วย mmap) สร้างได้ด้วย embedding_store.py
+GALLERY_STORE_DIR = os.environ.get("GALLERY_STORE_DIR", os.path.join('models', 'gallery_store'))
+GALLERY_STORE_RERANK = int(os.environ.get("GALLERY_STORE_RERANK", "100"))
+
+def open_gallery_store():
+    if not os.path.exists(os.path.join(GALLERY_STORE_DIR, META_FILE)):
+        return None
+    try:
+        store = EmbeddingStore(GALLERY_STORE_DIR)
+        print(f"เปิด embedding store {GALLERY_STORE_DIR} ({store.layout}, {len(store)} รายการ) สำเร็จ")
+        return store
+    except Exception as e:
+        print(f"ไม่สามารถเปิด embedding store {GALLERY_STORE_DIR}: {str(e)}")
+        return None
+
+gallery_store = open_gallery_store()
+
+# ตั้งค่า micro-batching: รวมคำขอที่มาถึงภายใน BATCH_MAX_WAIT_MS ให้รันเป็น batch เดียว
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "2"))
+
+batchers = {}
+batchers_lock = threading.Lock()
+
+# โหมด cascade ของ /compare: รันโมเดลตามลำดับ CASCADE_ORDER (ถูกหรือเชื่อถือได้มากก่อน)
+# และเรียกโมเดลถัดไปเฉพาะเมื่อ similarity อยู่ในช่วงกำกวม threshold ± CASCADE_BAND
+CASCADE_ORDER = [name.strip() for name in os.environ.get("CASCADE_ORDER", "arcface,adaface,elasticface").split(",") if name.strip()]
+CASCADE_BAND = float(os.environ.get("CASCADE_BAND", "0.10"))
+
+cascade_stats = {"requests": 0, "models_run": 0, "models_skipped": 0}
+cascade_stats_lock = threading.Lock()
+
+# จำนวนภาพสูงสุดต่อคำขอของ /compare/batch
+MAX_BATCH_COMPARE_IMAGES = int(os.environ.get("MAX_BATCH_COMPARE_IMAGES", "512"))
+
+# cache ของ embedding ตาม hash ของไบต์รูปภาพ + ชุดน้ำหนักโมเดล + ไฟล์โมเดลที่ใช้ (0 = ปิด)
+EMBEDDING_CACHE_MB = float(os.environ.get("EMBEDDING_CACHE_MB", "64"))
+embedding_cache = EmbeddingCache(int(EMBEDDING_CACHE_MB * 1024 * 1024))
+
+# เมื่อเปิด micro-batching แต่ละโมเดลรันบน thread ของ batcher ของตัวเองอยู่แล้ว จึงไม่ใช้ thread pool กลาง
+# (pool ขนาด len(MODELS) จะทำให้คำขอพร้อมกันต้องรอคิวกัน และ batcher ได้รับคำขอทีละคำขอ)
+ensemble_executor = (ThreadPoolExecutor(max_workers=ENSEMBLE_WORKERS, thread_name_prefix="ensemble")
+                     if ENSEMBLE_PARALLEL and not MICRO_BATCHING else None)
 
 def preprocess_face(face_img, target_size=(112, 112)):
     # ปรับขนาดภาพ
@@ -66,110 +219,527 @@ def preprocess_face(face_img, target_size=(112, 112)):
     
     return face_img
 
-def get_embedding(model_name, face_img):
-    model_info = MODELS[model_name]
-    if model_info["session"] is None:
-        return None
+def run_session(model_name, batch):
+    """รัน session ของโมเดลกับ batch แบบ NCHW แล้วคืน output ดิบ (N, D)"""
+    session = model_manager.get_session(model_name)
+    if session is None:
+        raise RuntimeError(f"Model {model_name} is not available")
+    model_input = session.get_inputs()[0]
     
-    # เตรียมรูปภาพ
-    preprocessed = preprocess_face(face_img)
-    
-    # รัน inference
-    input_name = model_info["session"].get_inputs()[0].name
-    embedding = model_info["session"].run(None, {input_name: preprocessed})[0]
+    observe_batch(model_name, batch.shape[0])
+    with stage_timer(model_name, "inference"):
+        # บางโมเดลถูก export มาแบบ batch คงที่ = 1 ต้องรันทีละภาพ
+        if isinstance(model_input.shape[0], int) and model_input.shape[0] == 1 and batch.shape[0] > 1:
+            return np.concatenate(
+                [session.run(None, {model_input.name: batch[i:i + 1]})[0] for i in range(batch.shape[0])],
+                axis=0
+            )
+        return session.run(None, {model_input.name: batch})[0]
+
+def get_batcher(model_name):
+    if not MICRO_BATCHING:
+        return None
+    with batchers_lock:
+        if model_name not in batchers:
+            batchers[model_name] = MicroBatcher(
+                model_name,
+                lambda batch, name=model_name: run_session(name, batch),
+                max_batch_size=BATCH_MAX_SIZE,
+                max_wait_ms=BATCH_MAX_WAIT_MS
+            )
+        return batchers[model_name]
+
+def normalize_embedding(embedding):
+    return embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+
+def run_model(model_name, batch):
+    """รัน inference ของโมเดลกับ batch แบบ NCHW แล้วคืน embedding ที่ normalize แล้ว (N, D)"""
+    batcher = get_batcher(model_name)
+    if batcher is not None:
+        # รวมกับคำขออื่นที่เข้ามาพร้อมกันก่อนส่งเข้า session
+        embedding = batcher.submit(batch)
+    else:
+        embedding = run_session(model_name, batch)
     
     # Normalize embedding
-    embedding = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+    return normalize_embedding(embedding)
+
+def get_embedding(model_name, face_img):
+    if not model_manager.available(model_name):
+        return None
     
-    return embedding
+    return run_model(model_name, preprocess_face(face_img))
 
-def ensemble_face_recognition(face_img, weights=None):
+def normalize_weights(weights=None):
     # ถ้าไม่ได้กำหนด weights ให้ใช้ค่าเริ่มต้น
-    if weights is None:
-        weights = {name: model_info["default_weight"] for name, model_info in MODELS.items() 
-                  if model_info["session"] is not None}
+    if not weights:
+        weights = {name: model_info["default_weight"] for name, model_info in MODELS.items()}
+    
+    # กรองเอาเฉพาะโมเดลที่โหลดได้และมีน้ำหนักมากกว่า 0
+    weights = {k: float(v) for k, v in weights.items()
+               if k in MODELS and model_manager.available(k) and float(v) > 0}
     
     # ทำให้น้ำหนักรวมกันเป็น 1.0
     total_weight = sum(weights.values())
-    if total_weight > 0:
-        normalized_weights = {k: v / total_weight for k, v in weights.items()}
-    else:
+    if total_weight <= 0:
         return None
+    return {k: v / total_weight for k, v in weights.items()}
+
+def embed_faces(face_imgs, weights=None, include_all_models=False):
+    """คำนวณ embedding ของทุกภาพในรอบเดียว
     
-    # คำนวณ embedding จากแต่ละโมเดลและรวมกัน
-    combined_embedding = None
-    embedding_size = None
+    ภาพทั้งหมดถูก preprocess ครั้งเดียวแล้วส่งเข้าแต่ละ session พร้อมกันเป็น batch เดียว
+    คืนค่า dict ที่มี embedding ของแต่ละโมเดล ("models"), ensemble embedding ("ensemble")
+    และน้ำหนักที่ใช้จริง ("weights") หรือ None ถ้าไม่มีโมเดลให้ใช้
+    """
+    normalized_weights = normalize_weights(weights)
+    if normalized_weights is None:
+        return None
     
+    # โมเดลที่โหลดไม่สำเร็จ (เช่นไฟล์เสีย) ถูกข้ามเหมือนโมเดลที่ไม่มีไฟล์ แล้วแบ่งน้ำหนักใหม่ให้โมเดลที่เหลือ
+    loaded_weights = {name: weight for name, weight in normalized_weights.items()
+                      if model_manager.get_session(name) is not None}
+    total_weight = sum(loaded_weights.values())
+    if total_weight <= 0:
+        return None
+    normalized_weights = {name: weight / total_weight for name, weight in loaded_weights.items()}
+    
+    with stage_timer("ensemble", "preprocess"):
+        batch = np.concatenate([preprocess_face(img) for img in face_imgs], axis=0)
+    
+    # รันเฉพาะโมเดลที่มีน้ำหนัก ถ้าต้องการผลแยกรายโมเดลให้รวมโมเดลที่โหลดอยู่แล้วด้วย
+    # (ไม่โหลดโมเดลเพิ่มเพื่อแสดงผลอย่างเดียว หน่วยความจำจะได้เป็นไปตาม traffic จริง)
+    model_names = list(normalized_weights)
+    if include_all_models:
+        model_names += [name for name in MODELS if name not in normalized_weights and model_manager.is_loaded(name)]
+    
+    if MICRO_BATCHING and ENSEMBLE_PARALLEL and len(model_names) > 1:
+        # ส่งเข้า batcher ของทุกโมเดลโดยไม่รอ แล้วค่อยรอผล: แต่ละโมเดลรันพร้อมกันบน thread ของ batcher
+        # และคำขอที่เข้ามาพร้อมกันถูกรวมเป็น batch เดียวกันได้
+        futures = {name: get_batcher(name).submit_async(batch) for name in model_names}
+        model_embeddings = {name: normalize_embedding(future.result()) for name, future in futures.items()}
+    elif ensemble_executor is not None and len(model_names) > 1:
+        # รันแต่ละโมเดลพร้อมกัน แต่ละ session ใช้ thread ตามงบที่แบ่งไว้
+        outputs = ensemble_executor.map(lambda name: run_model(name, batch), model_names)
+        model_embeddings = dict(zip(model_names, outputs))
+    else:
+        model_embeddings = {name: run_model(name, batch) for name in model_names}
+    
+    # รวม embedding ตามน้ำหนักแล้ว normalize อีกครั้ง
+    combined_embedding = None
     for model_name, weight in normalized_weights.items():
-        if weight > 0 and model_name in MODELS and MODELS[model_name]["session"] is not None:
-            embedding = get_embedding(model_name, face_img)
-            if embedding is not None:
-                if combined_embedding is None:
-                    embedding_size = embedding.shape[1]
-                    combined_embedding = np.zeros((1, embedding_size), dtype=np.float32)
-                combined_embedding += embedding * weight
-    
-    # Normalize อีกครั้ง
-    if combined_embedding is not None:
-        combined_embedding = combined_embedding / np.linalg.norm(combined_embedding)
-    
-    return combined_embedding
-
-def decode_base64_image(base64_str):
-    img_data = base64.b64decode(base64_str)
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return img
+        weighted = model_embeddings[model_name] * weight
+        combined_embedding = weighted if combined_embedding is None else combined_embedding + weighted
+    combined_embedding = combined_embedding / np.linalg.norm(combined_embedding, axis=1, keepdims=True)
+    
+    return {
+        "models": model_embeddings,
+        "ensemble": combined_embedding.astype(np.float32),
+        "weights": normalized_weights
+    }
+
+def ensemble_face_recognition(face_img, weights=None):
+    result = embed_faces([face_img], weights)
+    if result is None:
+        return None
+    return result["ensemble"]
+
+def embed_image_bytes(images_bytes, weights=None, include_all_models=False, decoded=None):
+    """เหมือน embed_faces แต่รับไบต์รูปภาพดิบและใช้ embedding cache
+    
+    ภาพที่เจอใน cache จะไม่ถูก decode และไม่ต้องรัน inference ใหม่
+    ภาพซ้ำในคำขอเดียวกันจะถูกคำนวณเพียงครั้งเดียว
+    decoded (dict ตาม hash ของภาพ) ใช้แชร์ภาพที่ decode แล้วระหว่างการเรียกหลายครั้งในคำขอเดียว
+    """
+    normalized_weights = normalize_weights(weights)
+    if normalized_weights is None:
+        return None
+    
+    # key รวมไฟล์และ precision ของแต่ละโมเดลด้วย เพื่อไม่ให้ embedding จาก fp32 กับ int8/fp16 ปนกัน
+    # เมื่อโมเดลถูกโหลดใหม่จากไฟล์ variant อื่น (เช่นหลังถูกปล่อยเพราะ idle หรือเปลี่ยน MODEL_PRECISION)
+    weight_key = (tuple(sorted((k, round(v, 6)) for k, v in normalized_weights.items())), include_all_models,
+                  tuple(model_manager.variant(name) for name in MODELS))
+    keys = [(image_digest(img_bytes), weight_key) for img_bytes in images_bytes]
+    unique_keys = list(dict.fromkeys(keys))
+    
+    entries = {}
+    for key in unique_keys:
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            entries[key] = cached
+    
+    missing = [key for key in unique_keys if key not in entries]
+    bytes_by_key = dict(zip(keys, images_bytes))
+    # คำนวณภาพที่ไม่อยู่ใน cache ทีละก้อนไม่เกิน BATCH_MAX_SIZE ภาพ เพื่อคุมขนาดหน่วยความจำ
+    for chunk_start in range(0, len(missing), BATCH_MAX_SIZE):
+        chunk = missing[chunk_start:chunk_start + BATCH_MAX_SIZE]
+        face_imgs = []
+        for key in chunk:
+            digest = key[0]
+            if decoded is not None and digest in decoded:
+                face_imgs.append(decoded[digest])
+                continue
+            img = decode_image(bytes_by_key[key])
+            if decoded is not None:
+                decoded[digest] = img
+            face_imgs.append(img)
+        result = embed_faces(face_imgs, normalized_weights, include_all_models)
+        if result is None:
+            return None
+        for i, key in enumerate(chunk):
+            # copy เพื่อไม่ให้ cache ถือ batch array ทั้งก้อนไว้
+            entry = {
+                "models": {name: emb[i].copy() for name, emb in result["models"].items()},
+                "ensemble": result["ensemble"][i].copy()
+            }
+            embedding_cache.put(key, entry)
+            entries[key] = entry
+    
+    # ใช้เฉพาะโมเดลที่มีครบทุกภาพ (รายการใน cache อาจถูกคำนวณตอนที่โหลดโมเดลไว้ไม่เท่ากัน)
+    model_names = [name for name in entries[keys[0]]["models"]
+                   if all(name in entries[key]["models"] for key in keys)]
+    return {
+        "models": {name: np.stack([entries[key]["models"][name] for key in keys]) for name in model_names},
+        "ensemble": np.stack([entries[key]["ensemble"] for key in keys]),
+        "weights": normalized_weights
+    }
+
+def image_bytes(value):
+    """ไบต์ของภาพจากคำขอ ซึ่งอาจเป็น bytes (binary) หรือ base64 string"""
+    return base64.b64decode(value) if isinstance(value, str) else value
+
+def cascade_compare(img1_bytes, img2_bytes, weights=None, threshold=DEFAULT_THRESHOLD, band=CASCADE_BAND):
+    """เปรียบเทียบแบบ cascade: เพิ่มโมเดลทีละตัวจนกว่า similarity จะออกนอกช่วงกำกวม
+    
+    similarity ในแต่ละขั้นคำนวณจาก ensemble ของโมเดลที่รันไปแล้ว (ตามน้ำหนักที่ normalize ใหม่)
+    """
+    normalized_weights = normalize_weights(weights)
+    if normalized_weights is None:
+        return None
+    
+    order = [name for name in CASCADE_ORDER if name in normalized_weights]
+    order += [name for name in normalized_weights if name not in order]
+    
+    decoded = {}
+    model_embeddings = {}
+    similarity = None
+    for model_name in order:
+        result = embed_image_bytes([img1_bytes, img2_bytes], {model_name: 1.0}, decoded=decoded)
+        if result is None:
+            continue
+        model_embeddings[model_name] = result["ensemble"]
+        
+        # ensemble ของโมเดลที่รันแล้ว
+        combined = sum(model_embeddings[name] * normalized_weights[name] for name in model_embeddings)
+        combined = combined / np.linalg.norm(combined, axis=1, keepdims=True)
+        similarity = float(np.dot(combined[0], combined[1]))
+        
+        if abs(similarity - threshold) > band:
+            break
+    
+    if similarity is None:
+        return None
+    
+    models_skipped = [name for name in order if name not in model_embeddings]
+    with cascade_stats_lock:
+        cascade_stats["requests"] += 1
+        cascade_stats["models_run"] += len(model_embeddings)
+        cascade_stats["models_skipped"] += len(models_skipped)
+    
+    return {
+        "similarity": similarity,
+        "model_details": {name: float(np.dot(emb[0], emb[1])) for name, emb in model_embeddings.items()},
+        "models_run": list(model_embeddings),
+        "models_skipped": models_skipped
+    }
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    available_models = [name for name in MODELS if model_manager.available(name)]
+    # get_batcher อาจเพิ่ม batcher ระหว่างนี้ จึงคัดลอกรายการภายใต้ lock ก่อน
+    with batchers_lock:
+        active_batchers = dict(batchers)
+    status = {
+        "status": "online" if available_models else "limited",
+        "version": "1.0.0",
+        "models": available_models,
+        "precision": {name: MODELS[name].get("loaded_precision")
+                      for name in MODELS if model_manager.is_loaded(name)},
+        "model_manager": model_manager.stats(),
+        "gallery_size": len(gallery),
+        "gallery_store": gallery_store.stats() if gallery_store is not None else None,
+        "embedding_cache": embedding_cache.stats(),
+        "batching": {
+            "enabled": MICRO_BATCHING,
+            "models": {name: batcher.stats() for name, batcher in active_batchers.items()}
+        },
+        "cascade": dict(cascade_stats, order=CASCADE_ORDER, band=CASCADE_BAND),
+        "ensemble": {
+            "parallel": ENSEMBLE_PARALLEL,
+            "executor": "batchers" if MICRO_BATCHING and ENSEMBLE_PARALLEL else "thread_pool" if ensemble_executor is not None else "sequential",
+            "workers": ENSEMBLE_WORKERS if ensemble_executor is not None else None,
+            "session_options": {name: MODELS[name].get("effective_session_options")
+                                for name in MODELS if model_manager.is_loaded(name)}
+        },
+        "worker": worker_status()
+    }
+    
+    return jsonify(status)
 
 @app.route('/compare', methods=['POST'])
 def compare_faces():
-    data = request.json
+    data = request_data()
     
-    # แปลงรูปภาพจาก base64
+    # แปลง base64 เป็นไบต์ (decode รูปภาพจริงเฉพาะเมื่อไม่เจอใน cache)
     try:
-        img1 = decode_base64_image(data['image1'])
-        img2 = decode_base64_image(data['image2'])
+        img1_bytes = image_bytes(data['image1'])
+        img2_bytes = image_bytes(data['image2'])
     except Exception as e:
         return jsonify({'error': f'Failed to decode images: {str(e)}'}), 400
     
     # ตรวจสอบน้ำหนักโมเดล
     weights = data.get('model_weights', None)
     
-    # กรองเอาเฉพาะโมเดลที่มีอยู่
-    if weights:
-        weights = {k: v for k, v in weights.items() if k in MODELS and MODELS[k]["session"] is not None}
+    # ค่า threshold เริ่มต้น
+    threshold = DEFAULT_THRESHOLD
     
-    # สร้าง embeddings
-    emb1 = ensemble_face_recognition(img1, weights)
-    emb2 = ensemble_face_recognition(img2, weights)
+    # โหมด cascade (เลือกใช้): รันโมเดลเพิ่มเฉพาะคู่ภาพที่ผลยังกำกวม
+    if data.get('mode') == 'cascade':
+        try:
+            band = float(data.get('cascade_band', CASCADE_BAND))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+        if band < 0:
+            return jsonify({'error': 'Invalid parameter: cascade_band must not be negative'}), 400
+        
+        try:
+            cascade = cascade_compare(img1_bytes, img2_bytes, weights, threshold, band)
+        except ValueError as e:
+            return jsonify({'error': f'Failed to decode images: {str(e)}'}), 400
+        
+        if cascade is None:
+            return jsonify({'error': 'Failed to generate embeddings'}), 500
+        
+        similarity = cascade["similarity"]
+        result = {
+            "is_match": bool(similarity >= threshold),
+            "similarity": similarity,
+            "confidence": similarity * 100,
+            "model_details": cascade["model_details"],
+            "mode": "cascade",
+            "cascade_band": band,
+            "models_run": cascade["models_run"],
+            "models_skipped": cascade["models_skipped"]
+        }
+        
+        return json_response(result)
     
-    if emb1 is None or emb2 is None:
+    # สร้าง embeddings ของทั้งสองภาพในรอบเดียว (batch N=2 ต่อโมเดล)
+    try:
+        embeddings = embed_image_bytes([img1_bytes, img2_bytes], weights, include_all_models=True)
+    except ValueError as e:
+        return jsonify({'error': f'Failed to decode images: {str(e)}'}), 400
+    
+    if embeddings is None:
         return jsonify({'error': 'Failed to generate embeddings'}), 500
     
     # คำนวณความเหมือน
-    similarity = float(np.sum(emb1 * emb2))
+    emb = embeddings["ensemble"]
+    similarity = float(np.dot(emb[0], emb[1]))
     
-    # ค่า threshold เริ่มต้น
-    threshold = 0.20
     is_match = similarity >= threshold
     
-    # รวบรวมผลลัพธ์จากแต่ละโมเดล
-    model_details = {}
-    for model_name in MODELS:
-        if MODELS[model_name]["session"] is not None:
-            emb1_single = get_embedding(model_name, img1)
-            emb2_single = get_embedding(model_name, img2)
-            if emb1_single is not None and emb2_single is not None:
-                model_details[model_name] = float(np.sum(emb1_single * emb2_single))
+    # รวบรวมผลลัพธ์จากแต่ละโมเดล (ใช้ embedding ชุดเดียวกันกับ ensemble)
+    model_details = {
+        model_name: float(np.dot(model_emb[0], model_emb[1]))
+        for model_name, model_emb in embeddings["models"].items()
+    }
     
     result = {
         "is_match": bool(is_match),
         "similarity": similarity,
         "confidence": similarity * 100,
-        "model_details": model_details
+        "model_details": model_details,
+        "mode": "ensemble",
+        "models_run": list(embeddings["models"])
+    }
+    
+    return json_response(result)
+
+@app.route('/compare/batch', methods=['POST'])
+def compare_faces_batch():
+    """เปรียบเทียบภาพ probe หนึ่งภาพ (หรือหลายภาพ) กับ candidate หลายภาพในคำขอเดียว
+    
+    รับ "probe" (ภาพเดียว) หรือ "probes" (รายการ) และ "candidates" (รายการ) เป็น base64
+    ภาพที่ซ้ำกันจะถูกคำนวณ embedding เพียงครั้งเดียว และ similarity matrix ได้จาก GEMM ครั้งเดียว
+    """
+    data = request_data(list_fields=('probes', 'candidates'))
+    
+    probes = data.get('probes')
+    if probes is None and data.get('probe') is not None:
+        probes = [data['probe']]
+    candidates = data.get('candidates')
+    
+    if not probes or not candidates:
+        return jsonify({'error': 'probe(s) and candidates are required'}), 400
+    if len(probes) + len(candidates) > MAX_BATCH_COMPARE_IMAGES:
+        return jsonify({'error': f'Too many images (max {MAX_BATCH_COMPARE_IMAGES})'}), 400
+    
+    # แปลง base64 เป็นไบต์
+    try:
+        images_bytes = [image_bytes(img) for img in probes + candidates]
+    except Exception as e:
+        return jsonify({'error': f'Failed to decode images: {str(e)}'}), 400
+    
+    weights = data.get('model_weights', None)
+    
+    try:
+        threshold = float(data.get('threshold', DEFAULT_THRESHOLD))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    
+    try:
+        embeddings = embed_image_bytes(images_bytes, weights)
+    except ValueError as e:
+        return jsonify({'error': f'Failed to decode images: {str(e)}'}), 400
+    
+    if embeddings is None:
+        return jsonify({'error': 'Failed to generate embeddings'}), 500
+    
+    # similarity matrix ขนาด (probes x candidates) จากการคูณเมทริกซ์ครั้งเดียว
+    emb = embeddings["ensemble"]
+    similarity_matrix = emb[:len(probes)] @ emb[len(probes):].T
+    
+    result = {
+        "similarity_matrix": similarity_matrix.tolist(),
+        "match_matrix": (similarity_matrix >= threshold).tolist(),
+        "threshold": threshold,
+        "shape": [len(probes), len(candidates)]
     }
     
-    return jsonify(result)
+    # กรณี probe เดียว ส่งผลรายตัวพร้อมลำดับที่ดีที่สุดให้ใช้ง่าย
+    if len(probes) == 1:
+        scores = similarity_matrix[0]
+        result["results"] = [
+            {
+                "index": int(i),
+                "similarity": float(scores[i]),
+                "confidence": float(scores[i]) * 100,
+                "is_match": bool(scores[i] >= threshold)
+            }
+            for i in range(len(candidates))
+        ]
+        result["best_index"] = int(np.argmax(scores))
+    
+    return json_response(result)
+
+@app.route('/enroll', methods=['POST'])
+def enroll_face():
+    data = request_data()
+
+    person_id = data.get('person_id')
+    if not person_id:
+        return jsonify({'error': 'No person_id provided'}), 400
+
+    try:
+        img_bytes = image_bytes(data['image'])
+    except Exception as e:
+        return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
+
+    try:
+        embeddings = embed_image_bytes([img_bytes])
+    except ValueError as e:
+        return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
+
+    if embeddings is None:
+        return jsonify({'error': 'Failed to generate embedding'}), 500
+    embedding = embeddings["ensemble"][0]
+
+    try:
+        replaced = gallery.add(str(person_id), embedding)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        "person_id": str(person_id),
+        "replaced": replaced,
+        "gallery_size": len(gallery)
+    })
+
+@app.route('/enroll/<path:person_id>', methods=['DELETE'])
+def unenroll_face(person_id):
+    # ลบได้เฉพาะแกลเลอรีในหน่วยความจำ (embedding store บนดิสก์สร้างใหม่ด้วย embedding_store.py)
+    if not gallery.remove(person_id):
+        return jsonify({'error': f'person_id {person_id} is not enrolled'}), 404
+
+    return jsonify({
+        "person_id": person_id,
+        "removed": True,
+        "gallery_size": len(gallery)
+    })
+
+@app.route('/identify', methods=['POST'])
+def identify_face():
+    data = request_data()
+
+    try:
+        top_k = int(data.get('top_k', 5))
+        threshold = float(data.get('threshold', DEFAULT_THRESHOLD))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    if top_k <= 0:
+        return jsonify({'error': 'Invalid parameter: top_k must be positive'}), 400
+
+    try:
+        img_bytes = image_bytes(data['image'])
+    except Exception as e:
+        return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
+
+    try:
+        embeddings = embed_image_bytes([img_bytes])
+    except ValueError as e:
+        return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
+
+    if embeddings is None:
+        return jsonify({'error': 'Failed to generate embedding'}), 500
+    embedding = embeddings["ensemble"][0]
+
+    try:
+        with stage_timer("gallery", "search"):
+            matches = [(person_id, similarity, "gallery") for person_id, similarity in gallery.search(embedding, top_k=top_k)]
+            if gallery_store is not None:
+                matches += [(person_id, similarity, "store")
+                            for person_id, similarity in gallery_store.search(embedding, top_k=top_k, rerank=GALLERY_STORE_RERANK)]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # รวมผลจากแกลเลอรีในหน่วยความจำกับ store บนดิสก์ (ถ้ามี) แล้วเลือก top-k
+    # person_id ที่อยู่ทั้งสองแหล่งเหลือรายการเดียว (คะแนนสูงสุด) เพื่อไม่ให้กินที่ของคนอื่นใน top-k
+    best_matches = {}
+    for match in matches:
+        if match[0] not in best_matches or match[1] > best_matches[match[0]][1]:
+            best_matches[match[0]] = match
+    matches = sorted(best_matches.values(), key=lambda match: match[1], reverse=True)[:top_k]
+
+    candidates = [
+        {
+            "person_id": person_id,
+            "similarity": similarity,
+            "confidence": similarity * 100,
+            "is_match": bool(similarity >= threshold),
+            "source": source
+        }
+        for person_id, similarity, source in matches
+    ]
+
+    best = candidates[0] if candidates and candidates[0]["is_match"] else None
+
+    return json_response({
+        "match": best,
+        "candidates": candidates,
+        "threshold": threshold,
+        "gallery_size": len(gallery) + (len(gallery_store) if gallery_store is not None else 0)
+    })
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("batch", "future", "enqueued_at")
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """รวมคำขอที่เข้ามาใกล้เคียงกันให้เป็น batch เดียวก่อนส่งเข้า session
+
+    คำขอที่มาถึงภายใน max_wait_ms หลังคำขอแรก (หรือจนครบ max_batch_size แถว)
+    จะถูกต่อกันเป็น NCHW batch เดียว รันครั้งเดียว แล้วแยกผลกลับไปให้แต่ละคำขอ
+    """
+
+    def __init__(self, name, run_fn, max_batch_size=32, max_wait_ms=2.0):
+        self.name = name
+        self._run_fn = run_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        # ตัวชี้วัดสำหรับปรับจูน throughput กับ latency
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._rows = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self._batch_size_histogram = {}
+
+    def _ensure_worker(self):
+        # สร้าง thread เมื่อใช้งานครั้งแรก (และสร้างใหม่ถ้า thread หายไป เช่นหลัง fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit_async(self, batch):
+        """ส่ง batch (N, C, H, W) เข้าคิวโดยไม่รอ คืน Future ของผลลัพธ์ (N, ...)"""
+        self._ensure_worker()
+        request = _Request(batch)
+        self._queue.put(request)
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return request.future
+
+    def submit(self, batch):
+        """ส่ง batch (N, C, H, W) เข้าคิวแล้วรอผลลัพธ์ (N, ...)"""
+        return self.submit_async(batch).result()
+
+    def _next_request(self, timeout=None):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        if timeout is None:
+            return self._queue.get()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_request()
+        requests = [first]
+        rows = first.batch.shape[0]
+        deadline = time.monotonic() + self.max_wait
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._next_request(timeout=remaining)
+            except queue.Empty:
+                break
+            # ถ้าใส่แล้วเกินขนาด batch ให้เก็บไว้เป็นคำขอแรกของรอบถัดไป
+            if rows + request.batch.shape[0] > self.max_batch_size:
+                self._carry = request
+                break
+            requests.append(request)
+            rows += request.batch.shape[0]
+
+        return requests, rows
+
+    def _worker(self):
+        while True:
+            requests, rows = self._collect()
+            started_at = time.monotonic()
+
+            try:
+                if len(requests) == 1:
+                    outputs = [self._run_fn(requests[0].batch)]
+                else:
+                    merged = np.concatenate([r.batch for r in requests], axis=0)
+                    result = self._run_fn(merged)
+                    offsets = np.cumsum([r.batch.shape[0] for r in requests])[:-1]
+                    outputs = np.split(result, offsets, axis=0)
+                for request, output in zip(requests, outputs):
+                    request.future.set_result(output)
+            except Exception as e:
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+            finished_at = time.monotonic()
+            with self._stats_lock:
+                self._requests += len(requests)
+                self._batches += 1
+                self._rows += rows
+                self._total_wait += sum(started_at - r.enqueued_at for r in requests)
+                self._total_run += finished_at - started_at
+                self._batch_size_histogram[rows] = self._batch_size_histogram.get(rows, 0) + 1
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize() + (1 if self._carry is not None else 0),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "batches": batches,
+                "rows": self._rows,
+                "avg_batch_size": self._rows / batches if batches else 0.0,
+                "avg_requests_per_batch": self._requests / batches if batches else 0.0,
+                "avg_queue_wait_ms": self._total_wait / self._requests * 1000.0 if self._requests else 0.0,
+                "avg_run_ms": self._total_run / batches * 1000.0 if batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_size_histogram.items())}
+            }
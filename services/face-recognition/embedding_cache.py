@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def image_digest(img_bytes):
+    """คืนค่า hash ของไบต์รูปภาพดิบ ใช้เป็นส่วนหนึ่งของ key ใน cache"""
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache ของ embedding แบบ LRU ที่จำกัดขนาดตามจำนวนไบต์
+
+    value คือ dict ของ numpy array (เช่น embedding รายโมเดลและ ensemble)
+    ขนาดของแต่ละรายการคิดจากผลรวม nbytes ของ array ทั้งหมด
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _entry_size(value):
+        size = 0
+        for item in value.values():
+            if isinstance(item, dict):
+                size += sum(array.nbytes for array in item.values())
+            else:
+                size += item.nbytes
+        return size
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = self._entry_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            # ลบรายการที่ใช้ล่าสุดนานที่สุดจนกว่าขนาดรวมจะไม่เกินงบ
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
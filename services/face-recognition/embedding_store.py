@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+META_FILE = "meta.json"
+IDS_FILE = "ids.npy"
+FULL_FILE = "vectors_f32.npy"
+FLOAT16_FILE = "vectors_f16.npy"
+CODES_FILE = "pq_codes.npy"
+CODEBOOKS_FILE = "pq_codebooks.npy"
+
+LAYOUTS = ("float16", "pq")
+
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _train_kmeans(samples, ksub, iterations, rng):
+    """k-means แบบ Lloyd สำหรับ subspace เดียว คืน centroid (ksub, dsub)"""
+    centroids = samples[rng.choice(samples.shape[0], ksub, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (
+            np.sum(samples ** 2, axis=1, keepdims=True)
+            - 2.0 * samples @ centroids.T
+            + np.sum(centroids ** 2, axis=1)
+        )
+        assignment = np.argmin(distances, axis=1)
+        counts = np.bincount(assignment, minlength=ksub)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, samples)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # cluster ที่ว่างให้สุ่มจุดใหม่
+        if not filled.all():
+            centroids[~filled] = samples[rng.choice(samples.shape[0], int((~filled).sum()))]
+    return centroids
+
+
+def _encode_pq(vectors, codebooks):
+    m, _, dsub = codebooks.shape
+    codes = np.empty((vectors.shape[0], m), dtype=np.uint8)
+    for i in range(m):
+        sub = vectors[:, i * dsub:(i + 1) * dsub]
+        distances = -2.0 * sub @ codebooks[i].T + np.sum(codebooks[i] ** 2, axis=1)
+        codes[:, i] = np.argmin(distances, axis=1)
+    return codes
+
+
+def build_store(directory, ids, vectors, layout="pq", m=64, ksub=256, train_size=65536,
+                train_iterations=20, chunk_size=65536, seed=0):
+    """เขียน embedding store ลงดิสก์ในรูปแบบที่เปิดด้วย mmap ได้ทันที
+
+    ทุกไฟล์เป็น .npy ขนาดคงที่ (รวมถึง id) จึงไม่ต้อง deserialize อะไรตอนเปิด
+    vectors ถูก normalize และเก็บแบบ float32 ไว้สำหรับ re-rank ด้วยเสมอ
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if len(ids) != count:
+        raise ValueError("ids and vectors must have the same length")
+    os.makedirs(directory, exist_ok=True)
+
+    encoded_ids = np.array([str(i).encode("utf-8") for i in ids])
+    np.save(os.path.join(directory, IDS_FILE), encoded_ids)
+
+    full = np.lib.format.open_memmap(os.path.join(directory, FULL_FILE), mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, chunk_size):
+        full[start:start + chunk_size] = _normalize_rows(vectors[start:start + chunk_size])
+    full.flush()
+
+    meta = {"layout": layout, "count": int(count), "dim": int(dim)}
+
+    if layout == "float16":
+        compact = np.lib.format.open_memmap(os.path.join(directory, FLOAT16_FILE), mode="w+", dtype=np.float16, shape=(count, dim))
+        for start in range(0, count, chunk_size):
+            compact[start:start + chunk_size] = full[start:start + chunk_size].astype(np.float16)
+        compact.flush()
+    else:
+        if dim % m != 0:
+            raise ValueError(f"Dimension {dim} is not divisible by m={m}")
+        dsub = dim // m
+        ksub = int(min(ksub, 256, count))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(full[np.sort(rng.choice(count, min(train_size, count), replace=False))])
+
+        codebooks = np.stack([
+            _train_kmeans(sample[:, i * dsub:(i + 1) * dsub], ksub, train_iterations, rng)
+            for i in range(m)
+        ]).astype(np.float32)
+        np.save(os.path.join(directory, CODEBOOKS_FILE), codebooks)
+
+        codes = np.lib.format.open_memmap(os.path.join(directory, CODES_FILE), mode="w+", dtype=np.uint8, shape=(count, m))
+        for start in range(0, count, chunk_size):
+            codes[start:start + chunk_size] = _encode_pq(np.asarray(full[start:start + chunk_size]), codebooks)
+        codes.flush()
+        meta.update({"m": int(m), "ksub": int(ksub), "dsub": int(dsub)})
+
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f)
+
+    return meta
+
+
+class EmbeddingStore:
+    """embedding store บนดิสก์ที่เปิดด้วย mmap (อ่านอย่างเดียว)
+
+    ค้นหาแบบหยาบบนข้อมูลที่บีบอัด (float16 หรือ PQ ด้วย asymmetric distance computation)
+    แล้ว re-rank ผู้สมัครอันดับต้น ๆ ด้วยเวกเตอร์ float32 เต็มความละเอียด
+    """
+
+    def __init__(self, directory, chunk_size=262144):
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.directory = directory
+        self.layout = self.meta["layout"]
+        self.dim = self.meta["dim"]
+        self.chunk_size = chunk_size
+
+        self._ids = np.load(os.path.join(directory, IDS_FILE), mmap_mode="r")
+        self._full = np.load(os.path.join(directory, FULL_FILE), mmap_mode="r")
+        if self.layout == "float16":
+            self._compact = np.load(os.path.join(directory, FLOAT16_FILE), mmap_mode="r")
+        else:
+            self._compact = np.load(os.path.join(directory, CODES_FILE), mmap_mode="r")
+            self._codebooks = np.load(os.path.join(directory, CODEBOOKS_FILE))
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def _approximate_scores(self, probe, start, stop):
+        if self.layout == "float16":
+            return np.asarray(self._compact[start:stop], dtype=np.float32) @ probe
+
+        # ADC: inner product ของ probe กับทุก centroid ในแต่ละ subspace แล้วรวมตาม code
+        m, _, dsub = self._codebooks.shape
+        lookup = np.einsum("mkd,md->mk", self._codebooks, probe.reshape(m, dsub))
+        codes = np.asarray(self._compact[start:stop])
+        return lookup[np.arange(m), codes].sum(axis=1)
+
+    def search(self, probe, top_k=5, rerank=100):
+        """คืนค่ารายการ (id, similarity) เรียงจากมากไปน้อย"""
+        count = len(self)
+        if count == 0:
+            return []
+        probe = np.asarray(probe, dtype=np.float32).reshape(-1)
+        if probe.shape[0] != self.dim:
+            raise ValueError(f"Probe dimension {probe.shape[0]} does not match store dimension {self.dim}")
+        probe = probe / np.linalg.norm(probe)
+
+        shortlist_size = min(count, max(int(top_k), int(rerank)))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        # สแกนทีละ chunk เพื่อไม่ให้ต้องโหลดข้อมูลทั้งก้อนเข้าหน่วยความจำ
+        for start in range(0, count, self.chunk_size):
+            stop = min(start + self.chunk_size, count)
+            scores = self._approximate_scores(probe, start, stop)
+            rows = np.arange(start, stop)
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores.astype(np.float32)])
+            if best_rows.shape[0] > shortlist_size:
+                keep = np.argpartition(-best_scores, shortlist_size - 1)[:shortlist_size]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        # re-rank ด้วยเวกเตอร์ float32 (อ่านจาก mmap เฉพาะแถวที่ต้องใช้)
+        best_rows = np.sort(best_rows)
+        exact = np.asarray(self._full[best_rows]) @ probe
+        top_k = max(1, min(int(top_k), best_rows.shape[0]))
+        order = np.argsort(-exact)[:top_k]
+
+        return [(self._ids[best_rows[i]].decode("utf-8"), float(exact[i])) for i in order]
+
+    def stats(self):
+        return dict(self.meta, directory=self.directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="สร้าง embedding store จากไฟล์ .npy ของ embedding และไฟล์ id (บรรทัดละหนึ่ง id)")
+    parser.add_argument("--vectors", required=True)
+    parser.add_argument("--ids", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--layout", choices=LAYOUTS, default="pq")
+    parser.add_argument("--m", type=int, default=64, help="จำนวน subspace ของ PQ")
+    parser.add_argument("--ksub", type=int, default=256, help="จำนวน centroid ต่อ subspace (สูงสุด 256)")
+    args = parser.parse_args()
+
+    vectors = np.load(args.vectors, mmap_mode="r")
+    with open(args.ids) as f:
+        ids = [line.rstrip("\n") for line in f]
+
+    meta = build_store(args.output, ids, vectors, layout=args.layout, m=args.m, ksub=args.ksub)
+    print(f"✅ สร้าง embedding store สำเร็จ: {args.output} {meta}")
+
+
+if __name__ == "__main__":
+    main()
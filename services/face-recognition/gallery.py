@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+
+
+class FaceGallery:
+    """แกลเลอรีใบหน้าในหน่วยความจำ สำหรับค้นหาแบบ 1:N
+
+    เก็บ embedding ทั้งหมดเป็นเมทริกซ์ float32 ก้อนเดียวที่ normalize แล้ว
+    ทำให้การค้นหาเป็นแค่การคูณเมทริกซ์กับเวกเตอร์ครั้งเดียว แล้วเลือก top-k
+    """
+
+    def __init__(self, dim=None, initial_capacity=1024):
+        self._lock = threading.Lock()
+        self._dim = dim
+        self._capacity = initial_capacity
+        self._matrix = None
+        self._ids = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def _ensure_capacity(self, needed):
+        # ขยายเมทริกซ์แบบเท่าตัว เพื่อไม่ต้อง copy ทุกครั้งที่ enroll
+        if self._matrix is None:
+            self._capacity = max(self._capacity, needed)
+            self._matrix = np.zeros((self._capacity, self._dim), dtype=np.float32)
+            return
+        if needed <= self._matrix.shape[0]:
+            return
+        new_capacity = self._matrix.shape[0]
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_matrix = np.zeros((new_capacity, self._dim), dtype=np.float32)
+        new_matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = new_matrix
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            raise ValueError("Embedding has zero norm")
+        return embedding / norm
+
+    def add(self, person_id, embedding):
+        """เพิ่มหรือแทนที่ embedding ของ person_id คืนค่า True ถ้าเป็นการแทนที่"""
+        embedding = self._normalize(embedding)
+        with self._lock:
+            if self._dim is None:
+                self._dim = embedding.shape[0]
+            elif embedding.shape[0] != self._dim:
+                raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match gallery dimension {self._dim}")
+
+            if person_id in self._index:
+                self._matrix[self._index[person_id]] = embedding
+                return True
+
+            row = len(self._ids)
+            self._ensure_capacity(row + 1)
+            self._matrix[row] = embedding
+            self._ids.append(person_id)
+            self._index[person_id] = row
+            return False
+
+    def remove(self, person_id):
+        """ลบ person_id ออกจากแกลเลอรี โดยย้ายแถวสุดท้ายมาแทนที่"""
+        with self._lock:
+            row = self._index.pop(person_id, None)
+            if row is None:
+                return False
+            last = len(self._ids) - 1
+            if row != last:
+                last_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = last_id
+                self._index[last_id] = row
+            self._ids.pop()
+            return True
+
+    def search(self, probe, top_k=5):
+        """คืนค่ารายการ (person_id, similarity) ที่ใกล้เคียงที่สุด เรียงจากมากไปน้อย"""
+        probe = self._normalize(probe)
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return []
+            if probe.shape[0] != self._dim:
+                raise ValueError(f"Probe dimension {probe.shape[0]} does not match gallery dimension {self._dim}")
+
+            # cosine similarity กับทุกคนในแกลเลอรีด้วย matrix-vector product ครั้งเดียว
+            scores = self._matrix[:count] @ probe
+
+            top_k = max(1, min(int(top_k), count))
+            if top_k < count:
+                candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                candidates = np.arange(count)
+            order = candidates[np.argsort(-scores[candidates])]
+
+            return [(self._ids[i], float(scores[i])) for i in order]
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+
+
+class ModelManager:
+    """จัดการ session ของโมเดลแบบ lazy
+
+    - โหลด session เมื่อถูกใช้ครั้งแรก และบันทึกเวลาที่ใช้โหลด
+    - ปล่อย session ที่ไม่ได้ใช้นานเกิน idle_ttl วินาที (0 = ไม่ปล่อย)
+    - จำกัดหน่วยความจำรวมของโมเดลที่โหลดไว้ (ประมาณจากขนาดไฟล์) ถ้าเกินจะปล่อยโมเดลที่ใช้ล่าสุดนานที่สุด
+
+    resolve_fn(name) คืน (path, precision) ของไฟล์ที่จะโหลดจริง (เช่น variant fp16/int8)
+    ไฟล์นี้ใช้ทั้งตรวจว่าโมเดลพร้อมใช้และประมาณหน่วยความจำ แล้วส่งให้ load_fn(name, path, precision)
+    """
+
+    def __init__(self, models, load_fn, resolve_fn=None, idle_ttl=0, memory_budget=0):
+        self._models = models
+        self._load_fn = load_fn
+        self._resolve_fn = resolve_fn or (lambda name: (models[name]["path"], None))
+        self.idle_ttl = float(idle_ttl)
+        self.memory_budget = int(memory_budget)
+
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in models}
+        self._state = {
+            name: {
+                "session": None,
+                "path": None,
+                "precision": None,
+                "failed": False,
+                "size_bytes": 0,
+                "reserved_bytes": 0,
+                "last_used": None,
+                "load_time": None,
+                "loads": 0,
+                "unloads": 0
+            }
+            for name in models
+        }
+        self._reaper = None
+        for name in models:
+            self._resolve(name)
+
+    def _resolve(self, name):
+        path, precision = self._resolve_fn(name)
+        with self._lock:
+            self._state[name]["path"] = path
+            self._state[name]["precision"] = precision
+
+    def available(self, name):
+        """โมเดลพร้อมใช้ถ้ามีไฟล์และยังไม่เคยโหลดล้มเหลว (ไม่จำเป็นต้องโหลดอยู่)"""
+        state = self._state.get(name)
+        if state is None or state["failed"]:
+            return False
+        return state["session"] is not None or os.path.exists(state["path"])
+
+    def model_path(self, name):
+        """path ของไฟล์โมเดลที่เลือกไว้ (รวม variant fp16/int8 ถ้ามี)"""
+        return self._state[name]["path"]
+
+    def variant(self, name):
+        """(path, precision) ของไฟล์ที่เลือกไว้ ใช้แยกผลของโมเดลเดียวกันที่โหลดจากไฟล์ต่างกัน"""
+        state = self._state[name]
+        return state["path"], state["precision"]
+
+    def is_loaded(self, name):
+        return self._state[name]["session"] is not None
+
+    def get_session(self, name):
+        """คืน session ของโมเดล (โหลดถ้ายังไม่ได้โหลด) หรือ None ถ้าโหลดไม่ได้"""
+        self._ensure_reaper()
+        state = self._state[name]
+
+        session = state["session"]
+        if session is not None:
+            state["last_used"] = time.monotonic()
+            return session
+
+        if not self.available(name):
+            return None
+
+        with self._load_locks[name]:
+            # อาจมี thread อื่นโหลดเสร็จไปแล้วระหว่างรอ lock
+            if state["session"] is not None:
+                state["last_used"] = time.monotonic()
+                return state["session"]
+
+            # เลือกไฟล์ใหม่ทุกครั้งที่โหลด เผื่อมีไฟล์ variant ถูกสร้างหลังจาก service เริ่ม
+            self._resolve(name)
+            if not os.path.exists(state["path"]):
+                return None
+            size_bytes = os.path.getsize(state["path"])
+            for victim in self._reserve(name, size_bytes):
+                self.unload(victim, reason="memory budget")
+
+            started_at = time.perf_counter()
+            try:
+                session = self._load_fn(name, state["path"], state["precision"])
+            except Exception as e:
+                print(f"ไม่สามารถโหลดโมเดล {name}: {str(e)}")
+                with self._lock:
+                    state["failed"] = True
+                    state["reserved_bytes"] = 0
+                return None
+            load_time = time.perf_counter() - started_at
+
+            with self._lock:
+                state["session"] = session
+                state["size_bytes"] = size_bytes
+                state["reserved_bytes"] = 0
+                state["load_time"] = load_time
+                state["last_used"] = time.monotonic()
+                state["loads"] += 1
+            print(f"โหลดโมเดล {name} ใช้เวลา {load_time:.2f} วินาที")
+            return session
+
+    def unload(self, name, reason="manual"):
+        with self._lock:
+            state = self._state[name]
+            if state["session"] is None:
+                return False
+            # session ที่กำลังรันอยู่ยังถูกอ้างอิงโดยผู้เรียก จึงปล่อยได้อย่างปลอดภัย
+            state["session"] = None
+            state["size_bytes"] = 0
+            state["unloads"] += 1
+        print(f"ปล่อยโมเดล {name} ({reason})")
+        return True
+
+    def loaded_bytes(self):
+        return sum(state["size_bytes"] + state["reserved_bytes"] for state in self._state.values())
+
+    def _reserve(self, name, size_bytes):
+        """จองพื้นที่สำหรับโมเดลที่กำลังจะโหลด แล้วคืนรายชื่อโมเดลที่ต้องปล่อยเพื่อไม่ให้เกินงบ"""
+        with self._lock:
+            self._state[name]["reserved_bytes"] = size_bytes
+            if self.memory_budget <= 0:
+                return []
+
+            victims = []
+            used = self.loaded_bytes()
+            candidates = sorted(
+                (state["last_used"], other) for other, state in self._state.items()
+                if other != name and state["session"] is not None
+            )
+            for _, other in candidates:
+                if used <= self.memory_budget:
+                    break
+                victims.append(other)
+                used -= self._state[other]["size_bytes"]
+
+            if used > self.memory_budget:
+                print(f"โมเดล {name} ทำให้เกินงบหน่วยความจำ {self.memory_budget} ไบต์ แต่ยังคงโหลด")
+            return victims
+
+    def unload_idle(self):
+        if self.idle_ttl <= 0:
+            return []
+        now = time.monotonic()
+        idle = [name for name, state in self._state.items()
+                if state["session"] is not None and now - state["last_used"] > self.idle_ttl]
+        for name in idle:
+            self.unload(name, reason=f"idle > {self.idle_ttl:.0f}s")
+        return idle
+
+    def _ensure_reaper(self):
+        # สร้าง thread ตรวจโมเดลที่ idle เมื่อใช้งานครั้งแรก (และสร้างใหม่ถ้าหายไปหลัง fork)
+        if self.idle_ttl <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name="model-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, self.idle_ttl / 4.0)
+        while True:
+            time.sleep(interval)
+            self.unload_idle()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "idle_ttl_s": self.idle_ttl,
+            "memory_budget_bytes": self.memory_budget,
+            "loaded_bytes": self.loaded_bytes(),
+            "models": {
+                name: {
+                    "available": self.available(name),
+                    "loaded": state["session"] is not None,
+                    "path": state["path"],
+                    "precision": state["precision"],
+                    "size_bytes": state["size_bytes"],
+                    "load_time_s": state["load_time"],
+                    "idle_s": now - state["last_used"] if state["last_used"] is not None else None,
+                    "loads": state["loads"],
+                    "unloads": state["unloads"]
+                }
+                for name, state in self._state.items()
+            }
+        }
@@ -0,0 +1,68 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+
+# ข้อมูลที่ไม่ใช่ภาพ: base64 ที่ถอดแล้วว่างเปล่า และไบต์ที่ไม่ใช่ไฟล์ภาพ
+BAD_IMAGES = ["!!!", "", base64.b64encode(b"not an image").decode()]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # ภาพที่เสียต้องถูกปฏิเสธตอน decode ก่อนถึง inference จึงไม่ต้องมีไฟล์โมเดลจริง
+    monkeypatch.setattr(service, "normalize_weights", lambda weights=None: {"arcface": 1.0})
+    service.embedding_cache.clear()
+    return service.app.test_client()
+
+
+@pytest.mark.parametrize("bad_image", BAD_IMAGES)
+@pytest.mark.parametrize("mode", ["ensemble", "cascade"])
+def test_compare_rejects_bad_image(client, bad_image, mode):
+    _, encoded = cv2.imencode(".png", np.zeros((112, 112, 3), np.uint8))
+    valid_image = base64.b64encode(encoded.tobytes()).decode()
+    response = client.post("/compare", json={"image1": valid_image, "image2": bad_image, "mode": mode})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("bad_image", BAD_IMAGES)
+def test_enroll_rejects_bad_image(client, bad_image):
+    response = client.post("/enroll", json={"person_id": "alice", "image": bad_image})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("bad_image", BAD_IMAGES)
+def test_identify_rejects_bad_image(client, bad_image):
+    response = client.post("/identify", json={"image": bad_image})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_binary_upload_rejects_empty_body(client):
+    response = client.post("/identify", data=b"", content_type="application/octet-stream")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("params", [{"top_k": "abc"}, {"top_k": None}, {"top_k": 0}, {"top_k": -1}, {"threshold": "high"}])
+def test_identify_rejects_bad_parameters(client, params):
+    response = client.post("/identify", json=dict({"image": "!!!"}, **params))
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid parameter")
+
+
+@pytest.mark.parametrize("threshold", ["high", None, [0.5]])
+def test_compare_batch_rejects_bad_threshold(client, threshold):
+    response = client.post("/compare/batch", json={"probe": "!!!", "candidates": ["!!!"], "threshold": threshold})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid parameter")
+
+
+@pytest.mark.parametrize("band", ["wide", None, -0.1])
+def test_compare_rejects_bad_cascade_band(client, band):
+    response = client.post("/compare", json={"image1": "!!!", "image2": "!!!", "mode": "cascade", "cascade_band": band})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid parameter")
@@ -0,0 +1,144 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def rows(first, count):
+    """batch (count, 1, 1, 1) ที่แต่ละแถวมีค่าเป็นหมายเลขแถว เพื่อตรวจว่าผลกลับไปถูกคำขอ"""
+    return np.arange(first, first + count, dtype=np.float32).reshape(count, 1, 1, 1)
+
+
+def submit_concurrently(batcher, batches):
+    barrier = threading.Barrier(len(batches))
+
+    def submit(batch):
+        barrier.wait()
+        return batcher.submit(batch)
+
+    with ThreadPoolExecutor(len(batches)) as pool:
+        return list(pool.map(submit, batches))
+
+
+def test_concurrent_requests_are_merged_and_scattered_in_order():
+    run_sizes = []
+
+    def run(batch):
+        run_sizes.append(batch.shape[0])
+        return batch.reshape(batch.shape[0], -1) * 10
+
+    batcher = MicroBatcher("test", run, max_batch_size=32, max_wait_ms=200)
+    batches = [rows(0, 1), rows(100, 3), rows(200, 2), rows(300, 1)]
+
+    outputs = submit_concurrently(batcher, batches)
+
+    for batch, output in zip(batches, outputs):
+        np.testing.assert_array_equal(output, batch.reshape(batch.shape[0], -1) * 10)
+    assert sum(run_sizes) == 7
+    assert len(run_sizes) < len(batches)
+    assert batcher.stats()["requests"] == 4
+
+
+def test_batch_never_exceeds_max_size():
+    run_sizes = []
+
+    def run(batch):
+        run_sizes.append(batch.shape[0])
+        return batch.reshape(batch.shape[0], -1)
+
+    batcher = MicroBatcher("test", run, max_batch_size=4, max_wait_ms=100)
+    batches = [rows(i * 10, 3) for i in range(4)]
+
+    outputs = submit_concurrently(batcher, batches)
+
+    # คำขอที่ใส่ไม่พอดีถูกเก็บไว้เป็นคำขอแรกของรอบถัดไป ไม่ถูกแบ่งหรือทิ้ง
+    assert max(run_sizes) <= 4
+    assert sum(run_sizes) == 12
+    for batch, output in zip(batches, outputs):
+        np.testing.assert_array_equal(output, batch.reshape(3, -1))
+
+
+def test_run_error_is_raised_in_every_merged_request():
+    def run(batch):
+        raise RuntimeError("session failed")
+
+    batcher = MicroBatcher("test", run, max_batch_size=32, max_wait_ms=100)
+
+    barrier = threading.Barrier(3)
+
+    def submit(batch):
+        barrier.wait()
+        try:
+            batcher.submit(batch)
+        except RuntimeError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(3) as pool:
+        errors = list(pool.map(submit, [rows(0, 1)] * 3))
+
+    assert errors == ["session failed"] * 3
+
+
+def test_worker_keeps_running_after_an_error():
+    failures = iter([True, False])
+
+    def run(batch):
+        if next(failures):
+            raise RuntimeError("session failed")
+        return batch.reshape(batch.shape[0], -1)
+
+    batcher = MicroBatcher("test", run, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(rows(0, 1))
+    np.testing.assert_array_equal(batcher.submit(rows(5, 1)), [[5.0]])
+
+
+def test_concurrent_ensemble_requests_share_batches_and_run_models_in_parallel(monkeypatch):
+    import app as service
+
+    models = ["arcface", "adaface", "elasticface"]
+    run_sizes = {name: [] for name in models}
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def run_session(name, batch):
+        with lock:
+            active.append(name)
+            run_sizes[name].append(batch.shape[0])
+            overlaps.append(len(active))
+        # ค้างไว้ครู่หนึ่งเพื่อให้เห็นว่าโมเดลอื่นรันซ้อนกันได้
+        threading.Event().wait(0.05)
+        with lock:
+            active.remove(name)
+        return np.ones((batch.shape[0], 4), np.float32)
+
+    monkeypatch.setattr(service, "MICRO_BATCHING", True)
+    monkeypatch.setattr(service, "ENSEMBLE_PARALLEL", True)
+    monkeypatch.setattr(service, "BATCH_MAX_WAIT_MS", 100)
+    monkeypatch.setattr(service, "batchers", {})
+    monkeypatch.setattr(service, "run_session", run_session)
+    monkeypatch.setattr(service.model_manager, "get_session", lambda name: object())
+    monkeypatch.setattr(service, "normalize_weights", lambda weights=None: {name: 1.0 / 3 for name in models})
+
+    barrier = threading.Barrier(8)
+    face = np.zeros((112, 112, 3), np.uint8)
+
+    def embed(_):
+        barrier.wait()
+        return service.embed_faces([face])
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(embed, range(8)))
+
+    assert all(result["ensemble"].shape == (1, 4) for result in results)
+    for name in models:
+        # คำขอพร้อมกัน 8 คำขอถูกรวมเป็น batch ใหญ่ ไม่ใช่รันทีละคำขอ
+        assert sum(run_sizes[name]) == 8
+        assert max(run_sizes[name]) > 1
+    # ทั้งสามโมเดลรันซ้อนกันอย่างน้อยหนึ่งครั้ง
+    assert max(overlaps) == len(models)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import app as service
+
+THRESHOLD = 0.5
+BAND = 0.2
+ORDER = ["arcface", "adaface", "elasticface"]
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    """ทุกโมเดลให้ similarity เท่ากันตามที่กำหนด ensemble ของโมเดลที่รันแล้วจึงมี similarity เท่าเดิม"""
+    calls = []
+
+    def run(similarity):
+        pair = np.array([[1.0, 0.0], [similarity, np.sqrt(1.0 - similarity ** 2)]], dtype=np.float32)
+
+        def embed(images_bytes, weights=None, include_all_models=False, decoded=None):
+            calls.append(list(weights))
+            return {"ensemble": pair, "models": {}, "weights": weights}
+
+        monkeypatch.setattr(service, "embed_image_bytes", embed)
+        return service.cascade_compare(b"1", b"2", threshold=THRESHOLD, band=BAND)
+
+    monkeypatch.setattr(service, "CASCADE_ORDER", ORDER)
+    monkeypatch.setattr(service, "normalize_weights", lambda weights=None: {name: 1.0 / 3 for name in ORDER})
+    return run, calls
+
+
+@pytest.mark.parametrize("similarity, models_run", [
+    (THRESHOLD + BAND + 0.01, 1),   # เหนือช่วงกำกวม: ตัดสินได้จากโมเดลแรก
+    (THRESHOLD + BAND - 0.01, 3),   # อยู่ในช่วงกำกวม: รันครบทุกโมเดล
+    (THRESHOLD, 3),
+    (THRESHOLD - BAND + 0.01, 3),
+    (THRESHOLD - BAND - 0.01, 1)    # ต่ำกว่าช่วงกำกวม: ตัดสินได้จากโมเดลแรก
+])
+def test_cascade_exits_outside_band(cascade, similarity, models_run):
+    run, calls = cascade
+    result = run(similarity)
+
+    assert result["models_run"] == ORDER[:models_run]
+    assert result["models_skipped"] == ORDER[models_run:]
+    assert calls == [[name] for name in ORDER[:models_run]]
+    assert result["similarity"] == pytest.approx(similarity, abs=1e-5)
+
+
+def test_cascade_counts_run_and_skipped_models(cascade, monkeypatch):
+    run, _ = cascade
+    monkeypatch.setattr(service, "cascade_stats", {"requests": 0, "models_run": 0, "models_skipped": 0})
+
+    run(0.9)
+    run(0.5)
+
+    assert service.cascade_stats == {"requests": 2, "models_run": 4, "models_skipped": 2}
+
+
+def test_cascade_appends_models_not_in_order(cascade, monkeypatch):
+    run, _ = cascade
+    monkeypatch.setattr(service, "CASCADE_ORDER", ["adaface"])
+
+    result = run(0.5)
+
+    # โมเดลที่ไม่อยู่ใน CASCADE_ORDER รันต่อท้ายตามลำดับของน้ำหนัก
+    assert result["models_run"] == ["adaface", "arcface", "elasticface"]
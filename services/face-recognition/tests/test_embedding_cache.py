@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+import app as service
+from embedding_cache import EmbeddingCache
+
+
+def entry(nbytes, value=0.0):
+    return {"ensemble": np.full(nbytes // 4, value, dtype=np.float32)}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(max_bytes=300)
+    cache.put("a", entry(100))
+    cache.put("b", entry(100))
+    cache.put("c", entry(100))
+
+    # ใช้ "a" ล่าสุด เมื่อเพิ่ม "d" จึงลบ "b"
+    assert cache.get("a") is not None
+    cache.put("d", entry(100))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 300
+
+
+def test_entry_size_counts_nested_model_embeddings():
+    cache = EmbeddingCache(max_bytes=1000)
+    cache.put("a", {"models": {"arcface": np.zeros(50, np.float32), "adaface": np.zeros(50, np.float32)},
+                    "ensemble": np.zeros(50, np.float32)})
+
+    assert cache.stats()["bytes"] == 600
+
+
+def test_oversized_entry_is_not_stored_and_disabled_cache_is_a_no_op():
+    cache = EmbeddingCache(max_bytes=100)
+    cache.put("a", entry(200))
+    assert cache.get("a") is None
+
+    disabled = EmbeddingCache(max_bytes=0)
+    disabled.put("a", entry(4))
+    assert disabled.get("a") is None
+    assert disabled.stats()["misses"] == 0
+
+
+def test_replacing_a_key_does_not_double_count_bytes():
+    cache = EmbeddingCache(max_bytes=1000)
+    cache.put("a", entry(100, 1.0))
+    cache.put("a", entry(200, 2.0))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 200
+    assert cache.get("a")["ensemble"][0] == 2.0
+
+
+@pytest.fixture
+def counting_embed(monkeypatch):
+    calls = []
+
+    def normalize_weights(weights=None):
+        weights = weights or {"arcface": 1.0}
+        total = sum(weights.values())
+        return {name: value / total for name, value in weights.items()}
+
+    def embed_faces(face_imgs, weights=None, include_all_models=False):
+        calls.append(dict(weights))
+        embeddings = np.ones((len(face_imgs), 4), np.float32) / 2.0
+        return {"models": {name: embeddings for name in weights}, "ensemble": embeddings, "weights": weights}
+
+    monkeypatch.setattr(service, "normalize_weights", normalize_weights)
+    monkeypatch.setattr(service, "embed_faces", embed_faces)
+    monkeypatch.setattr(service, "decode_image", lambda value: np.zeros((8, 8, 3), np.uint8))
+    monkeypatch.setattr(service, "embedding_cache", EmbeddingCache(1024 * 1024))
+    return calls
+
+
+def test_cache_keys_are_separated_by_weights(counting_embed):
+    service.embed_image_bytes([b"image"], {"arcface": 1.0})
+    service.embed_image_bytes([b"image"], {"arcface": 3.0})
+    assert len(counting_embed) == 1
+
+    # น้ำหนักต่างกันให้ ensemble ต่างกัน จึงต้องคำนวณใหม่
+    service.embed_image_bytes([b"image"], {"arcface": 1.0, "adaface": 1.0})
+    service.embed_image_bytes([b"image"], {"arcface": 1.0, "adaface": 3.0})
+    assert len(counting_embed) == 3
+    assert counting_embed[1] == {"arcface": 0.5, "adaface": 0.5}
+
+
+def test_duplicate_images_in_one_request_are_embedded_once(counting_embed):
+    result = service.embed_image_bytes([b"a", b"b", b"a"])
+
+    assert len(counting_embed) == 1
+    assert result["ensemble"].shape == (3, 4)
+    assert service.embedding_cache.stats()["entries"] == 2
+
+
+def test_cache_keys_are_separated_by_model_variant(counting_embed, monkeypatch):
+    variants = {name: (f"models/{name}.onnx", "fp32") for name in service.MODELS}
+    monkeypatch.setattr(service.model_manager, "variant", lambda name: variants[name])
+
+    service.embed_image_bytes([b"image"], {"arcface": 1.0})
+    # โมเดลถูกโหลดใหม่จากไฟล์ int8 หลังถูกปล่อย: ต้องไม่ใช้ embedding ของ fp32 ที่อยู่ใน cache
+    variants["arcface"] = ("models/arcface_int8.onnx", "int8")
+    service.embed_image_bytes([b"image"], {"arcface": 1.0})
+    service.embed_image_bytes([b"image"], {"arcface": 1.0})
+
+    assert len(counting_embed) == 2
+
+
+def test_reloading_a_model_from_another_file_clears_the_cache(monkeypatch):
+    monkeypatch.setattr(service.ort, "InferenceSession", lambda path, sess_options=None, providers=None: object())
+    monkeypatch.setitem(service.MODELS, "arcface", dict(service.MODELS["arcface"]))
+    monkeypatch.setattr(service, "embedding_cache", EmbeddingCache(1024 * 1024))
+
+    service.create_session("arcface", "models/arcface.onnx", "fp32")
+    service.embedding_cache.put("a", entry(100))
+    service.create_session("arcface", "models/arcface.onnx", "fp32")
+    assert service.embedding_cache.get("a") is not None
+
+    service.create_session("arcface", "models/arcface_int8.onnx", "int8")
+    assert service.embedding_cache.get("a") is None
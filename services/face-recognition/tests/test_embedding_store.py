@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, build_store
+
+COUNT = 2000
+DIM = 32
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    # embedding แบบมีกลุ่ม (ใกล้เคียงกับใบหน้าหลายภาพของคนเดียวกัน) และ probe ที่เป็นภาพใหม่ของคนในแกลเลอรี
+    centers = rng.normal(size=(200, DIM))
+    vectors = (centers[rng.integers(0, 200, COUNT)] + 0.3 * rng.normal(size=(COUNT, DIM))).astype(np.float32)
+    probes = (vectors[rng.choice(COUNT, 50, replace=False)] + 0.2 * rng.normal(size=(50, DIM))).astype(np.float32)
+    ids = [f"person-{i}" for i in range(COUNT)]
+    return ids, vectors, probes
+
+
+def exact_top_k(vectors, probe, top_k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (probe / np.linalg.norm(probe))
+    return [f"person-{i}" for i in np.argsort(-scores)[:top_k]]
+
+
+def recall(store, vectors, probes, top_k=10, rerank=100):
+    hits = 0
+    for probe in probes:
+        found = {person_id for person_id, _ in store.search(probe, top_k=top_k, rerank=rerank)}
+        hits += len(found & set(exact_top_k(vectors, probe, top_k)))
+    return hits / (top_k * len(probes))
+
+
+@pytest.mark.parametrize("layout", ["pq", "float16"])
+def test_recall_against_exact_search(tmp_path, data, layout):
+    ids, vectors, probes = data
+    build_store(str(tmp_path), ids, vectors, layout=layout, m=8, ksub=64, train_iterations=10)
+    store = EmbeddingStore(str(tmp_path), chunk_size=512)
+
+    assert len(store) == COUNT
+    assert recall(store, vectors, probes) >= 0.95
+
+
+def test_pq_adc_scores_match_reconstructed_vectors(tmp_path, data):
+    ids, vectors, probes = data
+    build_store(str(tmp_path), ids, vectors, layout="pq", m=8, ksub=64, train_iterations=10)
+    store = EmbeddingStore(str(tmp_path))
+
+    probe = probes[0] / np.linalg.norm(probes[0])
+    codes = np.asarray(store._compact[:100])
+    m, _, dsub = store._codebooks.shape
+    reconstructed = np.concatenate([store._codebooks[i][codes[:, i]] for i in range(m)], axis=1)
+
+    np.testing.assert_allclose(store._approximate_scores(probe, 0, 100), reconstructed @ probe, rtol=1e-4, atol=1e-5)
+
+
+def test_search_returns_exact_similarity_in_descending_order(tmp_path, data):
+    ids, vectors, probes = data
+    build_store(str(tmp_path), ids, vectors, layout="pq", m=8, ksub=64, train_iterations=10)
+    store = EmbeddingStore(str(tmp_path), chunk_size=256)
+
+    matches = store.search(vectors[7], top_k=5)
+
+    assert matches[0][0] == "person-7"
+    assert matches[0][1] == pytest.approx(1.0, abs=1e-5)
+    scores = [similarity for _, similarity in matches]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_probe_dimension_mismatch(tmp_path, data):
+    ids, vectors, _ = data
+    build_store(str(tmp_path), ids[:10], vectors[:10], layout="float16")
+
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path)).search(np.ones(DIM + 1, np.float32))
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+import app as service
+from gallery import FaceGallery
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def gallery():
+    gallery = FaceGallery(initial_capacity=2)
+    gallery.add("a", [1.0, 0.0, 0.0])
+    gallery.add("b", [0.8, 0.6, 0.0])
+    gallery.add("c", [0.0, 1.0, 0.0])
+    gallery.add("d", [0.0, 0.0, 1.0])
+    return gallery
+
+
+def test_search_returns_top_k_by_similarity(gallery):
+    matches = gallery.search([1.0, 0.1, 0.0], top_k=3)
+
+    assert [person_id for person_id, _ in matches] == ["a", "b", "c"]
+    scores = [similarity for _, similarity in matches]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == pytest.approx(float(unit(1.0, 0.1, 0.0) @ unit(1.0, 0.0, 0.0)))
+
+
+def test_search_matches_exact_ranking():
+    rng = np.random.default_rng(0)
+    big = FaceGallery(initial_capacity=4)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    for i, vector in enumerate(vectors):
+        big.add(str(i), vector)
+    probe = rng.normal(size=16).astype(np.float32)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (probe / np.linalg.norm(probe))))[:10]
+
+    assert [person_id for person_id, _ in big.search(probe, top_k=10)] == [str(i) for i in expected]
+
+
+def test_top_k_is_clamped_to_gallery_size(gallery):
+    assert len(gallery.search([1.0, 0.0, 0.0], top_k=100)) == 4
+    assert len(gallery.search([1.0, 0.0, 0.0], top_k=0)) == 1
+
+
+def test_add_replaces_existing_person(gallery):
+    assert gallery.add("a", [0.0, 0.0, 1.0]) is True
+    assert len(gallery) == 4
+    assert gallery.search([0.0, 0.0, 1.0], top_k=2)[0][1] == pytest.approx(1.0)
+
+
+def test_remove_moves_last_row_and_keeps_results_consistent(gallery):
+    assert gallery.remove("a") is True
+    assert gallery.remove("a") is False
+    assert len(gallery) == 3
+
+    # "d" (แถวสุดท้าย) ถูกย้ายมาแทนแถวของ "a" ต้องยังค้นเจอด้วย similarity เดิม
+    person_id, similarity = gallery.search([0.0, 0.0, 1.0], top_k=1)[0]
+    assert person_id == "d"
+    assert similarity == pytest.approx(1.0)
+    assert "a" not in [person_id for person_id, _ in gallery.search([1.0, 0.0, 0.0], top_k=3)]
+
+    gallery.add("e", [1.0, 0.0, 0.0])
+    assert gallery.search([1.0, 0.0, 0.0], top_k=1)[0][0] == "e"
+
+
+def test_empty_gallery_and_dimension_mismatch():
+    gallery = FaceGallery()
+    assert gallery.search([1.0, 0.0]) == []
+
+    gallery.add("a", [1.0, 0.0])
+    with pytest.raises(ValueError):
+        gallery.add("b", [1.0, 0.0, 0.0])
+    with pytest.raises(ValueError):
+        gallery.search([1.0, 0.0, 0.0])
+    with pytest.raises(ValueError):
+        gallery.add("c", [0.0, 0.0])
+
+
+class FakeStore:
+    """embedding store ที่มี "a" ซ้ำกับแกลเลอรีในหน่วยความจำ (คะแนนสูงกว่า) และ "e" ที่มีเฉพาะใน store"""
+
+    def search(self, probe, top_k=5, rerank=100):
+        return [("a", 0.999), ("e", 0.5)][:top_k]
+
+    def __len__(self):
+        return 2
+
+
+@pytest.fixture
+def client(gallery, monkeypatch):
+    probe = np.array([[1.0, 0.1, 0.0]], np.float32)
+    monkeypatch.setattr(service, "gallery", gallery)
+    monkeypatch.setattr(service, "gallery_store", None)
+    monkeypatch.setattr(service, "embed_image_bytes", lambda images_bytes, weights=None: {"ensemble": probe})
+    return service.app.test_client()
+
+
+def test_identify_merges_duplicate_person_ids_keeping_best_score(client, monkeypatch):
+    monkeypatch.setattr(service, "gallery_store", FakeStore())
+
+    response = client.post("/identify", json={"image": "aW1hZ2U=", "top_k": 3})
+
+    candidates = response.get_json()["candidates"]
+    assert [(c["person_id"], c["source"]) for c in candidates] == [("a", "store"), ("b", "gallery"), ("e", "store")]
+    assert candidates[0]["similarity"] == pytest.approx(0.999)
+
+
+def test_unenroll_removes_person_from_identify(client):
+    assert client.delete("/enroll/a").get_json() == {"person_id": "a", "removed": True, "gallery_size": 3}
+    assert client.delete("/enroll/a").status_code == 404
+
+    candidates = client.post("/identify", json={"image": "aW1hZ2U="}).get_json()["candidates"]
+    assert "a" not in [c["person_id"] for c in candidates]
+
+
+def test_unenroll_accepts_person_id_with_slash(client, gallery):
+    gallery.add("team/alice", [1.0, 1.0, 0.0])
+
+    response = client.delete("/enroll/team%2Falice")
+
+    assert response.status_code == 200
+    assert response.get_json()["person_id"] == "team/alice"
@@ -0,0 +1,69 @@
+import base64
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+from embedding_cache import EmbeddingCache
+from model_manager import ModelManager
+
+
+class FakeSession:
+    """session ที่คืน one-hot embedding ตามลำดับของโมเดล"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input", shape=["batch", 3, 112, 112])]
+
+    def run(self, outputs, feeds):
+        batch = feeds["input"]
+        embedding = np.zeros((batch.shape[0], 4), np.float32)
+        embedding[:, self.index] = 1.0
+        return [embedding]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """ทุกโมเดลมีไฟล์ แต่ elasticface โหลดไม่สำเร็จตอนถูกใช้ครั้งแรก"""
+    models = {}
+    for name in service.MODELS:
+        (tmp_path / f"{name}.onnx").write_bytes(b"x")
+        models[name] = {"path": str(tmp_path / f"{name}.onnx")}
+
+    def load(name, path, precision):
+        if name == "elasticface":
+            raise RuntimeError("corrupt model file")
+        return FakeSession(list(service.MODELS).index(name))
+
+    monkeypatch.setattr(service, "model_manager", ModelManager(models, load))
+    monkeypatch.setattr(service, "MICRO_BATCHING", False)
+    monkeypatch.setattr(service, "ensemble_executor", None)
+    monkeypatch.setattr(service, "embedding_cache", EmbeddingCache(1024 * 1024))
+    return service.app.test_client()
+
+
+def image():
+    return base64.b64encode(cv2.imencode(".png", np.zeros((112, 112, 3), np.uint8))[1].tobytes()).decode()
+
+
+def test_model_that_fails_to_load_is_skipped(client):
+    response = client.post("/compare", json={"image1": image(), "image2": image()})
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["models_run"] == ["arcface", "adaface"]
+    assert result["similarity"] == pytest.approx(1.0)
+    assert not service.model_manager.available("elasticface")
+
+
+def test_all_models_failing_to_load_returns_json_error(client, monkeypatch):
+    monkeypatch.setattr(service.model_manager, "_load_fn", lambda name, path, precision: 1 / 0)
+
+    response = client.post("/identify", json={"image": image()})
+
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "Failed to generate embedding"}
@@ -0,0 +1,58 @@
+import pytest
+
+import app as service
+from model_manager import ModelManager
+
+
+@pytest.fixture
+def int8(monkeypatch):
+    monkeypatch.setattr(service, "MODEL_PRECISION", "int8")
+
+
+def resolve_variant(models):
+    """resolve_fn แบบเดียวกับที่ app ส่งให้ ModelManager"""
+    return lambda name: service.resolve_model_path(models[name])
+
+
+def test_resolve_model_path_prefers_existing_variant(tmp_path, int8):
+    (tmp_path / "arcface_int8.onnx").write_bytes(b"x")
+
+    assert service.resolve_model_path({"path": str(tmp_path / "arcface.onnx")}) == (str(tmp_path / "arcface_int8.onnx"), "int8")
+    assert service.resolve_model_path({"path": str(tmp_path / "adaface.onnx")}) == (str(tmp_path / "adaface.onnx"), "fp32")
+    # precision ของแต่ละโมเดลเขียนทับค่าของ MODEL_PRECISION
+    assert service.resolve_model_path({"path": str(tmp_path / "arcface.onnx"), "precision": "fp32"}) == (str(tmp_path / "arcface.onnx"), "fp32")
+
+
+def test_uses_resolved_variant_for_availability_and_size(tmp_path, int8):
+    models = {"arcface": {"path": str(tmp_path / "arcface.onnx")}}
+    (tmp_path / "arcface_int8.onnx").write_bytes(b"x" * 100)
+    loaded = []
+    manager = ModelManager(models, lambda name, path, precision: loaded.append((path, precision)) or object(),
+                           resolve_fn=resolve_variant(models))
+
+    # มีเฉพาะไฟล์ int8 (ไม่มี fp32)
+    assert manager.available("arcface")
+    assert manager.get_session("arcface") is not None
+    assert loaded == [(str(tmp_path / "arcface_int8.onnx"), "int8")]
+    assert manager.loaded_bytes() == 100
+
+
+def test_falls_back_to_fp32_file(tmp_path, int8):
+    models = {"arcface": {"path": str(tmp_path / "arcface.onnx")}}
+    (tmp_path / "arcface.onnx").write_bytes(b"x" * 400)
+    manager = ModelManager(models, lambda name, path, precision: object(),
+                           resolve_fn=resolve_variant(models))
+
+    assert manager.available("arcface")
+    manager.get_session("arcface")
+    assert manager.stats()["models"]["arcface"]["precision"] == "fp32"
+    assert manager.loaded_bytes() == 400
+
+
+def test_missing_model_is_unavailable(tmp_path, int8):
+    models = {"arcface": {"path": str(tmp_path / "arcface.onnx")}}
+    manager = ModelManager(models, lambda name, path, precision: object(),
+                           resolve_fn=resolve_variant(models))
+
+    assert not manager.available("arcface")
+    assert manager.get_session("arcface") is None
@@ -1,8 +1,8 @@
 import React, { useRef, useEffect, useState } from "react";
 import Webcam from "react-webcam";
-import axios from "axios";
 
 const API_URL = "http://localhost:8000";
+const WS_URL = API_URL.replace(/^http/, "ws");
 
 const RealtimeFaceAnalysis = () => {
   const webcamRef = useRef(null);
@@ -13,12 +13,12 @@ const RealtimeFaceAnalysis = () => {
   const [fps, setFps] = useState(0);
   const [status, setStatus] = useState("กำลังเริ่มต้น...");
 
-  // เก็บเวลาที่ใช้ในการประมวลผลแต่ละเฟรม
-  const [processingTimes, setProcessingTimes] = useState([]);
+  // เวลาที่ได้รับผลตรวจจับล่าสุด ใช้คำนวณ FPS จากอัตราที่ผลกลับมาจริง (เฟรมที่ gateway ข้ามไปจึงไม่ถูกนับ)
+  const resultTimesRef = useRef([]);
 
-  // จำกัดระยะเวลาการส่ง API requests (ส่งทุกๆ 300ms)
-  const API_THROTTLE = 300;
-  const lastApiCallRef = useRef(0);
+  // WebSocket ของการวิเคราะห์แบบสตรีม (gateway ประมวลผลเฉพาะเฟรมล่าสุดและส่งผลกลับเมื่อพร้อม)
+  const socketRef = useRef(null);
+  const lastSecurityRef = useRef({});
 
   const videoConstraints = {
     width: 640,
@@ -61,12 +61,12 @@ const RealtimeFaceAnalysis = () => {
         ctx.fillText(`อายุ: ${face.age} ปี`, x + width + 10, y + 40);
       }
 
-      // แสดงผลการตรวจสอบความปลอดภัย (จากข้อมูล analysisResults)
-      if (analysisResults.liveness) {
-        const liveStatus = analysisResults.liveness.is_live
+      // แสดงผลการตรวจสอบความปลอดภัย (ผลล่าสุดของ keyframe)
+      if (results.liveness) {
+        const liveStatus = results.liveness.is_live
           ? "มีชีวิต ✓"
           : "ไม่มีชีวิต ✗";
-        const liveColor = analysisResults.liveness.is_live
+        const liveColor = results.liveness.is_live
           ? "#00FF00"
           : "#FF0000";
         ctx.fillStyle = liveColor;
@@ -74,11 +74,11 @@ const RealtimeFaceAnalysis = () => {
         ctx.fillStyle = "#FFFFFF";
       }
 
-      if (analysisResults.deepfake) {
-        const deepfakeStatus = analysisResults.deepfake.is_fake
+      if (results.deepfake) {
+        const deepfakeStatus = results.deepfake.is_fake
           ? "ภาพปลอม ✗"
           : "ภาพจริง ✓";
-        const deepfakeColor = !analysisResults.deepfake.is_fake
+        const deepfakeColor = !results.deepfake.is_fake
           ? "#00FF00"
           : "#FF0000";
         ctx.fillStyle = deepfakeColor;
@@ -94,91 +94,96 @@ const RealtimeFaceAnalysis = () => {
     });
   };
 
-  // ตรวจจับใบหน้าจากเฟรมปัจจุบัน
-  const detectFaces = async (frameData) => {
-    try {
-      const now = Date.now();
-      if (now - lastApiCallRef.current < API_THROTTLE) return;
+  // รับผลจาก gateway (ผลตรวจจับของแต่ละเฟรม และผลตรวจความปลอดภัยของ keyframe แยกกัน)
+  const handleMessage = (event) => {
+    const message = JSON.parse(event.data);
 
-      lastApiCallRef.current = now;
-      setStatus("กำลังวิเคราะห์...");
+    if (message.type === "security") {
+      lastSecurityRef.current = message;
+      return;
+    }
 
-      const startTime = performance.now();
+    if (message.type === "error") {
+      console.error("Error analyzing frame:", message.error);
+      setStatus("เกิดข้อผิดพลาด");
+      return;
+    }
 
-      // ส่งเฟรมไปตรวจจับใบหน้า
-      const detectResponse = await axios.post(
-        `${API_URL}/api/v1/face-detection`,
-        {
-          image: frameData.split(",")[1],
-          include_attributes: true,
-        }
-      );
+    if (!message.faces || message.faces.length === 0) {
+      setStatus("ไม่พบใบหน้า");
+    } else {
+      setStatus("พร้อมใช้งาน");
+    }
 
-      if (
-        !detectResponse.data ||
-        !detectResponse.data.faces ||
-        detectResponse.data.faces.length === 0
-      ) {
-        setStatus("ไม่พบใบหน้า");
-        return;
-      }
+    // รวมผลลัพธ์ทั้งหมด
+    const result = {
+      ...message,
+      liveness: lastSecurityRef.current.liveness,
+      deepfake: lastSecurityRef.current.deepfake,
+      spoofing: lastSecurityRef.current.spoofing,
+    };
 
-      // ถ้ามีใบหน้า ทำการตรวจสอบความปลอดภัย
-      const securityResponse = await axios.post(
-        `${API_URL}/api/v1/security/check`,
-        {
-          image: frameData.split(",")[1],
-          checks: "liveness,deepfake,spoofing",
-        }
-      );
+    // คำนวณ FPS จากช่วงเวลาระหว่างผลที่ได้รับ 10 ช่วงล่าสุด
+    const resultTimes = [...resultTimesRef.current, performance.now()].slice(-11);
+    resultTimesRef.current = resultTimes;
+    if (resultTimes.length > 1) {
+      const elapsed = resultTimes[resultTimes.length - 1] - resultTimes[0];
+      setFps(Math.round(((resultTimes.length - 1) * 1000) / elapsed));
+    }
 
-      // รวมผลลัพธ์ทั้งหมด
-      const result = {
-        ...detectResponse.data,
-        ...securityResponse.data,
-      };
-
-      const endTime = performance.now();
-      const processingTime = endTime - startTime;
-
-      // เก็บเวลาในการประมวลผลและคำนวณ FPS ใหม่
-      setProcessingTimes((prev) => {
-        const newTimes = [...prev, processingTime].slice(-10);
-        const avgTime =
-          newTimes.reduce((sum, time) => sum + time, 0) / newTimes.length;
-        setFps(Math.round(1000 / avgTime));
-        return newTimes;
-      });
-
-      setAnalysisResults(result);
-      setStatus("พร้อมใช้งาน");
+    setAnalysisResults(result);
 
-      return result;
-    } catch (error) {
-      console.error("Error analyzing frame:", error);
-      setStatus("เกิดข้อผิดพลาด");
-      return null;
+    if (canvasRef.current) {
+      const ctx = canvasRef.current.getContext("2d");
+      drawResults(ctx, result);
     }
   };
 
-  // ล้างแคนวาสเมื่อเริ่มต้นหรือหยุดการวิเคราะห์
+  // เปิด WebSocket เมื่อเริ่มการวิเคราะห์ และปิดเมื่อหยุด
   useEffect(() => {
-    if (!isActive && canvasRef.current) {
-      const ctx = canvasRef.current.getContext("2d");
-      ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+    if (!isActive) {
+      if (canvasRef.current) {
+        const ctx = canvasRef.current.getContext("2d");
+        ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+      }
+      lastSecurityRef.current = {};
+      resultTimesRef.current = [];
+      setFps(0);
+      return;
     }
+
+    const socket = new WebSocket(`${WS_URL}/api/v1/stream`);
+    socket.onopen = () => {
+      socket.send(
+        JSON.stringify({
+          include_attributes: true,
+          checks: "liveness,deepfake,spoofing",
+        })
+      );
+      setStatus("กำลังวิเคราะห์...");
+    };
+    socket.onmessage = handleMessage;
+    socket.onerror = () => setStatus("เกิดข้อผิดพลาด");
+    socket.onclose = () => setStatus("หยุดการวิเคราะห์");
+    socketRef.current = socket;
+
+    return () => {
+      socket.close();
+      socketRef.current = null;
+    };
   }, [isActive]);
 
-  // ทำการประมวลผลแต่ละเฟรม
+  // ส่งเฟรมออกไปโดยไม่รอผล (ผลจะกลับมาทาง handleMessage)
   useEffect(() => {
     let requestId;
     let lastFrameTime = 0;
 
     const processFrame = async () => {
+      const socket = socketRef.current;
       if (
         !webcamRef.current ||
-        !canvasRef.current ||
-        !isActive ||
+        !socket ||
+        socket.readyState !== WebSocket.OPEN ||
         !processFrames
       ) {
         requestId = requestAnimationFrame(processFrame);
@@ -188,18 +193,14 @@ const RealtimeFaceAnalysis = () => {
       const now = performance.now();
       const frameDelta = now - lastFrameTime;
 
-      // จำกัดการประมวลผลไม่ให้เกิน 10 FPS (ทุก 100ms)
-      if (frameDelta >= 100) {
+      // จำกัดการส่งไม่ให้เกิน 10 FPS (ทุก 100ms) และไม่ส่งเพิ่มถ้าเฟรมก่อนหน้ายังค้างอยู่ในบัฟเฟอร์ของ socket
+      if (frameDelta >= 100 && socket.bufferedAmount === 0) {
         lastFrameTime = now;
         const imageData = webcamRef.current.getScreenshot();
 
         if (imageData) {
-          const results = await detectFaces(imageData);
-
-          if (results && canvasRef.current) {
-            const ctx = canvasRef.current.getContext("2d");
-            drawResults(ctx, results);
-          }
+          const frameBlob = await (await fetch(imageData)).blob();
+          socket.send(frameBlob);
         }
       }
 
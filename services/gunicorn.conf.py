@@ -0,0 +1,85 @@
+# การตั้งค่า gunicorn ที่ใช้ร่วมกันของ Flask services (face-detection, face-recognition, liveness, deepfake)
+#
+# โหลดโมเดลใน master process ครั้งเดียว (preload) แล้ว fork worker ออกไป น้ำหนักโมเดลที่อ่านอย่างเดียว
+# จึงถูกแชร์แบบ copy-on-write ระหว่าง worker ทุกตัว
+#
+# ตัวแปรสภาพแวดล้อม:
+#   PORT              พอร์ตของ service
+#   WEB_CONCURRENCY   จำนวน worker process
+#   GUNICORN_THREADS  จำนวน thread ต่อ worker
+#   GUNICORN_TIMEOUT  timeout ของแต่ละคำขอ (วินาที)
+#   PRELOAD_MODELS    1 = โหลดโมเดลก่อน fork, 0 = แต่ละ worker โหลดเอง,
+#                     auto = preload เฉพาะเมื่อไม่มี GPU (CUDA context ใช้ข้าม fork ไม่ได้)
+#                     เมื่อ preload จะตั้ง GUNICORN_PRELOAD=1 ให้ app โหลดโมเดลทันทีแทน lazy loading
+#   TORCH_NUM_THREADS จำนวน thread ของ PyTorch ต่อ worker (ค่าเริ่มต้น = จำนวน core / WEB_CONCURRENCY)
+#   PROMETHEUS_MULTIPROC_DIR  ไดเรกทอรีที่ worker ทุกตัวเขียน metrics ร่วมกัน (ล้างทุกครั้งที่ gunicorn เริ่ม)
+import os
+import shutil
+import sys
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+accesslog = "-"
+errorlog = "-"
+# request ID จาก API gateway และเวลาที่ใช้ (มิลลิวินาที) เพื่อเทียบเวลาของแต่ละ hop
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms request_id=%({x-request-id}i)s'
+
+
+def _prepare_metrics_dir():
+    # ต้องตั้งก่อนโหลด app เพราะ prometheus_client เลือกโหมด multiprocess ตอน import
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/facesocial-metrics")
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+_prepare_metrics_dir()
+
+
+def _gpu_visible():
+    if os.environ.get("CUDA_VISIBLE_DEVICES", None) == "":
+        return False
+    visible = os.environ.get("NVIDIA_VISIBLE_DEVICES", "")
+    return os.path.exists("/dev/nvidia0") or (visible not in ("", "void", "none"))
+
+
+_preload = os.environ.get("PRELOAD_MODELS", "auto").lower()
+preload_app = (not _gpu_visible()) if _preload == "auto" else _preload in ("1", "true", "yes")
+# app อ่านค่านี้ตอน import (ใน master เมื่อ preload) เพื่อโหลดโมเดลก่อน fork
+os.environ["GUNICORN_PRELOAD"] = "1" if preload_app else "0"
+
+
+def when_ready(server):
+    # face-detection และ face-recognition เก็บ state ในหน่วยความจำของ process (session ของสตรีม, แกลเลอรี)
+    # docker-compose.yml จึงตั้ง WEB_CONCURRENCY=1 ให้สองตัวนี้ ความขนานมาจาก thread ภายใน worker เดียว
+    if server.cfg.workers == 1:
+        server.log.info(f"1 worker x {server.cfg.threads} threads: per-process state is shared by all requests, "
+                        "parallelism comes from threads only")
+    else:
+        server.log.info(f"{server.cfg.workers} workers: in-memory state (gallery, stream sessions) is per worker")
+
+
+def post_fork(server, worker):
+    # ข้อมูลของ worker สำหรับ /health ของแต่ละ service
+    os.environ["GUNICORN_WORKER_ID"] = str(worker.age)
+    os.environ["GUNICORN_WORKER_STARTED_AT"] = str(time.time())
+    os.environ["GUNICORN_WORKERS"] = str(server.cfg.workers)
+    server.log.info(f"worker {worker.age} (pid {worker.pid}) started, preload={server.cfg.preload_app}")
+
+
+def child_exit(server, worker):
+    # ลบค่า gauge ของ worker ที่จบไปแล้วออกจากผลรวม
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # แบ่ง thread ของ PyTorch ตามจำนวน worker เพื่อไม่ให้แย่ง core กัน (หลังโหลด app แล้วทั้งแบบ preload และไม่ preload)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        default_threads = max(1, (os.cpu_count() or 1) // max(1, worker.cfg.workers))
+        torch.set_num_threads(int(os.environ.get("TORCH_NUM_THREADS", default_threads)))
@@ -1,9 +1,8 @@
 import json  # เพิ่มการ import json module มาตรฐาน
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
 import cv2
 import numpy as np
-import base64
 import os
 import torch
 import torch.nn as nn
@@ -11,9 +10,12 @@ import torch.nn.functional as F
 from torchvision import transforms
 import io
 from PIL import Image
+from common.metrics import init_metrics, json_response, observe_batch, stage_timer
+from common.serving import decode_image, request_data, worker_status
 
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "liveness")
 
 # Custom JSON Encoder
 class NumpyEncoder(json.JSONEncoder):
@@ -82,25 +84,28 @@ class AntiSpoofPredict:
     
     def predict(self, img):
         # เตรียมรูปภาพ
-        img = cv2.resize(img, (80, 80))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = img.astype(np.float32) / 255.0
-        img = np.transpose(img, (2, 0, 1))
-        img = torch.from_numpy(img).unsqueeze(0).to(self.device)
+        with stage_timer("anti_spoof", "preprocess"):
+            img = cv2.resize(img, (80, 80))
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            img = img.astype(np.float32) / 255.0
+            img = np.transpose(img, (2, 0, 1))
+            img = torch.from_numpy(img).unsqueeze(0).to(self.device)
         
         # คำนวณ score จากแต่ละโมเดล
         scores = []
         with torch.no_grad():
             for model_name, model in self.models.items():
                 try:
-                    # สำหรับ MiniFASNet
-                    if isinstance(model, MiniFASNet):
-                        score = model(img)
-                        score = torch.sigmoid(score).item()
-                    # สำหรับโมเดลสำรอง
-                    else:
-                        score = model(img)
-                        score = score.item()
+                    observe_batch(model_name, img.shape[0])
+                    with stage_timer(model_name, "inference"):
+                        # สำหรับ MiniFASNet
+                        if isinstance(model, MiniFASNet):
+                            score = model(img)
+                            score = torch.sigmoid(score).item()
+                        # สำหรับโมเดลสำรอง
+                        else:
+                            score = model(img)
+                            score = score.item()
                     scores.append(score)
                 except Exception as e:
                     print(f"เกิดข้อผิดพลาดในการทำนายด้วยโมเดล {model_name}: {str(e)}")
@@ -187,12 +192,6 @@ class SimpleFaceAntiSpoofing(nn.Module):
         x = self.sigmoid(x)
         return x
 
-def decode_base64_image(base64_str):
-    img_data = base64.b64decode(base64_str)
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return img
-
 # สร้างอินสแตนซ์ของ predictor
 try:
     predictor = AntiSpoofPredict(0)  # 0 คือ device_id สำหรับ GPU แรก
@@ -200,16 +199,29 @@ except Exception as e:
     print(f"เกิดข้อผิดพลาดในการสร้าง predictor: {str(e)}")
     predictor = None
 
+@app.route('/health', methods=['GET'])
+def health_check():
+    """ตรวจสอบสถานะของ service"""
+    status = {
+        "status": "online" if predictor is not None and predictor.models else "limited",
+        "version": "1.0.0",
+        "models": list(predictor.models) if predictor is not None else [],
+        "device": str(predictor.device) if predictor is not None else None,
+        "worker": worker_status()
+    }
+    
+    return jsonify(status)
+
 @app.route('/check', methods=['POST'])
 def check_liveness():
-    data = request.json
+    data = request_data()
     
     if predictor is None:
         return jsonify({'error': 'Liveness detection model not loaded'}), 500
     
     # แปลงรูปภาพจาก base64
     try:
-        img = decode_base64_image(data['image'])
+        img = decode_image(data['image'])
     except Exception as e:
         return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
     
@@ -228,7 +240,7 @@ def check_liveness():
             "threshold": float(threshold)
         }
         
-        return jsonify(result)
+        return json_response(result)
     except Exception as e:
         return jsonify({
             'error': f'Liveness detection failed: {str(e)}',
@@ -239,14 +251,14 @@ def check_liveness():
 
 @app.route('/check-spoofing', methods=['POST'])
 def check_spoofing():
-    data = request.json
+    data = request_data()
     
     if predictor is None:
         return jsonify({'error': 'Liveness detection model not loaded'}), 500
     
     # แปลงรูปภาพจาก base64
     try:
-        img = decode_base64_image(data['image'])
+        img = decode_image(data['image'])
     except Exception as e:
         return jsonify({'error': f'Failed to decode image: {str(e)}'}), 400
     
@@ -264,7 +276,7 @@ def check_spoofing():
             "threshold": float(threshold)
         }
         
-        return jsonify(result)
+        return json_response(result)
     except Exception as e:
         return jsonify({
             'error': f'Spoofing detection failed: {str(e)}',